@@ -0,0 +1,134 @@
+import argparse
+import time
+
+import numpy as np
+
+from kinematics import KinematicsEngine
+from main import Simulation
+from meshes import STAND_WIDTH, apron_mesh
+from occupancy import OccupancyLayer
+from pathfinding import CELL_SIZE, path_cache, search_stats
+from profiler import Profiler
+from spatial import SpatialGrid
+
+
+class Apron:
+    """
+    Headless simulation of many turnarounds at once, on identical stands placed side by side along one service road.
+    Every stand is a Simulation with its own scheduler, vehicles and belts, shifted by its offset along x. Vehicles
+    plan on the apron mesh holding all stands and the road between them, see meshes.apron_mesh, and all vehicles
+    share one traffic grid, so vehicles of all stands give way to each other on the road.
+    """
+    def __init__(self, stands=20, new_sim=True, seed=None, stagger=0.0, batched_kinematics=False,
+                 dynamic_obstacles=False, profile=False):
+        """
+        :param stands: number of stands
+        :param new_sim: simulate the new (autonomous) turnaround instead of the old one
+        :param seed: base seed, each stand gets its own seed derived from it
+        :param stagger: simulated seconds between the arrivals of consecutive stands
+        :param batched_kinematics: move the vehicles of all stands in one vectorised step, see KinematicsEngine
+        :param dynamic_obstacles: plan around the parked vehicles of the own stand, see Simulation
+        :param profile: time the sections of every step, shared by all stands, see Profiler
+        """
+        self.arrivals = [number * stagger for number in range(stands)]  # Apron time at which each stand starts
+        self.timer = 0.0
+        self.traffic = SpatialGrid(cell_size=400)
+        self.kinematics = KinematicsEngine() if batched_kinematics else None
+        self.profiler = Profiler(enabled=profile)
+        self.profiler.add_counter('path expansions', lambda: search_stats.expansions)
+
+        seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(stands)]
+        self.stands = [Simulation(headless=True, new_sim=new_sim, seed=stand_seed, dynamic_obstacles=dynamic_obstacles)
+                       for stand_seed in seeds]
+        for stand in self.stands:
+            stand.profiler = self.profiler
+            if stand.occupancy is not None:
+                stand.occupancy = OccupancyLayer(apron_mesh('Mesh_4', stands).shape)
+        self.place_stands()
+
+    def place_stands(self):
+        self.timer = 0.0
+        self.traffic.clear()
+        for number, stand in enumerate(self.stands):
+            stand.traffic = self.traffic
+            for vehicle in stand.vehicles:
+                vehicle.place_on_apron(apron_mesh(vehicle.mesh_name, len(self.stands)),
+                                       number * STAND_WIDTH * CELL_SIZE)
+        if self.kinematics is not None:
+            self.kinematics.attach([vehicle for stand in self.stands for vehicle in stand.vehicles])
+
+    @property
+    def finished(self):
+        return all(stand.scheduler.finished for stand in self.stands)
+
+    def step(self, time_step):
+        """
+        Advances all stands by the same amount of simulated time.
+        :param time_step: simulated seconds to advance
+        """
+        # Stands wait for their arrival, vehicles of finished stands keep driving back to the service road
+        stands = [stand for stand, arrival in zip(self.stands, self.arrivals) if self.timer >= arrival]
+        self.timer += time_step
+        for stand in stands:
+            stand.update_schedule(time_step)
+        if self.kinematics is not None:
+            with self.profiler.section('KinematicsEngine.step'):
+                self.kinematics.step(stands, time_step)
+        else:
+            for stand in stands:
+                stand.update_vehicles(time_step)
+        for stand in stands:
+            stand.update_surroundings(time_step)
+
+    def run(self, time_step=0.5, time_limit=6 * 3600):
+        """
+        Runs until every turnaround finished.
+        :param time_step: simulated seconds per step
+        :param time_limit: simulated seconds after which the run is aborted
+        :return: list of simulated turnaround times per stand, from parking to pushback completion
+        """
+        while not self.finished:
+            if self.timer > time_limit:
+                raise RuntimeError(f'Apron did not finish within {time_limit} simulated seconds')
+            self.profiler.begin_frame()
+            self.step(time_step)
+            self.profiler.end_frame()
+        return [stand.scheduler.ops['Pushback'].completion_time - stand.scheduler.ops['Parking'].start_time
+                for stand in self.stands]
+
+    def reset(self):
+        for stand in self.stands:
+            stand.reset()
+        self.place_stands()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless ApronSim turnarounds on many stands at once')
+    parser.add_argument('--stands', type=int, default=20, help='number of stands')
+    parser.add_argument('--type', default='new', choices=['old', 'new'], help='turnaround type')
+    parser.add_argument('--seed', type=int, default=None, help='base seed, for reproducible runs')
+    parser.add_argument('--time-step', type=float, default=0.5, help='simulated seconds per step')
+    parser.add_argument('--stagger', type=float, default=0.0, help='simulated seconds between stand arrivals')
+    parser.add_argument('--batched-kinematics', action='store_true',
+                        help='move the vehicles of all stands in one vectorised step')
+    parser.add_argument('--dynamic-obstacles', action='store_true',
+                        help='plan around parked vehicles and repair paths when they get blocked')
+    parser.add_argument('--profile', action='store_true', help='time the sections of every step')
+    args = parser.parse_args()
+
+    apron = Apron(args.stands, args.type == 'new', args.seed, stagger=args.stagger,
+                  batched_kinematics=args.batched_kinematics, dynamic_obstacles=args.dynamic_obstacles,
+                  profile=args.profile)
+    start = time.perf_counter()
+    turnaround_times = np.array(apron.run(args.time_step)) / 60
+    path_cache.save()
+    print(f'{args.stands} stands finished after {apron.timer / 60:.2f} min, in {time.perf_counter() - start:.1f}s '
+          f'(path cache: {path_cache.hits} hits, {path_cache.misses} misses)')
+    print(f'  Turnaround time {turnaround_times.mean():.2f} +- {turnaround_times.std():.2f} min '
+          f'(min {turnaround_times.min():.2f}, max {turnaround_times.max():.2f})')
+    if apron.profiler.enabled:
+        print('\n'.join(apron.profiler.overlay_lines()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import contextlib
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import Scheduler, Simulation
+from pathfinding import path_cache
+
+# Headless simulations and schedulers kept alive per worker process, reused (reset) between runs
+_simulations = {}
+_schedulers = {}
+
+
+def parse_distribution(text: str):
+    """
+    Parses a distribution given on the command line.
+    :param text: either a constant ('5') or a numpy Generator method with its parameters ('normal:5,2', 'uniform:0,10')
+    :return: (method, parameters), e.g. ('normal', (5.0, 2.0))
+    """
+    if ':' not in text:
+        return 'fixed', (float(text),)
+    method, params = text.split(':', 1)
+    if not hasattr(np.random.Generator, method):
+        raise ValueError(f'Unknown distribution "{method}", must be a numpy.random.Generator method')
+    return method, tuple(float(param) for param in params.split(','))
+
+
+def sample(distribution, rng: np.random.Generator):
+    """
+    :return: value drawn from a parse_distribution result, clipped to 0 as delays and durations cannot be negative
+    """
+    method, params = distribution
+    if method == 'fixed':
+        return max(0.0, params[0])
+    return max(0.0, float(getattr(rng, method)(*params)))
+
+
+def run_turnaround(new_sim: bool, seed: int, delays: dict = None, durations: dict = None, time_step=0.5,
+                   schedule_only=False):
+    """
+    Runs a single headless turnaround with sampled operation delays and durations.
+    :param new_sim: simulate the new (autonomous) turnaround instead of the old one
+    :param seed: seed for both the sampled inputs and the simulation itself
+    :param delays: {operation name: distribution}, sampled in minutes
+    :param durations: {operation name: distribution}, sampled in minutes, replacing the duration from the data sheet
+    :param time_step: simulated seconds per step
+    :param schedule_only: skip the vehicles and compute the operations in one pass over the dependency graph
+    :return: {operation name: completion time in simulated seconds}
+    """
+    if schedule_only:
+        return run_schedule(new_sim, seed, delays, durations)
+
+    simulation = _simulations.get(new_sim)
+    if simulation is None:
+        simulation = Simulation(headless=True, new_sim=new_sim, seed=seed)
+        _simulations[new_sim] = simulation
+    else:
+        simulation.seed = seed
+        with contextlib.redirect_stdout(None):  # Scheduler.reset announces every reset
+            simulation.reset()
+
+    # Inputs get their own stream, so changing a distribution does not shift the simulation's random draws
+    rng = np.random.default_rng([seed, 1])
+    ops = simulation.scheduler.ops
+    for name, distribution in (delays or {}).items():
+        if name in ops:
+            ops[name].delay = sample(distribution, rng)
+    for name, distribution in (durations or {}).items():
+        if name in ops:
+            ops[name].duration = sample(distribution, rng) * 60
+            ops[name].reset(simulation.scheduler.dependency_count(ops[name].index))
+    simulation.timer = -ops['Parking'].duration
+
+    simulation.run_headless(time_step)
+    return {name: operation.completion_time for name, operation in ops.items()}
+
+
+def run_schedule(new_sim: bool, seed: int, delays: dict = None, durations: dict = None):
+    """
+    Computes a turnaround's operation completion times without vehicles, see run_turnaround.
+    Vehicles never hold up operations, so this matches a full run up to the time step.
+    """
+    sim_type = 'New' if new_sim else 'Old'
+    scheduler = _schedulers.get(new_sim)
+    if scheduler is None:
+        scheduler = Scheduler(sim_type)
+        _schedulers[new_sim] = scheduler
+
+    rng = np.random.default_rng([seed, 1])
+    ops = scheduler.ops
+    for name, distribution in (delays or {}).items():
+        if name in ops:
+            ops[name].delay = sample(distribution, rng)
+    for name, distribution in (durations or {}).items():
+        if name in ops:
+            ops[name].duration = sample(distribution, rng) * 60
+
+    timeline = scheduler.timeline(-ops['Parking'].duration)
+    return {name: completion_time for name, (_, completion_time) in timeline.items()}
+
+
+def _run_task(task):
+    return run_turnaround(*task)
+
+
+def run_batch(sim_type: str, runs: int, delays: dict = None, durations: dict = None, seed=None, workers=None,
+              time_step=0.5, schedule_only=False):
+    """
+    Runs many headless turnarounds across a process pool.
+    :param sim_type: 'old' or 'new'
+    :param runs: number of turnarounds
+    :param delays: {operation name: distribution}, see run_turnaround
+    :param durations: {operation name: distribution}, see run_turnaround
+    :param seed: base seed, each run gets its own seed derived from it
+    :param workers: number of processes, defaults to the number of CPUs
+    :param time_step: simulated seconds per step
+    :param schedule_only: skip the vehicles, see run_turnaround
+    :return: list of (run seed, {operation name: completion time in simulated seconds})
+    """
+    if sim_type.lower() not in ['old', 'new']:
+        raise ValueError('Type must be either "old" or "new"')
+    if runs < 1:
+        raise ValueError(f'runs must be at least 1, got {runs}')
+    new_sim = sim_type.lower() == 'new'
+
+    workers = workers or os.cpu_count()
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(runs)]
+    tasks = [(new_sim, run_seed, delays, durations, time_step, schedule_only) for run_seed in seeds]
+    # The first run fills the path cache here, the workers then start from its saved paths
+    results = [_run_task(tasks[0])]
+    path_cache.save()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results.extend(executor.map(_run_task, tasks[1:], chunksize=max(1, runs // (4 * workers))))
+    return list(zip(seeds, results))
+
+
+def parse_assignments(assignments):
+    distributions = {}
+    for assignment in assignments or []:
+        name, distribution = assignment.split('=', 1)
+        distributions[name] = parse_distribution(distribution)
+    return distributions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo batch runs of headless ApronSim turnarounds')
+    parser.add_argument('--type', nargs='+', default=['old', 'new'], choices=['old', 'new'],
+                        help='turnaround type(s) to simulate')
+    parser.add_argument('--runs', type=int, default=100, help='turnarounds per type')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--seed', type=int, default=None, help='base seed, for reproducible batches')
+    parser.add_argument('--time-step', type=float, default=0.5, help='simulated seconds per step')
+    parser.add_argument('--schedule-only', action='store_true',
+                        help='skip the vehicles and compute the operation timeline directly')
+    parser.add_argument('--delay', action='append', metavar='OPERATION=DIST',
+                        help='delay distribution in minutes, e.g. Refuel=normal:5,2 (repeatable)')
+    parser.add_argument('--duration', action='append', metavar='OPERATION=DIST',
+                        help='duration distribution in minutes, e.g. Boarding=triangular:18,22,30 (repeatable)')
+    parser.add_argument('--output', default='batch_results.csv', help='CSV file for the per-run completion times')
+    args = parser.parse_args()
+
+    delays = parse_assignments(args.delay)
+    durations = parse_assignments(args.duration)
+    names = set()
+    for sim_type in args.type:
+        names.update(Scheduler(sim_type).ops)
+    unknown = (set(delays) | set(durations)) - names
+    if unknown:
+        raise ValueError(f'Unknown operation(s): {", ".join(sorted(unknown))}')
+
+    rows = []
+    columns = []
+    for sim_type in args.type:
+        start = time.perf_counter()
+        results = run_batch(sim_type, args.runs, delays, durations, args.seed, args.workers, args.time_step,
+                            args.schedule_only)
+        print(f'{sim_type}: {args.runs} runs in {time.perf_counter() - start:.1f}s')
+
+        finish_times = np.array([result['Pushback'] for _, result in results]) / 60
+        print(f'  Pushback completed at {finish_times.mean():.2f} +- {finish_times.std():.2f} min '
+              f'(p5 {np.percentile(finish_times, 5):.2f}, p50 {np.percentile(finish_times, 50):.2f}, '
+              f'p95 {np.percentile(finish_times, 95):.2f})')
+
+        for run, (run_seed, result) in enumerate(results):
+            rows.append({'type': sim_type, 'run': run, 'seed': run_seed, **result})
+        columns.extend(name for name in results[0][1] if name not in columns)
+
+    with open(args.output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['type', 'run', 'seed'] + columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'Completion times written to {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import heapq
+import itertools
+import math
+import time
+
+from main import Simulation
+from pathfinding import SERVICE_ROAD_ENDS, ReservationTable, astar, distance_field, space_time_astar, to_grid
+
+PIXELS_PER_STEP = 10
+PIXELS_PER_METER = 25
+
+
+class Leg:
+    """
+    One path of a vehicle, from where it is parked to its next goal.
+    """
+    def __init__(self, agent, number, start, goal, step):
+        self.agent = agent  # Index of the vehicle in Simulation.vehicles
+        self.number = number  # Goal number of the vehicle, goals_completed while driving the leg
+        self.start = start  # (y, x)
+        self.goal = goal  # (y, x)
+        self.step = step  # Seconds per mesh cell at the vehicle's top speed
+        self.ready_time = None  # Earliest departure, once the operations and the previous leg allow it
+        self.departure = None
+        self.arrival = None
+        self.path = None  # Timed path, [(y, x), ...] one cell per step from the ready time
+        self.shortest = None  # Mesh steps of the shortest path, ignoring the other vehicles
+        self.conflicts = 0  # Path cells reserved by other vehicles, only when no conflict free path was found
+
+    @property
+    def waiting(self):
+        """
+        :return: seconds the leg takes longer than driving the shortest path right when the vehicle is ready
+        """
+        return max(0.0, self.arrival - self.ready_time - self.shortest * self.step)
+
+
+class CooperativePlanner:
+    """
+    Prioritized planning of the paths of all vehicles of a turnaround, before it runs. Legs are planned one at a time
+    in order of their earliest departure, with space_time_astar around the timed paths planned before, so vehicles
+    wait or detour where they would otherwise meet. As in the simulation, vehicles only leave once their operations
+    allow it, taken from Scheduler.timeline.
+    Legs are planned on the mesh grid at the vehicle's top speed, without the smoothing and straightening of the
+    paths in the simulation.
+    """
+    def __init__(self, simulation, radius=5, walker_radius=2, max_wait=120.0):
+        """
+        :param simulation: Simulation whose vehicles are planned, it is not run
+        :param radius: clearance kept around the vehicles, in mesh cells
+        :param walker_radius: clearance kept around walking vehicles, in mesh cells
+        :param max_wait: most seconds a leg may wait on top of its shortest path, before it is planned without
+                         the other vehicles
+        """
+        self.simulation = simulation
+        self.radius = radius
+        self.walker_radius = walker_radius
+        self.max_wait = max_wait
+        self.timeline = simulation.scheduler.timeline(simulation.timer)
+        self.reservations = ReservationTable()
+        self.distances = {}  # {(mesh name, goal): distance_field towards the goal}
+        self.legs = {agent: [] for agent in range(len(simulation.vehicles))}
+
+    @staticmethod
+    def grid(location):
+        return to_grid(SERVICE_ROAD_ENDS.get(tuple(location), location))
+
+    def ready_time(self, vehicle, number):
+        """
+        :return: earliest time at which the operations let the vehicle leave for goal number
+        """
+        times = [-math.inf]
+        start_op, end_op = vehicle.start_ops[number], vehicle.end_ops[number]
+        if start_op is not None:
+            times.append(self.timeline[start_op.name][0])
+        if end_op is not None:
+            times.append(self.timeline[end_op.name][1])
+        return max(times)
+
+    def distance_field(self, vehicle, goal):
+        key = (vehicle.mesh_name, goal)
+        distances = self.distances.get(key)
+        if distances is None:
+            distances = distance_field(vehicle.mesh, [goal])
+            self.distances[key] = distances
+        return distances
+
+    def plan(self):
+        """
+        :return: {vehicle index: [Leg, ...]} with the timed paths of all vehicles
+        """
+        vehicles = self.simulation.vehicles
+        order = itertools.count()
+        queue = []
+        for agent, vehicle in enumerate(vehicles):
+            step = PIXELS_PER_STEP / (vehicle.max_speed * PIXELS_PER_METER)
+            if tuple(vehicle.location) not in SERVICE_ROAD_ENDS:  # Parked on the stand from the start
+                self.reservations.reserve_path([self.grid(vehicle.location)], -math.inf, step, agent,
+                                               self.radius_of(vehicle))
+            leg = Leg(agent, 0, self.grid(vehicle.location), self.grid(vehicle.goal_locs[0]), step)
+            leg.ready_time = self.ready_time(vehicle, 0)
+            heapq.heappush(queue, (leg.ready_time, next(order), leg))
+
+        stalled = 0  # Legs put back in a row, see plan_leg
+        while queue:
+            priority, _, leg = heapq.heappop(queue)
+            vehicle = vehicles[leg.agent]
+            if not self.plan_leg(leg, vehicle, fallback=stalled >= len(queue)):
+                # Blocked by vehicles whose next legs are not planned yet, try again after the next leg in line
+                stalled += 1
+                heapq.heappush(queue, (max(priority, queue[0][0]), next(order), leg))
+                continue
+            stalled = 0
+            self.legs[leg.agent].append(leg)
+            number = leg.number + 1
+            if number < len(vehicle.goal_locs):
+                next_leg = Leg(leg.agent, number, leg.goal, self.grid(vehicle.goal_locs[number]), leg.step)
+                next_leg.ready_time = max(self.ready_time(vehicle, number),
+                                          leg.arrival + vehicle.waiting_times[leg.number])
+                heapq.heappush(queue, (next_leg.ready_time, next(order), next_leg))
+        return self.legs
+
+    def radius_of(self, vehicle):
+        return self.walker_radius if vehicle.walking else self.radius
+
+    def plan_leg(self, leg, vehicle, fallback=True):
+        """
+        Plans a leg around the reserved paths and reserves it.
+        :param fallback: plan the shortest path regardless of the other vehicles if there is no conflict free one
+        :return: False if the leg was not planned, because there is no conflict free path and fallback is False
+        """
+        distances = self.distance_field(vehicle, leg.goal)
+        leg.shortest = max(0, int(distances[leg.start]))
+        last = leg.number == len(vehicle.goal_locs) - 1
+        leaves = last and tuple(vehicle.goal_locs[-1]) in SERVICE_ROAD_ENDS  # Drives off the stand after the last leg
+        leg.path = space_time_astar(vehicle.mesh, leg.start, leg.goal, leg.ready_time, leg.step, self.reservations,
+                                    leg.agent, distances, hold=0 if leaves else vehicle.waiting_times[leg.number],
+                                    max_wait=self.max_wait)
+        if leg.path is None:  # No conflict free path within max_wait, take the shortest one anyway
+            if not fallback:
+                return False
+            leg.path = astar(vehicle.mesh, leg.start, leg.goal)
+            leg.conflicts = self.reservations.conflicts(leg.path, leg.ready_time, leg.step, leg.agent)
+
+        waits = next((k for k, cell in enumerate(leg.path) if cell != leg.start), len(leg.path) - 1)
+        leg.departure = leg.ready_time + waits * leg.step
+        leg.arrival = leg.ready_time + (len(leg.path) - 1) * leg.step
+        self.reservations.release(leg.agent, leg.departure)
+        self.reservations.reserve_path(leg.path, leg.ready_time, leg.step, leg.agent, self.radius_of(vehicle),
+                                       hold=leg.arrival if leaves else math.inf)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Conflict free paths for all vehicles of a turnaround, planned '
+                                                 'up front, against the waiting of the reactive simulation')
+    parser.add_argument('--new', action='store_true', help='simulate the new (autonomous) turnaround')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the turnaround')
+    parser.add_argument('--radius', type=int, default=5, help='clearance around the vehicles in mesh cells')
+    parser.add_argument('--time-step', type=float, default=0.1, help='simulated seconds per reactive step')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    planner = CooperativePlanner(Simulation(headless=True, new_sim=args.new, seed=args.seed), radius=args.radius)
+    legs = planner.plan()
+    planning_time = time.perf_counter() - start
+
+    reactive = Simulation(headless=True, new_sim=args.new, seed=args.seed)
+    reactive.run_headless(args.time_step)
+
+    conflicted = [leg for agent_legs in legs.values() for leg in agent_legs if leg.conflicts > 0]
+    print(f'{sum(map(len, legs.values()))} legs planned in {planning_time:.2f}s, '
+          f'{len(conflicted)} without a conflict free path')
+    # Different quantities, not a saving: the reactive column is the time the simulated vehicles stood still, the
+    # planned column how much later the conflict free legs arrive than driving their shortest path at top speed
+    # from their ready time
+    print(f'{"Vehicle":<22}{"Legs":>6}{"Conflicts":>11}{"Reactive stopped [s]":>22}{"Planned waiting [s]":>21}')
+    total_reactive = total_planned = 0
+    for agent, vehicle in enumerate(reactive.vehicles):
+        planned = sum(leg.waiting for leg in legs[agent] if leg.conflicts == 0)
+        total_reactive += vehicle.stopped_time
+        total_planned += planned
+        print(f'{vehicle.name:<22}{len(legs[agent]):>6}{sum(leg.conflicts > 0 for leg in legs[agent]):>11}'
+              f'{vehicle.stopped_time:>22.1f}{planned:>21.1f}')
+    print(f'{"Total":<22}{sum(map(len, legs.values())):>6}{len(conflicted):>11}{total_reactive:>22.1f}'
+          f'{total_planned:>21.1f}')
+    if conflicted:
+        print('\nLegs without a conflict free path, left out of the planned waiting:')
+        for leg in conflicted:
+            print(f'  {reactive.vehicles[leg.agent].name} goal {leg.number}: {leg.conflicts} reserved cells, '
+                  f'{leg.waiting:.1f}s waiting')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import heapq
+import itertools
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from main import Simulation
+from pathfinding import SERVICE_ROAD_ENTRANCE, SERVICE_ROAD_EXIT
+from travel import SERVICE_ROAD_GRID, load_table
+
+SERVICE_ROAD_STEPS = 35  # Mesh steps between SERVICE_ROAD_GRID and the service road itself
+STAND_PITCH_STEPS = 192  # Mesh steps along the service road between neighbouring stands, one mesh width
+PIXELS_PER_STEP = 10
+PIXELS_PER_METER = 25
+
+
+class TravelTimes:
+    """
+    Travel time estimates between service points, looked up in the precomputed travel tables of the meshes.
+    Stands are identical and placed side by side, vehicles move between them along the service road.
+    """
+    def steps(self, mesh_name, start, goal):
+        """
+        :param mesh_name: mesh the vehicle drives on
+        :param start: (stand, (x, y)), (x, y) = SERVICE_ROAD_ENTRANCE for the service road of that stand
+        :param goal: (stand, (x, y))
+        :return: mesh steps from start to goal
+        """
+        (start_stand, start_loc), (goal_stand, goal_loc) = start, goal
+        if start_stand == goal_stand and start_loc != SERVICE_ROAD_ENTRANCE and goal_loc != SERVICE_ROAD_ENTRANCE:
+            return self.mesh_steps(mesh_name, start_loc, goal_loc)
+        steps = abs(goal_stand - start_stand) * STAND_PITCH_STEPS
+        for location in [start_loc, goal_loc]:
+            if location != SERVICE_ROAD_ENTRANCE:
+                steps += self.mesh_steps(mesh_name, location, SERVICE_ROAD_GRID) + SERVICE_ROAD_STEPS
+        return steps
+
+    @staticmethod
+    def mesh_steps(mesh_name, start_loc, goal_loc):
+        steps = load_table(mesh_name).steps(start_loc, goal_loc)
+        if steps < 0:
+            raise ValueError(f'No path on {mesh_name} from {start_loc} to {goal_loc}')
+        return steps
+
+    def seconds(self, mesh_name, start, goal, speed):
+        """
+        :param speed: vehicle speed in m/s
+        :return: travel time in seconds, see steps
+        """
+        return self.steps(mesh_name, start, goal) * PIXELS_PER_STEP / PIXELS_PER_METER / speed
+
+
+class Job:
+    """
+    One vehicle visit to a stand, taken from the statically bound vehicles of Simulation.create_vehicles.
+    The vehicle has to be at the stand before its first operation can start, and is free again once its last
+    operation completed.
+    """
+    def __init__(self, stand, vehicle):
+        self.stand = stand
+        self.vehicle_type = vehicle.name
+        self.mesh_name = vehicle.mesh_name
+        self.speed = vehicle.max_speed
+        self.operation = vehicle.start_ops[0]
+        self.release = [op for op in vehicle.end_ops if op is not None][-1]
+        self.location = vehicle.goal_locs[0]
+        # Where the vehicle is when released, before it would head back to the service road
+        leaves = tuple(vehicle.goal_locs[-1]) == SERVICE_ROAD_EXIT
+        self.end_location = vehicle.goal_locs[-2] if leaves else vehicle.goal_locs[-1]
+        self.ready_time = None
+        self.dispatch_time = None
+        self.arrival_time = None
+        self.vehicle = None
+
+    def __repr__(self):
+        return f'{self.vehicle_type} for {self.operation.name} at stand {self.stand}'
+
+
+class FleetVehicle:
+    def __init__(self, vehicle_type, number):
+        self.vehicle_type = vehicle_type
+        self.number = number
+        self.position = (0, SERVICE_ROAD_ENTRANCE)  # (stand, (x, y)), all vehicles start at the first stand's entry
+        self.free_time = 0.0
+        self.busy_time = 0.0
+        self.jobs = 0
+
+
+class Dispatcher:
+    """
+    Discrete event simulation of several turnarounds served by a shared, finite fleet of vehicles.
+    Operations run as in the Scheduler, except that an operation needing a vehicle only starts once one has been
+    dispatched and arrived. Ready jobs wait in a priority queue per vehicle type, ordered by the time they became
+    ready and then by the travel time from the service road. A free vehicle takes the first job in its queue, a new
+    job takes the nearest free vehicle.
+    """
+    def __init__(self, stands=4, new_sim=True, pool=None, stagger=600.0, seed=None):
+        """
+        :param stands: number of turnarounds
+        :param new_sim: simulate the new (autonomous) turnaround instead of the old one
+        :param pool: {vehicle type: count}, types not given get as many vehicles as a single turnaround uses
+        :param stagger: simulated seconds between the arrivals of consecutive aircraft
+        :param seed: seed for the turnarounds, see Simulation
+        """
+        self.arrivals = [number * stagger for number in range(stands)]
+        self.turnarounds = [Simulation(headless=True, new_sim=new_sim, seed=seed) for _ in range(stands)]
+        self.jobs = {}  # {(stand, operation name): [Job, ...]}
+        self.releasing_jobs = {}  # {(stand, operation name): [Job, ...]} for the jobs that operation ends
+        for stand, simulation in enumerate(self.turnarounds):
+            for vehicle in simulation.vehicles:
+                # Carts and walkers stay at the stand, only vehicles coming from the service road belong to the fleet
+                if tuple(vehicle.location) == SERVICE_ROAD_ENTRANCE:
+                    job = Job(stand, vehicle)
+                    self.jobs.setdefault((stand, job.operation.name), []).append(job)
+                    self.releasing_jobs.setdefault((stand, job.release.name), []).append(job)
+
+        counts = Counter(job.vehicle_type for (stand, _), jobs in self.jobs.items() if stand == 0 for job in jobs)
+        unknown = set(pool or {}) - set(counts)
+        if unknown:
+            raise ValueError(f'Unknown vehicle type(s): {", ".join(sorted(unknown))}')
+        counts.update({vehicle_type: count - counts[vehicle_type] for vehicle_type, count in (pool or {}).items()})
+        if min(counts.values()) < 1:
+            raise ValueError('Every vehicle type needs at least one vehicle')
+        self.fleet = {vehicle_type: [FleetVehicle(vehicle_type, number) for number in range(count)]
+                      for vehicle_type, count in counts.items()}
+
+        self.travel = TravelTimes()
+        self.timelines = [{} for _ in self.turnarounds]  # Per stand {operation name: (start, completion)}
+        self.pending = [{} for _ in self.turnarounds]  # Per stand {operation name: dependencies not completed}
+        self.events = []
+        self.waiting = defaultdict(list)  # {vehicle type: heap of (ready time, travel time, order, Job)}
+        self.order = itertools.count()
+        self.time = 0.0
+
+    def run(self):
+        """
+        :return: list of turnaround times per stand, from arrival to the completion of the last operation
+        """
+        for stand, simulation in enumerate(self.turnarounds):
+            scheduler = simulation.scheduler
+            for operation in scheduler.op_list:
+                self.pending[stand][operation.name] = scheduler.dependency_count(operation.index)
+                if not scheduler.dependency_count(operation.index):
+                    self.push(self.arrivals[stand], 'ready', (stand, operation))
+
+        while self.events:
+            self.time, _, kind, payload = heapq.heappop(self.events)
+            if kind == 'ready':
+                self.operation_ready(*payload)
+            elif kind == 'arrived':
+                self.job_arrived(payload)
+            elif kind == 'completed':
+                self.operation_completed(*payload)
+
+        return [max(completion for _, completion in timeline.values()) - arrival
+                for timeline, arrival in zip(self.timelines, self.arrivals)]
+
+    def push(self, time, kind, payload):
+        heapq.heappush(self.events, (time, next(self.order), kind, payload))
+
+    def operation_ready(self, stand, operation):
+        jobs = self.jobs.get((stand, operation.name))
+        if not jobs:
+            self.start_operation(stand, operation)
+            return
+        for job in jobs:
+            job.ready_time = self.time
+            travel = self.travel.seconds(job.mesh_name, (stand, SERVICE_ROAD_ENTRANCE), (stand, job.location),
+                                         job.speed)
+            heapq.heappush(self.waiting[job.vehicle_type], (self.time, travel, next(self.order), job))
+            self.dispatch(job.vehicle_type)
+
+    def dispatch(self, vehicle_type):
+        """
+        Assigns the first waiting jobs of a vehicle type to the nearest free vehicles of that type.
+        """
+        queue = self.waiting[vehicle_type]
+        while queue:
+            free = [vehicle for vehicle in self.fleet[vehicle_type] if vehicle.free_time <= self.time]
+            if not free:
+                return
+            job = heapq.heappop(queue)[3]
+            goal = (job.stand, job.location)
+            travel, vehicle = min(((self.travel.seconds(job.mesh_name, vehicle.position, goal, job.speed), vehicle)
+                                   for vehicle in free), key=lambda option: option[0])
+            vehicle.free_time = float('inf')  # Until the job releases it
+            vehicle.jobs += 1
+            job.vehicle = vehicle
+            job.dispatch_time = self.time
+            self.push(self.time + travel, 'arrived', job)
+
+    def job_arrived(self, job):
+        job.arrival_time = self.time
+        jobs = self.jobs[(job.stand, job.operation.name)]
+        if all(other.arrival_time is not None for other in jobs):
+            self.start_operation(job.stand, job.operation)
+
+    def start_operation(self, stand, operation):
+        completion = self.time + max(0, operation.duration + operation.delay * 60)
+        self.timelines[stand][operation.name] = (self.time, completion)
+        self.push(completion, 'completed', (stand, operation))
+
+    def operation_completed(self, stand, operation):
+        for job in self.releasing_jobs.get((stand, operation.name), []):
+            vehicle = job.vehicle
+            vehicle.position = (stand, job.end_location)
+            vehicle.free_time = self.time
+            vehicle.busy_time += self.time - job.dispatch_time
+            self.dispatch(vehicle.vehicle_type)
+
+        pending = self.pending[stand]
+        for dependent in self.turnarounds[stand].scheduler.dependents(operation.index):
+            pending[dependent.name] -= 1
+            if pending[dependent.name] == 0:
+                self.push(self.time, 'ready', (stand, dependent))
+
+    def utilisation(self):
+        """
+        :return: {vehicle type: fraction of the time until the last turnaround finished that its vehicles were busy}
+        """
+        makespan = max(completion for timeline in self.timelines for _, completion in timeline.values())
+        return {vehicle_type: sum(vehicle.busy_time for vehicle in vehicles) / (len(vehicles) * makespan)
+                for vehicle_type, vehicles in self.fleet.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Turnarounds on several stands served by a shared vehicle fleet')
+    parser.add_argument('--stands', type=int, default=4, help='number of turnarounds')
+    parser.add_argument('--type', default='new', choices=['old', 'new'], help='turnaround type')
+    parser.add_argument('--stagger', type=float, default=600.0, help='simulated seconds between aircraft arrivals')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the turnarounds')
+    parser.add_argument('--pool', action='append', metavar='TYPE=COUNT',
+                        help='vehicles of a type in the fleet, e.g. Catering_auto=3 (repeatable), '
+                             'types not given get as many as a single turnaround uses')
+    args = parser.parse_args()
+
+    pool = {}
+    for assignment in args.pool or []:
+        vehicle_type, count = assignment.split('=', 1)
+        pool[vehicle_type] = int(count)
+    dispatcher = Dispatcher(args.stands, args.type == 'new', pool, args.stagger, args.seed)
+
+    turnaround_times = np.array(dispatcher.run()) / 60
+    print(f'{args.stands} turnarounds, {turnaround_times.mean():.2f} +- {turnaround_times.std():.2f} min '
+          f'(max {turnaround_times.max():.2f})')
+    for vehicle_type, utilisation in sorted(dispatcher.utilisation().items()):
+        jobs = sum(vehicle.jobs for vehicle in dispatcher.fleet[vehicle_type])
+        print(f'  {vehicle_type:<22}{len(dispatcher.fleet[vehicle_type]):>3} vehicles{jobs:>5} jobs'
+              f'{utilisation * 100:>7.1f}% busy')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import heapq
+import os
+import pickle
+import time
+
+import numpy as np
+
+from meshes import load_mesh, upsample_mesh
+from pathfinding import CELL_SIZE, astar_flat, distance_field, heuristic, search_stats, to_grid
+
+CACHE_DIR = 'cache/hierarchical'
+CLUSTER_SIZE = 16  # Mesh cells along each side of a cluster
+WIDE_ENTRANCE = 6  # Entrances at least this many cells wide get a transition at both ends instead of the middle
+
+# Abstract graphs per mesh and cluster size, the mesh is kept to make sure its id is not reused
+_graphs = {}
+
+
+def abstract_graph(mesh: np.ndarray, cluster_size=CLUSTER_SIZE):
+    """
+    :param mesh: np.array where 1s are free
+    :param cluster_size: mesh cells along each side of a cluster
+    :return: the AbstractGraph of the mesh, loaded from the cache when it was built for the same mesh before
+    """
+    key = (id(mesh), cluster_size)
+    entry = _graphs.get(key)
+    if entry is None or entry[0] is not mesh:
+        graph = AbstractGraph(mesh, cluster_size)
+        graph.load()
+        entry = (mesh, graph)
+        if len(_graphs) > 64:
+            _graphs.clear()
+        _graphs[key] = entry
+    return entry[1]
+
+
+class AbstractGraph:
+    """
+    HPA* abstraction of a mesh. The mesh is split into square clusters, free cells on both sides of a cluster border
+    become transition nodes, and the nodes of a cluster are connected by their shortest path lengths inside it.
+    Searches run on this graph, and only the steps between consecutive nodes are refined into mesh cells, inside
+    a single cluster each. Paths are at most a few steps longer than the shortest ones, in exchange the search
+    cost grows with the number of clusters instead of the number of cells.
+    """
+    version = 1
+
+    def __init__(self, mesh: np.ndarray, cluster_size=CLUSTER_SIZE):
+        self.mesh = mesh
+        self.cluster_size = cluster_size
+        self.nodes = {}  # {(cluster row, cluster column): [(y, x) transition node, ...]}
+        self.edges = {}  # {(y, x): {(y, x) neighbour: steps}}
+
+    @property
+    def file(self):
+        digest = hashlib.sha1(repr(self.mesh.shape).encode() + np.ascontiguousarray(self.mesh).tobytes())
+        return os.path.join(CACHE_DIR, f'{digest.hexdigest()[:16]}_{self.cluster_size}.pkl')
+
+    def cluster(self, cell):
+        return cell[0] // self.cluster_size, cell[1] // self.cluster_size
+
+    def window(self, cluster):
+        """
+        :return: (y0, x0, y1, x1), mesh cells of the cluster are y0 <= y < y1 and x0 <= x < x1
+        """
+        height, width = self.mesh.shape
+        y0, x0 = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+        return y0, x0, min(y0 + self.cluster_size, height), min(x0 + self.cluster_size, width)
+
+    def load(self):
+        try:
+            with open(self.file, 'rb') as file:
+                version, nodes, edges = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            version = None
+        if version == self.version:
+            self.nodes, self.edges = nodes, edges
+            return
+        self.build()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp_file = f'{self.file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as file:
+            pickle.dump((self.version, self.nodes, self.edges), file)
+        os.replace(temp_file, self.file)
+
+    def build(self):
+        free = np.asarray(self.mesh) == 1
+        height, width = free.shape
+        size = self.cluster_size
+        self.nodes = {}
+        self.edges = {}
+
+        # Transitions across the borders, between the last cells of a cluster and the first of the next one
+        for border in range(size, width, size):
+            pairs = free[:, border - 1] & free[:, border]
+            for y0 in range(0, height, size):
+                for y in self.transitions(pairs[y0:y0 + size]):
+                    self.connect((y0 + y, border - 1), (y0 + y, border))
+        for border in range(size, height, size):
+            pairs = free[border - 1] & free[border]
+            for x0 in range(0, width, size):
+                for x in self.transitions(pairs[x0:x0 + size]):
+                    self.connect((border - 1, x0 + x), (border, x0 + x))
+
+        for cluster, nodes in self.nodes.items():
+            for node in nodes:
+                for other, steps in self.local_steps(node, nodes).items():
+                    if other != node:
+                        self.edges[node][other] = steps
+
+    @staticmethod
+    def transitions(pairs):
+        """
+        :param pairs: booleans along one side of a border, True where the cells on both sides are free
+        :return: offsets of the transitions, one per entrance
+        """
+        offsets = []
+        start = None
+        for offset, free in enumerate(list(pairs) + [False]):
+            if free and start is None:
+                start = offset
+            elif not free and start is not None:
+                end = offset - 1
+                offsets.extend([start, end] if end - start + 1 >= WIDE_ENTRANCE else [(start + end) // 2])
+                start = None
+        return offsets
+
+    def connect(self, a, b):
+        for node, other in [(a, b), (b, a)]:
+            if node not in self.edges:
+                self.edges[node] = {}
+                self.nodes.setdefault(self.cluster(node), []).append(node)
+            self.edges[node][other] = 1
+
+    def local_steps(self, cell, targets):
+        """
+        :param cell: (y, x) free mesh cell
+        :param targets: [(y, x), ...] cells in the same cluster
+        :return: {target: steps from cell} for the targets reachable without leaving the cluster
+        """
+        y0, x0, y1, x1 = self.window(self.cluster(cell))
+        distances = distance_field(self.mesh[y0:y1, x0:x1], [(cell[0] - y0, cell[1] - x0)])
+        steps = {}
+        for target in targets:
+            distance = distances[target[0] - y0, target[1] - x0]
+            if distance >= 0:
+                steps[target] = int(distance)
+        return steps
+
+    def search(self, start, goal):
+        """
+        A* on the abstract graph, with start and goal connected to the transition nodes of their clusters.
+        :return: [(y, x), ...] start, transition nodes and goal, None if the goal cannot be reached
+        """
+        start_edges = self.local_steps(start, self.nodes.get(self.cluster(start), []))
+        goal_edges = self.local_steps(goal, self.nodes.get(self.cluster(goal), []))  # Symmetric, 4-connected steps
+        if self.cluster(start) == self.cluster(goal):
+            start_edges.update(self.local_steps(start, [goal]))
+
+        queue = [(heuristic(start, goal), 0, start)]
+        costs = {start: 0}
+        came_from = {start: None}
+        while queue:
+            _, cost, current = heapq.heappop(queue)
+            if current == goal:
+                break
+            if cost > costs[current]:
+                continue
+            search_stats.expansions += 1
+            edges = list(self.edges.get(current, {}).items())
+            if current == start:
+                edges += start_edges.items()
+            if current in goal_edges:
+                edges.append((goal, goal_edges[current]))
+            for neighbor, steps in edges:
+                new_cost = cost + steps
+                if new_cost < costs.get(neighbor, new_cost + 1):
+                    costs[neighbor] = new_cost
+                    came_from[neighbor] = current
+                    heapq.heappush(queue, (new_cost + heuristic(neighbor, goal), new_cost, neighbor))
+        else:
+            return None
+
+        path = []
+        current = goal
+        while current is not None:
+            path.append(current)
+            current = came_from[current]
+        path.reverse()
+        return path
+
+    def refine(self, nodes):
+        """
+        :param nodes: result of search
+        :return: path, [(y, x), ...] through every mesh cell
+        """
+        path = [nodes[0]]
+        for a, b in zip(nodes, nodes[1:]):
+            if self.cluster(a) != self.cluster(b):  # Transition across a border, a single step
+                path.append(b)
+                continue
+            y0, x0, y1, x1 = self.window(self.cluster(a))
+            segment = astar_flat(self.mesh[y0:y1, x0:x1], (a[0] - y0, a[1] - x0), (b[0] - y0, b[1] - x0))
+            path.extend((y + y0, x + x0) for y, x in segment[1:])
+        return path
+
+
+def hpa_star(mesh: np.ndarray, start: tuple, goal: tuple, cluster_size=CLUSTER_SIZE):
+    """
+    Hierarchical A* with the cached abstract graph of the mesh, see AbstractGraph.
+    :param mesh: np.array with 1s and 0s, where 0s are walls
+    :param start: (y, x)
+    :param goal: (y, x)
+    :param cluster_size: mesh cells along each side of a cluster
+    :return: path, [(y, x), ... (y,x)], Note: [goal] if no path can be found
+    """
+    if start == goal or mesh[goal] != 1:  # astar never enters a goal that is not free either
+        return [goal]
+    graph = abstract_graph(mesh, cluster_size)
+    nodes = graph.search(start, goal)
+    if nodes is None:
+        return [goal]
+    return graph.refine(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hierarchical against flat A* between the service road and the '
+                                                 'service points, on the mesh and finer copies of it')
+    parser.add_argument('--mesh', default='Mesh_4', help='mesh file name without extension')
+    parser.add_argument('--factor', type=int, action='append',
+                        help='cells per original cell along each axis (repeatable), default 1, 2 and 5')
+    parser.add_argument('--cluster-size', type=int, default=CLUSTER_SIZE, help='mesh cells along each side of a cluster')
+    args = parser.parse_args()
+
+    from travel import SERVICE_ROAD_GRID, service_points
+
+    points = sorted(service_points()[args.mesh] - {SERVICE_ROAD_GRID})
+    print(f'{"Cell [px]":>9}{"Cells":>9}{"Graph [s]":>11}{"Nodes":>7}{"Flat [ms]":>11}{"HPA* [ms]":>11}{"Longer":>8}')
+    for factor in args.factor or [1, 2, 5]:
+        mesh = upsample_mesh(load_mesh(args.mesh), factor)
+        cell_size = CELL_SIZE / factor
+        start_time = time.perf_counter()
+        graph = abstract_graph(mesh, args.cluster_size)
+        graph_time = time.perf_counter() - start_time
+
+        flat_time = hpa_time = 0.0
+        flat_steps = hpa_steps = 0
+        start = to_grid(SERVICE_ROAD_GRID, cell_size)
+        astar_flat(mesh, start, start)  # Leave the numba compilation out of the timings
+        for point in points:
+            goal = to_grid(point, cell_size)
+            start_time = time.perf_counter()
+            flat_steps += len(astar_flat(mesh, start, goal)) - 1
+            flat_time += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            hpa_steps += len(hpa_star(mesh, start, goal, args.cluster_size)) - 1
+            hpa_time += time.perf_counter() - start_time
+        print(f'{cell_size:>9g}{mesh.size:>9}{graph_time:>11.2f}{len(graph.edges):>7}'
+              f'{flat_time / len(points) * 1000:>11.2f}{hpa_time / len(points) * 1000:>11.2f}'
+              f'{(hpa_steps / max(flat_steps, 1) - 1) * 100:>7.1f}%')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class KinematicsEngine:
+    """
+    Moves all driving vehicles in one vectorised step, instead of one Vehicle.move call per vehicle.
+    Locations live in one array, every vehicle's location is a view on its row. Rotation, speed and the path state
+    stay on the vehicles, they are gathered into arrays before and written back after each step.
+    Vehicles see the others at their locations from the previous step, rather than partly updated ones, so results
+    differ slightly from the sequential Vehicle.update.
+    """
+    def __init__(self):
+        self.vehicles = []
+        self.locations = np.zeros((0, 2))
+        self.slots = {}  # {id(vehicle): row}
+        self.max_speed = np.zeros(0)
+        self.acceleration = np.zeros(0)
+        self.max_rotation = np.zeros(0)
+        self.prev_steering = np.zeros(0)
+        self.walking = np.zeros(0, dtype=bool)
+        self.employee = np.zeros(0, dtype=bool)
+        self.baggage = np.zeros(0, dtype=bool)
+
+    def attach(self, vehicles):
+        """
+        Moves the locations of the vehicles into the engine, replacing any previously attached vehicles.
+        :param vehicles: list of Vehicle
+        """
+        self.vehicles = list(vehicles)
+        self.locations = np.array([vehicle.location for vehicle in self.vehicles], dtype=float).reshape(-1, 2)
+        self.slots = {}
+        for row, vehicle in enumerate(self.vehicles):
+            vehicle.location = self.locations[row]
+            self.slots[id(vehicle)] = row
+
+        self.max_speed = np.array([vehicle.max_speed for vehicle in self.vehicles], dtype=float)
+        self.acceleration = np.array([vehicle.acceleration for vehicle in self.vehicles], dtype=float)
+        self.max_rotation = np.array([vehicle.max_rotation for vehicle in self.vehicles], dtype=float)
+        self.prev_steering = np.array([vehicle.prev_steering for vehicle in self.vehicles], dtype=float)
+        self.walking = np.array([vehicle.walking for vehicle in self.vehicles], dtype=bool)
+        self.employee = np.array([vehicle.name.startswith('Employee') for vehicle in self.vehicles], dtype=bool)
+        self.baggage = np.array([vehicle.name.startswith('Baggage') for vehicle in self.vehicles], dtype=bool)
+
+    def step(self, simulations, time_step):
+        """
+        Advances all vehicles of the simulations, replacing Simulation.update_vehicles.
+        :param simulations: simulations whose vehicles are attached, e.g. all stands of an Apron
+        :param time_step: simulated seconds to advance
+        """
+        active = [(vehicle, simulation) for simulation in simulations
+                  for vehicle in simulation.vehicles if not vehicle.departed]
+        moving = [(vehicle, simulation) for vehicle, simulation in active if vehicle.path]
+        parked = [(vehicle, simulation) for vehicle, simulation in active if not vehicle.path]
+
+        for vehicle, simulation in moving:
+            vehicle.check_proximity(time_step, simulation)
+        if moving:
+            crossed_gates = self.move([vehicle for vehicle, _ in moving], time_step)
+            for (vehicle, _), crossed_gate in zip(moving, crossed_gates):
+                vehicle.update_trailers(time_step)
+                vehicle.advance_path(crossed_gate)
+        for vehicle, simulation in parked:
+            vehicle.idle(time_step, simulation)
+
+        for vehicle, simulation in active:
+            if vehicle.path:
+                simulation.traffic.update(vehicle)
+            elif vehicle in simulation.traffic:
+                simulation.traffic.remove(vehicle)
+
+    def move(self, vehicles, time_step):
+        """
+        Vectorised Vehicle.move.
+        :param vehicles: attached vehicles that have a path
+        :param time_step: simulated seconds to advance
+        :return: list of booleans, whether each vehicle crossed its current gate
+        """
+        rows = np.array([self.slots[id(vehicle)] for vehicle in vehicles])
+        rotation, speed, target, goal, stopped, full_reverse = (np.array(values, dtype=float) for values in zip(
+            *[(vehicle.rotation, vehicle.speed, vehicle.path[0], vehicle.path[-1], vehicle.stopped,
+               vehicle.full_reverse) for vehicle in vehicles]))
+        stopped = stopped.astype(bool)
+        location = self.locations[rows]
+        max_speed = self.max_speed[rows]
+        acceleration = self.acceleration[rows] * time_step
+        max_rotation = self.max_rotation[rows] * time_step
+        prev_steering = self.prev_steering[rows]
+
+        delta = target - location
+        angle = np.rad2deg(np.arctan2(delta[:, 1], delta[:, 0]))
+        travel_distance = time_step * speed * 25  # 25 pixels per meter
+
+        # Displacement
+        heading = np.deg2rad(rotation)
+        location[:, 0] += np.cos(heading) * travel_distance
+        location[:, 1] += np.sin(heading) * travel_distance
+
+        angle_diff = wrap_angle(angle - rotation)
+        turn_around = np.abs(angle_diff) > 178
+        rotation = np.where(turn_around & self.employee[rows], angle, rotation)
+        reverse = (full_reverse != 0) | (turn_around & ~self.employee[rows] & ~self.baggage[rows])
+        reverse_rotation = rotation + 180
+        reverse_rotation = np.where(reverse_rotation > 180, reverse_rotation - 360, reverse_rotation)
+        angle_diff = np.where(reverse, wrap_angle(angle - reverse_rotation), angle_diff)
+
+        # Steering
+        steering_factor = np.where(self.walking[rows], 1.0, np.minimum(1.0, np.abs(speed / 3)))
+        steering = np.clip(10 * angle_diff * steering_factor * time_step, -max_rotation, max_rotation)
+        steering = np.clip(steering, prev_steering - 20 * time_step, prev_steering + 20 * time_step)
+        rotation = rotation + steering
+
+        # Accelerating + Braking
+        dist_goal = np.sqrt(((goal - location) ** 2).sum(axis=1))
+        brake_speed = ((max_speed - 0.1) / 200) * dist_goal + 0.1
+        braking = np.where(reverse, speed < -brake_speed, speed > brake_speed)
+        speed = np.select(
+            [stopped & reverse, stopped, braking & reverse, braking, reverse],
+            [np.minimum(speed + acceleration, 0), np.maximum(speed - acceleration, 0),
+             np.maximum(speed, -brake_speed), np.minimum(speed, brake_speed),
+             np.where(speed - acceleration > -max_speed / 2, speed - acceleration, -max_speed)],
+            np.where(speed + acceleration < max_speed, speed + acceleration, max_speed))
+
+        self.locations[rows] = location
+        for vehicle, vehicle_rotation, vehicle_speed in zip(vehicles, rotation.tolist(), speed.tolist()):
+            vehicle.rotation = vehicle_rotation
+            vehicle.speed = vehicle_speed
+        return self.crossed_gates(vehicles, location)
+
+    @staticmethod
+    def crossed_gates(vehicles, location):
+        """
+        Vectorised Vehicle.has_crossed_gate.
+        :return: list of booleans
+        """
+        upwards, rightwards, slope, intercept, center_x = (np.array(values, dtype=float) for values in zip(
+            *[(-1 if vehicle.upwards is None else vehicle.upwards, vehicle.rightwards is True, vehicle.gate_slope,
+               vehicle.gate_b, vehicle.gate_center[0]) for vehicle in vehicles]))
+        x, y = location[:, 0], location[:, 1]
+        with np.errstate(invalid='ignore'):
+            line = intercept + slope * x
+        crossed = np.where(upwards == 1, y >= line,
+                           np.where(upwards == 0, y <= line,
+                                    np.where(rightwards == 1, x >= center_x, x <= center_x)))
+        return crossed.tolist()
+
+
+def wrap_angle(angle):
+    """
+    Wraps angles in (-540, 540) to [-180, 180], like the single correction Vehicle.move applies.
+    """
+    return np.where(angle < -180, angle + 360, np.where(angle > 180, angle - 360, angle))
@@ -0,0 +1,462 @@
+import argparse
+import hashlib
+import heapq
+import math
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from pathfinding import CELL_SIZE, MESH_TOP, distance_field, to_grid, wall_tables
+
+CACHE_DIR = 'cache/lattice'
+HEADINGS = 16  # Heading bins, primitives start and end on bin centres
+SAMPLE_SPACING = 5  # Pixels between the collision checks along a primitive
+REVERSE_COST = 2.0  # Cost factor of driving in reverse
+SWITCH_COST = 100.0  # Cost of changing between forward and reverse, in pixels
+STEER_COST = 0.1  # Extra cost factor of curved primitives
+MAX_EXPANSIONS = 1500  # States expanded before a search gives up, so failing searches end quickly
+HITCH_RATE = 1.67 / 100  # Turn of a trailer per pixel driven and radian of hitch angle, as in Trailer.update
+JACKKNIFE_ANGLE = 60  # Largest hitch angle in degrees between a trailer and the vehicle or trailer pulling it
+HITCH_BIN = 20  # Degrees of hitch angle per bin, the search closes states per bin of the first trailer
+DIRECTION_NAMES = {None: 'both', 1: 'forward', -1: 'reverse'}
+
+
+class VehicleClass:
+    """
+    Motion limits of a group of vehicles, see VEHICLE_CLASSES.
+    """
+    def __init__(self, name, turning_radius, reverse=True):
+        """
+        :param name: class name
+        :param turning_radius: smallest turning radius in pixels, 0 for vehicles that turn on the spot
+        :param reverse: whether the vehicle may plan reversing moves
+        """
+        self.name = name
+        self.turning_radius = turning_radius
+        self.reverse = reverse
+
+
+# Turning radii in pixels (25 pixels per meter). Trucks pulling trailers turn like trucks, the hitch angles of their
+# trailers are part of the search state instead, see plan. Vehicle.plan_lattice still leaves them to smooth_astar, as
+# their trailers slip more on lattice paths.
+VEHICLE_CLASSES = {
+    'walker': VehicleClass('walker', 0, reverse=False),
+    'car': VehicleClass('car', 50),
+    'truck': VehicleClass('truck', 80),
+    'truck_trailers': VehicleClass('truck_trailers', 80),
+}
+
+
+def vehicle_class(vehicle):
+    """
+    :param vehicle: Vehicle
+    :return: name of the vehicle's class in VEHICLE_CLASSES, depending on its trailers currently connected
+    """
+    if vehicle.walking:
+        return 'walker'
+    if any(trailer.connected for trailer in vehicle.trailers):
+        return 'truck_trailers'
+    if vehicle.name in ['PCA_cart', 'GPU_cart'] or vehicle.name.startswith(('Baggage', 'Cleaning')):
+        return 'car'
+    return 'truck'
+
+
+class PrimitiveTable:
+    """
+    Motion primitives of a vehicle class, per start heading bin. Every primitive is a straight line or an arc of the
+    smallest turning radius that turns exactly one heading bin, driven forward or in reverse. Walkers instead move
+    straight in any heading bin.
+    """
+    def __init__(self, vehicle_class: VehicleClass):
+        bin_angle = 2 * math.pi / HEADINGS
+        radius = vehicle_class.turning_radius
+        length = radius * bin_angle if radius > 0 else 20.0
+        directions = [1, -1] if vehicle_class.reverse else [1]
+        count = max(2, math.ceil(length / SAMPLE_SPACING))
+        fractions = np.arange(1, count + 1) / count
+
+        self.length = length
+        self.spacing = length / count  # Pixels driven between samples
+        self.samples = []  # Per heading bin np.array (primitives, samples, 2) of offsets to check on the mesh
+        self.sample_headings = []  # Per heading bin np.array (primitives, samples) of headings in radians
+        self.ends = []  # Per heading bin np.array (primitives, 2) of end offsets
+        self.headings = []  # Per heading bin np.array of end heading bins
+        self.directions = []  # Per heading bin np.array of 1 (forward) or -1 (reverse)
+        self.costs = []  # Per heading bin np.array of costs
+        for heading in range(HEADINGS):
+            theta = heading * bin_angle
+            samples, sample_headings, headings, motion_directions, costs = [], [], [], [], []
+            if radius == 0:
+                motions = [(1, 0, end) for end in range(HEADINGS)]
+            else:
+                # Reversing turns the heading the other way for the same steering
+                motions = [(direction, turn, (heading + turn * direction) % HEADINGS) for direction in directions
+                           for turn in [-1, 0, 1]]
+            for direction, turn, end_heading in motions:
+                if radius == 0:
+                    end_theta = end_heading * bin_angle
+                    offsets = np.stack([np.cos(end_theta) * length * fractions,
+                                        np.sin(end_theta) * length * fractions], axis=1)
+                    angles = np.full(count, end_theta)
+                elif turn == 0:
+                    offsets = np.stack([np.cos(theta) * direction * length * fractions,
+                                        np.sin(theta) * direction * length * fractions], axis=1)
+                    angles = np.full(count, theta)
+                else:
+                    # Arc around the centre of the turning circle, the heading turns with the travelled distance
+                    angles = theta + turn * direction * bin_angle * fractions
+                    offsets = np.stack([turn * radius * (np.sin(angles) - np.sin(theta)),
+                                        -turn * radius * (np.cos(angles) - np.cos(theta))], axis=1)
+                samples.append(offsets)
+                sample_headings.append(angles)
+                headings.append(end_heading)
+                motion_directions.append(direction)
+                costs.append(length * (REVERSE_COST if direction < 0 else 1) * (1 + STEER_COST * (turn != 0)))
+            samples = np.array(samples)
+            self.samples.append(samples)
+            self.sample_headings.append(np.array(sample_headings))
+            self.ends.append(samples[:, -1])
+            self.headings.append(np.array(headings))
+            self.directions.append(np.array(motion_directions))
+            self.costs.append(np.array(costs))
+
+
+class HeuristicTable:
+    """
+    Cost to reach a goal pose with the primitives of a vehicle class in free space, from the poses around it, by
+    Dijkstra backwards from the goal on the mesh cell grid. The table is for a goal at heading bin 0, poses relative
+    to other goals are rotated onto it, or for a goal at any heading. Table cells are CELL_SIZE pixels whatever the
+    mesh, and tables are saved in CACHE_DIR, as they depend on the primitives only.
+    """
+    def __init__(self, class_name, direction=None, tolerance=15.0, any_heading=False, reach=200):
+        """
+        :param class_name: key of VEHICLE_CLASSES
+        :param direction: 1 for forward, -1 for reverse, None for both, as in plan
+        :param tolerance: distance from the goal at which it counts as reached, as in plan
+        :param any_heading: the goal is reached at any heading
+        :param reach: distance from the goal covered by the table, in pixels
+        """
+        self.class_name = class_name
+        self.direction = direction
+        self.tolerance = tolerance
+        self.any_heading = any_heading
+        self.reach = reach
+        self.center = int(reach // CELL_SIZE)
+        self.costs = None
+
+    @property
+    def file(self):
+        vehicle_class = VEHICLE_CLASSES[self.class_name]
+        parameters = (HEADINGS, SAMPLE_SPACING, REVERSE_COST, SWITCH_COST, STEER_COST, vehicle_class.turning_radius,
+                      vehicle_class.reverse, self.direction, self.tolerance, self.any_heading, self.reach, CELL_SIZE)
+        digest = hashlib.sha1(repr(parameters).encode()).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, f'{self.class_name}_{digest}.npy')
+
+    def load(self):
+        try:
+            self.costs = np.load(self.file)
+        except (OSError, ValueError):
+            self.compute()
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            temp_file = f'{self.file}.{os.getpid()}.tmp.npy'
+            np.save(temp_file, self.costs)
+            os.replace(temp_file, self.file)
+
+    def compute(self):
+        table = primitive_table(self.class_name)
+        size = 2 * self.center + 1
+        # Primitives by the heading they end in, to step backwards from their end poses
+        moves = [[] for _ in range(HEADINGS)]
+        for heading in range(HEADINGS):
+            for (dx, dy), end_heading, direction, cost in zip(table.ends[heading], table.headings[heading],
+                                                              table.directions[heading], table.costs[heading]):
+                if self.direction is None or direction == self.direction:
+                    moves[end_heading].append((heading, round(dy / CELL_SIZE), round(dx / CELL_SIZE), float(cost)))
+
+        costs = np.full((HEADINGS, size, size), math.inf)
+        queue = []
+        cells = int(self.tolerance // CELL_SIZE)
+        for dy in range(-cells, cells + 1):
+            for dx in range(-cells, cells + 1):
+                if math.hypot(dx * CELL_SIZE, dy * CELL_SIZE) <= self.tolerance:
+                    for heading in range(HEADINGS) if self.any_heading else [0]:
+                        costs[heading, self.center + dy, self.center + dx] = 0
+                        queue.append((0.0, heading, self.center + dy, self.center + dx))
+        while queue:
+            cost, heading, row, column = heapq.heappop(queue)
+            if cost > costs[heading, row, column]:
+                continue
+            for start_heading, dy, dx, move_cost in moves[heading]:
+                start_row, start_column = row - dy, column - dx
+                if 0 <= start_row < size and 0 <= start_column < size \
+                        and cost + move_cost < costs[start_heading, start_row, start_column]:
+                    costs[start_heading, start_row, start_column] = cost + move_cost
+                    heapq.heappush(queue, (cost + move_cost, start_heading, start_row, start_column))
+        self.costs = costs
+
+    def lookup(self, x, y, heading, goal):
+        """
+        :param x: pixel coordinates of a pose
+        :param y: see x
+        :param heading: heading bin of the pose
+        :param goal: (x, y, heading bin) of the goal, heading bin 0 for tables of goals at any heading
+        :return: cost to the goal, 0 outside the table
+        """
+        angle = -goal[2] * 2 * math.pi / HEADINGS
+        dx, dy = x - goal[0], y - goal[1]
+        row = self.center + round((dx * math.sin(angle) + dy * math.cos(angle)) / CELL_SIZE)
+        column = self.center + round((dx * math.cos(angle) - dy * math.sin(angle)) / CELL_SIZE)
+        if 0 <= row < self.costs.shape[1] and 0 <= column < self.costs.shape[2]:
+            return self.costs[(heading - goal[2]) % HEADINGS, row, column]
+        return 0.0
+
+
+# Primitive and heuristic tables per vehicle class, and distance field heuristics per mesh and goal cell
+_primitive_tables = {}
+_heuristic_tables = {}
+_heuristics = OrderedDict()
+
+
+def primitive_table(class_name):
+    table = _primitive_tables.get(class_name)
+    if table is None:
+        table = PrimitiveTable(VEHICLE_CLASSES[class_name])
+        _primitive_tables[class_name] = table
+    return table
+
+
+def heuristic_table(class_name, direction=None, tolerance=15.0, any_heading=False):
+    key = (class_name, direction, tolerance, any_heading)
+    table = _heuristic_tables.get(key)
+    if table is None:
+        table = HeuristicTable(class_name, direction, tolerance, any_heading)
+        table.load()
+        _heuristic_tables[key] = table
+    return table
+
+
+def heuristic_field(mesh, goal_cell, cell_size=CELL_SIZE, max_size=256):
+    """
+    :return: distance_field towards the goal cell in pixels, cached per mesh array and goal cell
+    """
+    key = (id(mesh), goal_cell, cell_size)
+    entry = _heuristics.get(key)
+    if entry is None or entry[0] is not mesh:
+        field = distance_field(mesh, [goal_cell]).astype(float) * cell_size
+        field[field < 0] = math.inf
+        entry = (mesh, field)
+        _heuristics[key] = entry
+        while len(_heuristics) > max_size:
+            _heuristics.popitem(last=False)
+    _heuristics.move_to_end(key)
+    return entry[1]
+
+
+def heading_bin(rotation):
+    return round(rotation / (360 / HEADINGS)) % HEADINGS
+
+
+def plan(mesh: np.ndarray, start: tuple, goal: tuple, class_name='car', direction=None, tolerance=15.0,
+         max_expansions=MAX_EXPANSIONS, distances=None, arrival=None, trailers=(), cell_size=CELL_SIZE):
+    """
+    Hybrid A* over (x, y, heading, direction, trailer headings) with the motion primitives of a vehicle class.
+    Positions are continuous, the search closes states per mesh cell, heading bin and hitch angle bin of the first
+    trailer. The trailers turn along every primitive like in Trailer.update, primitives that jackknife one of them are
+    rejected. The distance field towards the goal is the heuristic, it ignores the heading and is not admissible,
+    which trades path length for speed.
+    :param mesh: array of 1s and 0s, where 0s are walls, the vehicle's centre stays on free cells
+    :param start: (x, y, rotation) pixel coordinates on the stand and heading in degrees
+    :param goal: (x, y, rotation), rotation None for any heading
+    :param class_name: key of VEHICLE_CLASSES
+    :param direction: 1 to only drive forward, -1 to only reverse, None for both
+    :param tolerance: distance in pixels from the goal at which the search stops
+    :param max_expansions: states expanded before the search gives up
+    :param distances: distance_field of the mesh towards the goal cell, e.g. from a TravelTable, computed if not given
+    :param arrival: direction of the last primitive into the goal, 1 or -1, None for either
+    :param trailers: rotations in degrees of the trailers pulled, the first one right behind the vehicle
+    :param cell_size: pixels per mesh cell, as in smooth_astar
+    :return: poses [(x, y, rotation, direction), ...] from start to goal at the primitive ends, None if not found
+    """
+    table = primitive_table(class_name)
+    if not VEHICLE_CLASSES[class_name].reverse:
+        if direction == -1 or arrival == -1:
+            return None
+        direction = 1
+    if arrival is None:
+        arrival = direction
+    walls, _ = wall_tables(mesh)
+    height, width = mesh.shape
+    top_rows = int(MESH_TOP // cell_size)  # Same rows above the screen as to_grid
+    goal_cell = to_grid(goal, cell_size)
+    if not (0 <= goal_cell[0] < height and 0 <= goal_cell[1] < width):
+        return None
+    if distances is None:
+        field = heuristic_field(mesh, goal_cell, cell_size)
+    else:
+        field = np.where(distances < 0, math.inf, distances * float(cell_size))
+    if direction == -1 or arrival == -1:  # Reverse approaches cost the reverse factor per pixel left
+        field = field * REVERSE_COST
+    goal_heading = None if goal[2] is None else heading_bin(goal[2])
+    # Near the goal, turning towards it costs more than the distance alone. Walkers turn on the spot, their heading
+    # has no meaning.
+    turning = None
+    if VEHICLE_CLASSES[class_name].turning_radius == 0:
+        goal_heading = None
+    else:
+        # Tables of the arrival direction, so poses facing the wrong way for a reverse approach cost the turn
+        turning = heuristic_table(class_name, arrival, tolerance, any_heading=goal_heading is None)
+    goal_pose = (goal[0], goal[1], goal_heading or 0)
+
+    start_heading = heading_bin(start[2])
+    start_state = (float(start[0]), float(start[1]), start_heading, 0, tuple(math.radians(rotation)
+                                                                             for rotation in trailers))
+    parents = {}
+    costs = {}
+    queue = [(0.0, 0, start_state, None)]
+    order = 1
+    expansions = 0
+    while queue and expansions < max_expansions:
+        cost_estimate, _, state, parent = heapq.heappop(queue)
+        x, y, heading, motion, trailer_headings = state
+        key = to_grid((x, y), cell_size) + (heading, motion, hitch_bin(heading, trailer_headings))
+        if key in parents:
+            continue
+        parents[key] = parent
+        expansions += 1
+        cost = costs.get(key, 0.0)
+        if (math.hypot(goal[0] - x, goal[1] - y) <= tolerance
+                and (goal_heading is None or heading == goal_heading)
+                and (arrival is None or motion == arrival or state is start_state)):
+            return poses(parents, key, state, goal)
+
+        # Every sample of every primitive has to stay on free cells of the mesh
+        samples = table.samples[heading]
+        xs = samples[:, :, 0] + x
+        ys = samples[:, :, 1] + y
+        # Truncated like to_grid
+        rows = (ys / cell_size).astype(np.int64) + top_rows
+        columns = (xs / cell_size).astype(np.int64)
+        inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+        free = inside & ~walls[np.where(inside, rows * width + columns, 0)]
+        valid = free.all(axis=1)
+        if direction is not None:
+            valid &= table.directions[heading] == direction
+        if trailer_headings:
+            trailer_ends, safe = follow_trailers(table, heading, trailer_headings)
+            valid &= safe
+        for i in np.flatnonzero(valid):
+            end_x, end_y = float(xs[i, -1]), float(ys[i, -1])
+            motion_direction = int(table.directions[heading][i])
+            next_heading = int(table.headings[heading][i])
+            next_trailers = tuple(float(angle) for angle in trailer_ends[i]) if trailer_headings else ()
+            next_key = (int(rows[i, -1]), int(columns[i, -1]), next_heading, motion_direction,
+                        hitch_bin(next_heading, next_trailers))
+            if next_key in parents:
+                continue
+            next_cost = cost + table.costs[heading][i] + (SWITCH_COST if motion and motion != motion_direction else 0)
+            if next_cost >= costs.get(next_key, math.inf):
+                continue
+            estimate = field[rows[i, -1], columns[i, -1]]
+            if estimate == math.inf:
+                continue
+            if turning is not None:
+                estimate = max(estimate, turning.lookup(end_x, end_y, next_heading, goal_pose))
+            costs[next_key] = next_cost
+            heapq.heappush(queue, (next_cost + estimate, order,
+                                   (end_x, end_y, next_heading, motion_direction, next_trailers), (key, state)))
+            order += 1
+    return None
+
+
+def wrap(angle):
+    """
+    :return: angle in radians wrapped to [-pi, pi), also for arrays
+    """
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def hitch_bin(heading, trailer_headings):
+    """
+    :param heading: heading bin of the vehicle
+    :param trailer_headings: headings of its trailers in radians
+    :return: bin of the hitch angle of the first trailer, 0 without trailers
+    """
+    if not trailer_headings:
+        return 0
+    hitch = wrap(heading * 2 * math.pi / HEADINGS - trailer_headings[0])
+    return round(math.degrees(hitch) / HITCH_BIN)
+
+
+def follow_trailers(table, heading, trailer_headings):
+    """
+    Turns the trailers along every primitive of a heading bin, each towards the one pulling it like in Trailer.update.
+    :param table: PrimitiveTable
+    :param heading: heading bin at the start of the primitives
+    :param trailer_headings: headings of the trailers in radians at the start
+    :return: (np.array (primitives, trailers) of the trailer headings at the primitive ends,
+              bool np.array of the primitives that keep every hitch angle within JACKKNIFE_ANGLE)
+    """
+    steps = table.directions[heading] * table.spacing
+    headings = np.tile(np.array(trailer_headings), (len(steps), 1))
+    safe = np.ones(len(steps), dtype=bool)
+    limit = math.radians(JACKKNIFE_ANGLE)
+    for front in table.sample_headings[heading].T:
+        for number in range(headings.shape[1]):
+            hitch = wrap(front - headings[:, number])
+            headings[:, number] += HITCH_RATE * hitch * steps
+            turned = np.abs(wrap(front - headings[:, number]))
+            # Hitch angles beyond the limit, e.g. of a trailer parked at an angle, may only straighten out
+            safe &= (turned <= limit) | (turned < np.abs(hitch))
+            front = headings[:, number]
+    return headings, safe
+
+
+def poses(parents, key, state, goal):
+    path = [state]
+    parent = parents[key]
+    while parent is not None:
+        key, state = parent
+        path.append(state)
+        parent = parents[key]
+    path.reverse()
+    bin_angle = 360 / HEADINGS
+    result = [(x, y, heading * bin_angle, motion) for x, y, heading, motion, _ in path]
+    x, y, rotation, motion = result[-1]
+    result.append((goal[0], goal[1], rotation if goal[2] is None else goal[2], motion))
+    return result
+
+
+def path_cells(poses, cell_size=CELL_SIZE):
+    """
+    :param poses: result of plan
+    :param cell_size: pixels per mesh cell, as in plan
+    :return: set of the mesh cells (y, x) the path passes, between the poses on straight lines
+    """
+    cells = set()
+    for (x1, y1, _, _), (x2, y2, _, _) in zip(poses, poses[1:]):
+        count = max(1, math.ceil(math.hypot(x2 - x1, y2 - y1) / SAMPLE_SPACING))
+        for i in range(count + 1):
+            cells.add(to_grid((x1 + (x2 - x1) * i / count, y1 + (y2 - y1) * i / count), cell_size))
+    return cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the turning heuristic tables of the vehicle classes')
+    parser.parse_args()
+
+    for class_name, vehicle_class in VEHICLE_CLASSES.items():
+        if vehicle_class.turning_radius == 0:
+            continue
+        for direction in [None, 1, -1] if vehicle_class.reverse else [1]:
+            for any_heading in [False, True]:
+                start = time.perf_counter()
+                table = heuristic_table(class_name, direction, any_heading=any_heading)
+                print(f'{class_name:<16}{DIRECTION_NAMES[direction]:<9}'
+                      f'{"any heading" if any_heading else "fixed heading":<15}'
+                      f'{time.perf_counter() - start:.2f}s, {table.file}')
+
+
+if __name__ == "__main__":
+    main()
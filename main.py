@@ -1,52 +1,76 @@
+import argparse
+import heapq
 import math
 import os
-import random
 
 import numpy as np
-import pandas as pd
 import pygame as pg
 import time
-from pathfinding import smooth_astar
+from collections import OrderedDict
+from collections.abc import Mapping
+from operator import itemgetter
+import lattice
+from kinematics import KinematicsEngine
+from meshes import load_mesh
+from occupancy import OccupancyLayer
+from pathfinding import (CELL_SIZE, MESH_TOP, SERVICE_ROAD_ENDS, SERVICE_ROAD_ENTRANCE, SERVICE_ROAD_EXIT, DStarLite,
+                         astar_flat, path_cache, search_stats, smooth_astar, to_grid)
+from profiler import Profiler
+from scenarios import load_scenario
+from spatial import SpatialGrid
+from travel import load_table
 
 # import screeninfo
 
-pg.font.init()
-small_font = pg.font.SysFont('arial', 20)
-medium_font = pg.font.SysFont('arial', 30)
-large_font = pg.font.SysFont('arial', 40)
+# System fonts by name, created on first use by get_font, as SysFont enumerates the system fonts
+fonts = {'small': ('arial', 20), 'medium': ('arial', 30), 'large': ('arial', 40),
+         'mono': ('consolas,couriernew,monospace', 16)}
+_fonts = {}
 white = (255, 255, 255)
 gray = (150, 150, 150)
 black = (0, 0, 0)
 klm_rgb = (0, 161, 228)
 op_list_margin = 24
 op_list_start = 160
-display_mesh = pd.read_excel("assets/Meshes/Mesh_4.xlsx", header=None)
-random.seed(time.time())
+sprite_dirs = ['assets', os.path.join('assets', 'Baggage')]
+sprites = {}  # Loaded once per process by load_assets, keyed on file name without extension
+# Operations read every frame by Simulation.draw, and by Simulation.background in the old turnaround
+DRAWN_OPERATIONS = ('Parking', 'Pushback', 'Attach_Tug', 'Connect_Bridge', 'Flight_Closure', 'Refuel_Prep',
+                    'Refuel_Finalising', 'Connect_LDL_Front', 'Connect_LDL_Rear', 'Offload_Front', 'Offload_Rear',
+                    'Load_Front', 'Load_Rear', 'Remove_LDL_Front', 'Remove_LDL_Rear')
+PROP_OPERATIONS = ('Connect_GPU', 'Remove_GPU', 'Place_Cones', 'Remove_Cones', 'Connect_PCA', 'Remove_PCA',
+                   'Connect_LDL_Front', 'Load_Front', 'Connect_LDL_Rear', 'Load_Rear', 'Refuel_Prep',
+                   'Refuel_Finalising')
 
 
 class Operation:
-    def __init__(self, name, duration, delay):
+    __slots__ = ('name', 'index', 'duration', 'delay', 'pending', 'completed', 'completion_time', 'start_time',
+                 'time_left', 'locations')
+
+    def __init__(self, name, duration, delay, index=0, pending=0, locations=()):
         self.name = name
+        self.index = index  # Position in the scheduler, dependencies always come first
         self.duration = duration
-        self.dependencies = []
+        self.pending = pending  # Number of dependencies not yet completed
         self.completed = False
         self.completion_time = None
         self.start_time = None
         self.time_left = duration
-        self.locations = []
+        self.locations = locations
         self.delay = delay
 
-    def reset(self):
+    def reset(self, pending):
+        """
+        :param pending: number of dependencies of the operation
+        """
+        self.pending = pending
         self.completed = False
         self.completion_time = None
         self.start_time = None
         self.time_left = self.duration
 
-    def add_dependency(self, operation):
-        self.dependencies.append(operation)
-
     def is_ready(self):
-        return all(dep.completed for dep in self.dependencies)
+        return self.pending == 0
 
     def __str__(self):
         # return f'Operation:{self.name}, Duration: {self.duration}, Dependencies: {self.dependencies}, Ready: {self.is_ready()}'
@@ -56,69 +80,221 @@ class Operation:
         return f'{self.name} Ops'
 
 
+class OperationMap(Mapping):
+    """
+    Read-only {operation name: Operation} view on the operations of a Scheduler, by the indices of its scenario.
+    """
+    __slots__ = ('indices', 'op_list')
+
+    def __init__(self, indices, op_list):
+        self.indices = indices
+        self.op_list = op_list
+
+    def __getitem__(self, name):
+        return self.op_list[self.indices[name]]
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
 class Scheduler:
     def __init__(self, sim_type: str):
-        self.ops = {}
+        self.op_list = []
+        self.graph = None  # DependencyGraph of the loaded scenario, shared with every other Scheduler of it
+        self.active = []  # Heap of indices of the operations that are ready but not completed
+        self.remaining = 0
+        self.previous = None  # Type of the loaded scenario, reset only reloads when it changes
         self.load_df(sim_type)
         self.finished = False
-        self.previous = sim_type
+
+    @property
+    def ops(self):
+        """
+        :return: {operation name: Operation}, for lookups by name outside of the per-frame code, see getter
+        """
+        return OperationMap(self.graph.indices, self.op_list)
 
     def reset(self, sim_type: str):
         print(f'resetting for {sim_type}')
         self.finished = False
         if self.previous == sim_type:
-            for operation in self.ops.values():
-                self.finished = False
-                operation.reset()
+            for operation, pending in zip(self.op_list, self.graph.dependency_counts):
+                operation.reset(pending)
+            self.start()
         else:
             self.load_df(sim_type)
 
+    def start(self):
+        self.active = [operation.index for operation in self.op_list if operation.pending == 0]
+        self.remaining = len(self.op_list)
+
+    def dependency_count(self, index):
+        return self.graph.dependency_counts[index]
+
+    def dependencies(self, index):
+        """
+        :return: [Operation, ...] the operation at index depends on
+        """
+        return [self.op_list[i] for i in self.graph.dependencies(index)]
+
+    def dependents(self, index):
+        """
+        :return: [Operation, ...] depending on the operation at index
+        """
+        return [self.op_list[i] for i in self.graph.dependents(index)]
+
+    def handle(self, name):
+        """
+        :return: index of the operation in op_list, which stays valid until another scenario is loaded
+        """
+        return self.graph.indices[name]
+
+    def getter(self, *names):
+        """
+        Resolves operation names once, for code that reads the same operations every frame or step.
+        :return: function returning the tuple of operations from op_list, e.g. getter('Parking', 'Pushback')(op_list)
+        """
+        getter = itemgetter(*(self.handle(name) for name in names))
+        return getter if len(names) > 1 else lambda op_list: (getter(op_list),)
+
     def update(self, sim, duration):
-        for operation in self.ops.values():
-            if operation.is_ready() and not operation.completed:
-                if operation.start_time is None:
-                    operation.start_time = sim.timer
-                operation.time_left -= duration
-                if operation.time_left + operation.delay * 60 <= 0:
-                    operation.completed = True
-                    operation.completion_time = sim.timer
-                    # print(f'{operation} operation completed at time {round(operation.completion_time)}!')
-        if all(op.completed for op in self.ops.values()):
+        # Only the active operations are visited; completing one releases its dependents by counting down their
+        # pending dependencies. Indices are visited in order, so released operations start in this same update.
+        op_list = self.op_list
+        offsets, dependents = self.graph.dependent_offsets, self.graph.dependent_indices
+        queue = self.active
+        self.active = []
+        while queue:
+            index = heapq.heappop(queue)
+            operation = op_list[index]
+            if operation.start_time is None:
+                operation.start_time = sim.timer
+            operation.time_left -= duration
+            if operation.time_left + operation.delay * 60 <= 0:
+                operation.completed = True
+                operation.completion_time = sim.timer
+                self.remaining -= 1
+                # print(f'{operation} operation completed at time {round(operation.completion_time)}!')
+                for dependent in dependents[offsets[index]:offsets[index + 1]]:
+                    op_list[dependent].pending -= 1
+                    if op_list[dependent].pending == 0:
+                        heapq.heappush(queue, dependent)
+            else:
+                self.active.append(index)
+        if self.remaining == 0:
             self.finished = True
 
-    def load_df(self, sim_type):
-        if sim_type.lower() == 'old':
-            df = pd.read_excel("data_manual.xlsx")
-        elif sim_type.lower() == 'new':
-            df = pd.read_excel("data_auto.xlsx")
-        else:
-            raise ValueError(f'Type must be either "old" or "new"')
+    def next_completion(self):
+        """
+        :return: simulated seconds until the next active operation completes, None if no operation is active
+        """
+        return min((self.op_list[i].time_left + self.op_list[i].delay * 60 for i in self.active), default=None)
+
+    def advance(self, sim):
+        """
+        Jumps sim.timer straight to the next completion, instead of stepping it by a fixed time. Operations released
+        by a completion start at that time, with their full duration left, like in timeline().
+        :return: simulated seconds advanced, None if no operation is active
+        """
+        op_list = self.op_list
+        offsets, dependents = self.graph.dependent_offsets, self.graph.dependent_indices
+        for index in self.active:
+            if op_list[index].start_time is None:
+                op_list[index].start_time = sim.timer
+        step = self.next_completion()
+        if step is None:
+            return None
+        step = max(step, 0)
+        sim.timer += step
+
+        queue = self.active
+        self.active = []
+        for index in queue:
+            operation = op_list[index]
+            operation.time_left -= step
+            # Up to rounding, the operation the step was computed from has no time left
+            if operation.time_left + operation.delay * 60 <= 1e-9:
+                operation.completed = True
+                operation.completion_time = sim.timer
+                self.remaining -= 1
+                for dependent in dependents[offsets[index]:offsets[index + 1]]:
+                    op_list[dependent].pending -= 1
+                    if op_list[dependent].pending == 0:
+                        self.active.append(dependent)
+            else:
+                self.active.append(index)
+        heapq.heapify(self.active)
+        if self.remaining == 0:
+            self.finished = True
+        return step
+
+    def timeline(self, start_time=0):
+        """
+        Computes the whole turnaround in a single pass over the dependency graph, without stepping time.
+        Each operation starts when its last dependency completes and takes its duration plus delay.
+        :param start_time: time at which the operations without dependencies start
+        :return: {operation name: (start time, completion time)}
+        """
+        offsets, dependencies = self.graph.dependency_offsets, self.graph.dependency_indices
+        completions = []
+        times = {}
+        for index, operation in enumerate(self.op_list):
+            start = max((completions[i] for i in dependencies[offsets[index]:offsets[index + 1]]), default=start_time)
+            completions.append(start + max(0, operation.duration + operation.delay * 60))
+            times[operation.name] = (start, completions[index])
+        return times
+
+    def critical_path(self, timeline=None):
+        """
+        :param timeline: result of timeline(), computed if not given
+        :return: names of the chain of operations that determines the turnaround completion, in order
+        """
+        if timeline is None:
+            timeline = self.timeline()
+        operation = max(self.op_list, key=lambda op: timeline[op.name][1])
+        path = [operation.name]
+        while self.dependency_count(operation.index):
+            operation = max(self.dependencies(operation.index), key=lambda dep: timeline[dep.name][1])
+            path.append(operation.name)
+        path.reverse()
+        return path
 
-        self.ops = {}
-        dep_count = 6
-        for index, row in df.iterrows():  # for each operation:
-            operation = Operation(row.iloc[0], row.iloc[1] * 60, round(row.iloc[dep_count + 6]))
-            for dep in row.iloc[2:dep_count + 2]:
-                if pd.notna(dep):
-                    operation.add_dependency(self.ops[dep])
-            for i in range(2):
-                if pd.notna(row.iloc[2 * i + dep_count + 2]) and pd.notna(row.iloc[2 * i + dep_count + 3]):
-                    operation.locations.append((row.iloc[2 * i + dep_count + 2], row.iloc[2 * i + dep_count + 3]))
-            self.ops[row.iloc[0]] = operation
+    def load_df(self, sim_type):
+        scenario = load_scenario(sim_type)
+        self.graph = scenario['graph']
+        self.op_list = [Operation(name, scenario['durations'][index] * 60, scenario['delays'][index], index,
+                                  self.graph.dependency_counts[index], scenario['locations'][index])
+                        for index, name in enumerate(scenario['names'])]
+        self.start()
+        self.previous = sim_type
 
 
 class Simulation:
-    def __init__(self):
-        pg.init()
-        pg.display.set_caption("ApronSim")
-        # monitors = screeninfo.get_monitors() # TODO: make it better for different monitor types
-        self.screen = pg.display.set_mode((1920, 1080), pg.NOFRAME, pg.HWSURFACE,
-                                          display=min(pg.display.get_num_displays() - 1, 1))
-
-        self.images, self.rects = load_assets()
-        self.scheduler = Scheduler('Old')
+    def __init__(self, headless=False, new_sim=False, seed=None, batched_kinematics=False, dynamic_obstacles=False,
+                 lattice=False, profile=False):
+        self.headless = headless
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        if headless:  # No window, nothing is drawn
+            self.screen = None
+            self.images, self.rects = {}, {}
+        else:
+            pg.init()
+            pg.display.set_caption("ApronSim")
+            # monitors = screeninfo.get_monitors() # TODO: make it better for different monitor types
+            self.screen = pg.display.set_mode((1920, 1080), pg.NOFRAME, pg.HWSURFACE,
+                                              display=min(pg.display.get_num_displays() - 1, 1))
+            self.images, self.rects = load_assets()
+
+        self.new_sim = new_sim
+        self.scheduler = Scheduler('New' if new_sim else 'Old')
         self.timer = -self.scheduler.ops['Parking'].duration
-        self.speed_limit = 32
+        self.max_step = 0.5  # Longest simulated time of a single physics step, in seconds
+        self.max_sub_steps = 200  # Most physics steps per frame, before the simulation falls behind its speed
+        self.lagging = False
         self.fps = 0
         self.speed = 1
         self.paused = False
@@ -128,8 +304,11 @@ class Simulation:
         self.blit_paths = False
         self.blit_mesh = False
         self.blit_coord = False
-        self.new_sim = False
+        self.blit_profile = profile
         self.last_frame = time.perf_counter()
+        # Optionally time the sections of every frame, see Profiler
+        self.profiler = Profiler(enabled=profile)
+        self.profiler.add_counter('path expansions', lambda: search_stats.expansions)
 
         self.button_menu = Button(" ", (0, 0), (30, 30), callback=self.button_menu_action, color=(0, 0, 0))
         self.button_speed_decrease = Button("-", (200, 70), (20, 20), callback=self.button_speed_decrease_action,
@@ -161,176 +340,176 @@ class Simulation:
                         self.button_sim_type, self.button_sim_type_2, self.button_paths, self.button_mesh]
         self.buttons.extend(self.delay_buttons)
 
-        self.mesh = display_mesh.to_numpy()
+        self.mesh = load_mesh('Mesh_4')
 
         self.vehicles = []
         self.create_vehicles()
-        self.employees = [f'Employee_{random.randint(1, 4)}' for _ in range(5)]
-
-        self.mesh_surface = pg.Surface((1920, 1080), pg.SRCALPHA)
-        for y, row in enumerate(self.mesh):
-            if 19 < y < 128:
-                for x, cell in enumerate(row):
-                    rect_surface = pg.Surface((10, 10), pg.SRCALPHA)
-                    if cell == 0:
-                        rect_surface.fill(pg.Color(255, 100, 100, 100))
-                    else:
-                        rect_surface.fill(pg.Color(100, 255, 100, 100))
-                    self.mesh_surface.blit(rect_surface, (x * 10, (y - 20) * 10))
-
-        self.belt_front = Belt('Front')
-        self.belt_rear = Belt('Rear')
+        self.traffic = SpatialGrid(cell_size=400)  # Moving vehicles and their trailers, for proximity checks
+        # Optionally move all vehicles in one vectorised step, see KinematicsEngine
+        self.kinematics = KinematicsEngine() if batched_kinematics else None
+        if self.kinematics is not None:
+            self.kinematics.attach(self.vehicles)
+        # Optionally plan around parked vehicles and repair paths when they get blocked, see OccupancyLayer
+        self.occupancy = OccupancyLayer(self.mesh.shape) if dynamic_obstacles else None
+        self.lattice = lattice  # Plan with the motion primitives of the vehicle classes where possible, see lattice.plan
+        self.employees = [f'Employee_{self.rng.integers(1, 5)}' for _ in range(5)]
+
+        self.overlay_mesh = 'Mesh_4'  # Mesh shown by the access map, see mesh_overlay
+        self.path_overlays = {}  # {id(vehicle): (vehicle, path, overlay, top left)}, see path_overlay
+        self.operation_getters = {}  # {names: (op_list, getter)}, see operations
+
+        self.belt_front = Belt('Front', self.rng)
+        self.belt_rear = Belt('Rear', self.rng)
+
+        # Layers and panels drawn every frame, allocated once, see draw
+        self.background_surface = None
+        self.background_key = None
+        self.panels = {}
+        if not headless:
+            self.background_surface = pg.Surface((1920, 1080)).convert()
+            for name, size in [('side', (250, 1080)), ('options', (180, 170)), ('lagging', (556, 60)),
+                               ('menu', (320, 600)), ('bottom', (320, 60))]:
+                self.panels[name] = pg.Surface(size, pg.SRCALPHA)
+                self.panels[name].fill(pg.Color(0, 0, 0, 150))
+            self.panels['path_cell'] = pg.Surface((10, 10), pg.SRCALPHA)
+            self.panels['path_cell'].fill(pg.Color(100, 100, 255, 150))
+        self.dirty_rects = []  # Areas drawn this frame that change every frame
+        self.last_dirty_rects = []
+        self.drawn = {}  # {key: (image, area)} drawn this frame, see blit
+        self.last_drawn = {}
+        self.display_state = None
+        self.full_update = True
 
     def draw(self):
-        self.screen.fill('Black')
-        self.screen.blit(self.images['apron'], self.rects['apron'])
-
-        # Old Sim: Cones, GPU, PCA
-        if not self.new_sim:
-            if self.scheduler.ops['Connect_GPU'].completed and not self.scheduler.ops['Remove_GPU'].completed:
-                self.screen.blit(self.images['GPU_cable'], (889, 943))
-            if self.scheduler.ops['Place_Cones'].completed and not self.scheduler.ops['Remove_Cones'].completed:
-                self.screen.blit(self.images['Cone'], (535, 455))
-                self.screen.blit(self.images['Cone'], (1375, 455))
-                self.screen.blit(self.images['Cone'], (835, 700))
-                self.screen.blit(self.images['Cone'], (1075, 700))
-            if self.scheduler.ops['Connect_PCA'].completed and not self.scheduler.ops['Remove_PCA'].completed:
-                self.screen.blit(self.images['PCA_tube'], (965, 660))
-            if self.scheduler.ops['Connect_LDL_Front'].completed and not self.scheduler.ops['Load_Front'].completed:
-                draw_rotated(self.images[self.employees[0]], (800, 775), 90, self.screen)
-                draw_rotated(self.images[self.employees[1]], (850, 870), -135, self.screen)
-            if self.scheduler.ops['Connect_LDL_Rear'].completed and not self.scheduler.ops['Load_Rear'].completed:
-                draw_rotated(self.images[self.employees[2]], (800, 285), 90, self.screen)
-                draw_rotated(self.images[self.employees[3]], (850, 375), -135, self.screen)
-            if self.scheduler.ops['Refuel_Prep'].completed and not self.scheduler.ops['Refuel_Finalising'].completed:
-                draw_rotated(self.images[self.employees[4]], (625, 585), 40, self.screen)
-        # New Sim: Rail chocks, Baggage Pit, GPU & PCA cables
-        else:
-            self.screen.blit(self.images['Rail_chock'], (865, 481))
-            self.screen.blit(self.images['Rail_chock'], (1043, 481))
-            self.screen.blit(self.images['Rail_chock'], (942, 871))
-
-            if self.scheduler.ops['Connect_LDL_Rear'].start_time is not None and not self.scheduler.ops['Remove_LDL_Rear'].completed:
-                if self.scheduler.ops['Offload_Rear'].start_time is not None and not self.scheduler.ops['Load_Rear'].completed:
-                    self.screen.blit(self.images['Baggage_pit_extended'], (769, 314))
-                elif self.scheduler.ops["Remove_LDL_Rear"].start_time is not None:
-                    time_passed = self.timer - self.scheduler.ops["Remove_LDL_Rear"].start_time
+        profiler = self.profiler
+        (parking, pushback, attach_tug, connect_bridge, flight_closure, refuel_prep, refuel_finalising,
+         connect_ldl_front, connect_ldl_rear, offload_front, offload_rear, load_front, load_rear, remove_ldl_front,
+         remove_ldl_rear) = self.operations(DRAWN_OPERATIONS)
+        profiler.begin('draw.stand')
+        self.screen.blit(self.background(), (0, 0))
+
+        # New Sim: Baggage Pit, GPU & PCA cables
+        if self.new_sim:
+            if connect_ldl_rear.start_time is not None and not remove_ldl_rear.completed:
+                if offload_rear.start_time is not None and not load_rear.completed:
+                    self.blit(self.images['Baggage_pit_extended'], (769, 314), 'pit_rear_extended')
+                elif remove_ldl_rear.start_time is not None:
+                    time_passed = self.timer - remove_ldl_rear.start_time
                     if time_passed > 0:
-                        self.screen.blit(self.images['Baggage_pit_extended'], (
-                            max(769 - (((769 - 625) / self.scheduler.ops["Remove_LDL_Rear"].duration) * time_passed), 625),
-                            314))
+                        self.blit(self.images['Baggage_pit_extended'], (
+                            max(769 - (((769 - 625) / remove_ldl_rear.duration) * time_passed), 625),
+                            314), 'pit_rear_extended')
                     else:
-                        self.screen.blit(self.images['Baggage_pit_extended'], (769, 314))
+                        self.blit(self.images['Baggage_pit_extended'], (769, 314), 'pit_rear_extended')
                 else:
-                    time_passed = self.timer - self.scheduler.ops["Connect_LDL_Rear"].start_time
-                    self.screen.blit(self.images['Baggage_pit_extended'], (
-                        min(625 + (((769 - 625) / self.scheduler.ops["Connect_LDL_Rear"].duration) * time_passed), 769),
-                        314))
+                    time_passed = self.timer - connect_ldl_rear.start_time
+                    self.blit(self.images['Baggage_pit_extended'], (
+                        min(625 + (((769 - 625) / connect_ldl_rear.duration) * time_passed), 769),
+                        314), 'pit_rear_extended')
 
-                self.screen.blit(self.images['Baggage_pit_open'], (712, 300))
+                self.blit(self.images['Baggage_pit_open'], (712, 300), 'pit_rear')
             else:
-                self.screen.blit(self.images['Baggage_pit'], (712, 300))
+                self.blit(self.images['Baggage_pit'], (712, 300), 'pit_rear')
 
-            if self.scheduler.ops['Connect_LDL_Front'].start_time is not None and not self.scheduler.ops['Remove_LDL_Front'].completed:
-                if self.scheduler.ops['Offload_Front'].start_time is not None and not self.scheduler.ops['Load_Front'].completed:
-                    self.screen.blit(self.images['Baggage_pit_extended'], (769, 815))
-                elif self.scheduler.ops["Remove_LDL_Rear"].start_time is not None:
-                    time_passed = self.timer - self.scheduler.ops["Remove_LDL_Front"].start_time
+            if connect_ldl_front.start_time is not None and not remove_ldl_front.completed:
+                if offload_front.start_time is not None and not load_front.completed:
+                    self.blit(self.images['Baggage_pit_extended'], (769, 815), 'pit_front_extended')
+                elif remove_ldl_rear.start_time is not None:
+                    time_passed = self.timer - remove_ldl_front.start_time
                     if time_passed > 0:
-                        self.screen.blit(self.images['Baggage_pit_extended'], (
-                            max(769 - (((769 - 625) / self.scheduler.ops["Remove_LDL_Front"].duration) * time_passed), 625),
-                            815))
+                        self.blit(self.images['Baggage_pit_extended'], (
+                            max(769 - (((769 - 625) / remove_ldl_front.duration) * time_passed), 625),
+                            815), 'pit_front_extended')
                     else:
-                        self.screen.blit(self.images['Baggage_pit_extended'], (769, 815))
+                        self.blit(self.images['Baggage_pit_extended'], (769, 815), 'pit_front_extended')
 
                 else:
-                    time_passed = self.timer - self.scheduler.ops["Connect_LDL_Front"].start_time
-                    self.screen.blit(self.images['Baggage_pit_extended'], (
-                        min(625 + (((769 - 625) / self.scheduler.ops["Connect_LDL_Front"].duration) * time_passed),
+                    time_passed = self.timer - connect_ldl_front.start_time
+                    self.blit(self.images['Baggage_pit_extended'], (
+                        min(625 + (((769 - 625) / connect_ldl_front.duration) * time_passed),
                             769),
-                        815))
+                        815), 'pit_front_extended')
 
-                self.screen.blit(self.images['Baggage_pit_open'], (712, 801))
+                self.blit(self.images['Baggage_pit_open'], (712, 801), 'pit_front')
             else:
-                self.screen.blit(self.images['Baggage_pit'], (712, 801))
+                self.blit(self.images['Baggage_pit'], (712, 801), 'pit_front')
 
-            pg.draw.line(self.screen, (255, 233, 38), (1238, 767), self.vehicles[0].location, width=10)
-            pg.draw.line(self.screen, (255, 233, 38), (890, 1005), self.vehicles[1].location, width=3)
+            self.dirty_rects.append(pg.draw.line(self.screen, (255, 233, 38), (1238, 767), self.vehicles[0].location,
+                                                 width=10))
+            self.dirty_rects.append(pg.draw.line(self.screen, (255, 233, 38), (890, 1005), self.vehicles[1].location,
+                                                 width=3))
+        profiler.end()
 
+        profiler.begin('draw.vehicles')
         if self.new_sim:
-            self.belt_front.draw(self.screen)
-            self.belt_rear.draw(self.screen)
+            self.dirty_rects.extend(self.belt_front.draw(self.screen))
+            self.dirty_rects.extend(self.belt_rear.draw(self.screen))
             self.screen.blit(self.images['Baggage_pit_cover_rear'], (620, 301))
             self.screen.blit(self.images['Baggage_pit_cover_front'], (620, 802))
             for vehicle in self.vehicles:
-                vehicle.draw(self.screen)
+                self.dirty_rects.extend(vehicle.draw(self.screen))
         else:
             for vehicle in self.vehicles:
-                vehicle.draw(self.screen)
-            self.belt_front.draw(self.screen)
-            self.belt_rear.draw(self.screen)
+                self.dirty_rects.extend(vehicle.draw(self.screen))
+            self.dirty_rects.extend(self.belt_front.draw(self.screen))
+            self.dirty_rects.extend(self.belt_rear.draw(self.screen))
+        profiler.end()
 
+        profiler.begin('draw.aircraft')
         # PCA and GPU Units
         self.screen.blit(self.images['PCA_unit'], (1237, 750))
         self.screen.blit(self.images['GPU'], (850, 990))
 
         # Hydrant piping
-        if self.scheduler.ops['Refuel_Prep'].completed and not self.scheduler.ops['Refuel_Finalising'].completed:
-            self.screen.blit(self.images['Hydrant_pipes'], (588, 561))
+        if refuel_prep.completed and not refuel_finalising.completed:
+            self.blit(self.images['Hydrant_pipes'], (588, 561), 'hydrant_pipes')
 
         # Pushback Tug rendering
-        if self.new_sim:
-            if self.scheduler.ops["Pushback"].is_ready():
-                self.screen.blit(self.images['Taxibot'],
-                                 (909, 869 - (20 / (self.scheduler.ops["Pushback"].duration / 60)) * (
-                                         self.timer - self.scheduler.ops["Pushback"].start_time)))
-            elif self.scheduler.ops["Attach_Tug"].is_ready():
-                self.screen.blit(self.images['Taxibot'], (909, 869))
-        else:
-            if self.scheduler.ops["Pushback"].is_ready():
-                self.screen.blit(self.images['Tug'],
-                                 (909, 869 - (20 / (self.scheduler.ops["Pushback"].duration / 60)) * (
-                                         self.timer - self.scheduler.ops["Pushback"].start_time)))
-            elif self.scheduler.ops["Attach_Tug"].is_ready():
-                self.screen.blit(self.images['Tug'], (909, 869))
+        tug = self.images['Taxibot'] if self.new_sim else self.images['Tug']
+        if pushback.is_ready():
+            self.blit(tug, (909, 869 - (20 / (pushback.duration / 60)) * (
+                    self.timer - pushback.start_time)), 'tug')
+        elif attach_tug.is_ready():
+            self.blit(tug, (909, 869), 'tug')
 
         # Aircraft rendering
-        if not self.scheduler.ops["Parking"].completed:
-            self.screen.blit(self.images['737s'], (513, min(17 - 1020 + 17 * (
-                    self.timer + self.scheduler.ops['Parking'].duration), 17)))  # 17 pixels per second
-        elif self.scheduler.ops["Pushback"].is_ready():
-            self.screen.blit(self.images['737s'], (513, 17 - (20 / (self.scheduler.ops["Pushback"].duration / 60)) * (
-                    self.timer - self.scheduler.ops["Pushback"].start_time)))
+        if not parking.completed:
+            self.blit(self.images['737s'], (513, min(17 - 1020 + 17 * (
+                    self.timer + parking.duration), 17)), 'aircraft')  # 17 pixels per second
+        elif pushback.is_ready():
+            self.blit(self.images['737s'], (513, 17 - (20 / (pushback.duration / 60)) * (
+                    self.timer - pushback.start_time)), 'aircraft')
         else:
-            self.screen.blit(self.images['737s'], (513, 17))
+            self.blit(self.images['737s'], (513, 17), 'aircraft')
 
         # Bridge rendering
         self.screen.blit(self.images['Bridge_1'], (1330, 924))
-        if self.scheduler.ops["Connect_Bridge"].start_time is None or self.scheduler.ops["Flight_Closure"].completed:
-            self.screen.blit(self.images['Bridge_2'], (1233, 896))
-        elif self.scheduler.ops["Connect_Bridge"].completed and self.scheduler.ops["Flight_Closure"].start_time is None:
-            self.screen.blit(self.images['Bridge_2'], (987, 854))
-        elif self.scheduler.ops["Flight_Closure"].start_time is not None:
-            removing_bridge_time = self.timer - self.scheduler.ops["Flight_Closure"].start_time
-            self.screen.blit(self.images['Bridge_2'], (
-                min(987 + (((1233 - 987) / self.scheduler.ops["Flight_Closure"].duration) * removing_bridge_time),
+        if connect_bridge.start_time is None or flight_closure.completed:
+            self.blit(self.images['Bridge_2'], (1233, 896), 'bridge')
+        elif connect_bridge.completed and flight_closure.start_time is None:
+            self.blit(self.images['Bridge_2'], (987, 854), 'bridge')
+        elif flight_closure.start_time is not None:
+            removing_bridge_time = self.timer - flight_closure.start_time
+            self.blit(self.images['Bridge_2'], (
+                min(987 + (((1233 - 987) / flight_closure.duration) * removing_bridge_time),
                     1233),
-                min(854 + (((896 - 854) / self.scheduler.ops["Flight_Closure"].duration) * removing_bridge_time), 896)))
+                min(854 + (((896 - 854) / flight_closure.duration) * removing_bridge_time), 896)), 'bridge')
         else:
-            time_passed = self.timer - self.scheduler.ops["Connect_Bridge"].start_time
-            self.screen.blit(self.images['Bridge_2'], (
-                max(1233 - (((1233 - 987) / self.scheduler.ops["Connect_Bridge"].duration) * time_passed),
+            time_passed = self.timer - connect_bridge.start_time
+            self.blit(self.images['Bridge_2'], (
+                max(1233 - (((1233 - 987) / connect_bridge.duration) * time_passed),
                     987),
-                max(896 - (((896 - 854) / self.scheduler.ops["Connect_Bridge"].duration) * time_passed),
-                    854)))
+                max(896 - (((896 - 854) / connect_bridge.duration) * time_passed),
+                    854)), 'bridge')
 
-        rect_surface = pg.Surface((250, 1080), pg.SRCALPHA)
-        rect_surface.fill(pg.Color(0, 0, 0, 150))
-        self.screen.blit(rect_surface, (0, 0))
+        profiler.end()
+
+        profiler.begin('draw.panel')
+        self.screen.blit(self.panels['side'], (0, 0))
 
         # Operations list + red dots rendering
         operation_count = -1
-        for i, operation in enumerate(self.scheduler.ops.values()):
+        for i, operation in enumerate(self.scheduler.op_list):
             string = operation.name.replace('_', ' ')
             if operation.completed:
                 colour = (100, 255, 100)
@@ -340,19 +519,20 @@ class Simulation:
                 colour = (255, 255, 100)
             else:
                 colour = white
-            self.screen.blit(small_font.render(string, True, colour), (10, op_list_start - 2 + i * op_list_margin))
+            self.blit(render_text(get_font('small'), string, colour), (10, op_list_start - 2 + i * op_list_margin),
+                      ('operation', i))
 
             # Delay
-            self.screen.blit(small_font.render(str(operation.delay), True, colour),
-                             (175, op_list_start - 2 + i * op_list_margin))
+            self.blit(render_text(get_font('small'), str(operation.delay), colour),
+                      (175, op_list_start - 2 + i * op_list_margin), ('delay', i))
 
             # Render operation on vop circle + name
             if operation.is_ready() and not operation.completed:
                 operation_count += 1
                 for op_loc_i in range(len(operation.locations)):
-                    pg.draw.circle(self.screen, (255, 0, 0), operation.locations[op_loc_i], 10)
-                    self.screen.blit(small_font.render(string, True, (0, 0, 0)),
-                                     (operation.locations[op_loc_i][0], operation.locations[op_loc_i][1] + 10))
+                    self.dirty_rects.append(pg.draw.circle(self.screen, (255, 0, 0), operation.locations[op_loc_i], 10))
+                    self.blit(render_text(get_font('small'), string, (0, 0, 0)),
+                              (operation.locations[op_loc_i][0], operation.locations[op_loc_i][1] + 10))
 
         # Menu button
         self.button_menu.draw(self.screen)
@@ -361,22 +541,22 @@ class Simulation:
         pg.draw.circle(self.screen, white, (15, 22), 2)
 
         # Option buttons
-        rect_surface = pg.Surface((180, 170), pg.SRCALPHA)
-        rect_surface.fill(pg.Color(0, 0, 0, 150))
-        self.screen.blit(rect_surface, (1740, 0))
-        self.screen.blit(medium_font.render(f'Pathing', True, white),
-                         (1830 - medium_font.size('Pathing')[0] / 2, 5))
+        self.screen.blit(self.panels['options'], (1740, 0))
+        self.screen.blit(render_text(get_font('medium'), 'Pathing', white),
+                         (1830 - get_font('medium').size('Pathing')[0] / 2, 5))
         self.button_paths.draw(self.screen, self.blit_paths)
-        self.screen.blit(medium_font.render(f'Access Map', True, white),
-                         (1830 - medium_font.size('Access Map')[0] / 2, 85))
+        self.screen.blit(render_text(get_font('medium'), 'Access Map', white),
+                         (1830 - get_font('medium').size('Access Map')[0] / 2, 85))
         self.button_mesh.draw(self.screen, self.blit_mesh)
+        mesh_label = render_text(get_font('small'), self.overlay_mesh.replace('_', ' '), white)
+        self.blit(mesh_label, (1830 - mesh_label.get_width() / 2, 148), 'overlay_mesh')
 
         # Speed buttons
         self.button_speed_decrease.draw(self.screen)
         self.button_speed_increase.draw(self.screen)
 
         # Delay buttons
-        self.screen.blit(medium_font.render(f'Delays:', True, white), (10, 120))
+        self.screen.blit(render_text(get_font('medium'), 'Delays:', white), (10, 120))
         for button in self.delay_buttons:
             button.draw(self.screen)
         self.button_reset_delays.draw(self.screen)
@@ -386,31 +566,26 @@ class Simulation:
 
         sign = '+' if time_left < 0 else '-'
         minutes = abs(int(time_left / 60))
-        self.screen.blit(large_font.render(f'{sign}{minutes:02}', True, white), (67 if time_left < 0 else 75, 10))
+        self.blit(render_text(get_font('large'), f'{sign}{minutes:02}', white), (67 if time_left < 0 else 75, 10),
+                  'minutes')
 
         # Clock rendering - Seconds
         seconds = int(60 - time_left % 60) if time_left < 0 else int(time_left % 60)
-        self.screen.blit(large_font.render(f':{seconds:02}', True, white), (123, 10))
+        self.blit(render_text(get_font('large'), f':{seconds:02}', white), (123, 10), 'seconds')
 
         # Speed
-        self.screen.blit(medium_font.render(f'Speed: {self.speed}x', True, white), (10, 60))
+        self.blit(render_text(get_font('medium'), f'Speed: {self.speed}x', white), (10, 60), 'speed')
 
         # FPS Counter
-        self.screen.blit(small_font.render(f'fps: {int(self.fps)}', True, white), (190, 10))
+        self.blit(render_text(get_font('small'), f'fps: {int(self.fps)}', white), (190, 10), 'fps')
+        profiler.end()
 
+        profiler.begin('draw.overlays')
         # Pathfinding overlay
         if self.blit_paths:
             for vehicle in self.vehicles:
                 if len(vehicle.path) > 0:
-                    for i, coord in enumerate(vehicle.path):
-                        rect_surface = pg.Surface((10, 10), pg.SRCALPHA)
-                        rect_surface.fill(pg.Color(100, 100, 255, 150))
-                        self.screen.blit(rect_surface, (coord[0] - 5, coord[1] - 5))
-                        if i < len(vehicle.path) - 1:
-                            start = (vehicle.path[i][0], vehicle.path[i][1])
-                            end = (vehicle.path[i + 1][0], vehicle.path[i + 1][1])
-                            pg.draw.line(self.screen, black, start, end, width=2)
-
+                    self.screen.blit(*self.path_overlay(vehicle))
                     pg.draw.line(self.screen, (100, 100, 255), vehicle.location, vehicle.path[0], width=2)
                     pg.draw.circle(self.screen, (0, 255, 255), vehicle.gate_center, 5)
                     pg.draw.line(self.screen, white,
@@ -420,37 +595,45 @@ class Simulation:
 
         # Mesh overlay
         if self.blit_mesh:
-            self.screen.blit(self.mesh_surface, (0, 0))
+            self.screen.blit(mesh_overlay(self.overlay_mesh), (0, 0))
 
         # Coord debugging
         if self.blit_coord:
             coords = pg.mouse.get_pos()
-            self.screen.blit(small_font.render(str(coords), True, white), (coords[0] + 5, coords[1] + 5))
-            self.screen.blit(small_font.render(str((int(coords[1] / 10) + 20, int(coords[0] / 10))), True, white),
+            font = get_font('small')
+            self.screen.blit(font.render(str(coords), True, white), (coords[0] + 5, coords[1] + 5))
+            self.screen.blit(font.render(str((int(coords[1] / 10) + 20, int(coords[0] / 10))), True, white),
                              (coords[0] + 5, coords[1] + 25))
 
+        # Profiler overlay
+        if self.blit_profile and profiler.enabled:
+            lines = profiler.overlay_lines()
+            rect_surface = pg.Surface((420, 20 * len(lines) + 10), pg.SRCALPHA)
+            rect_surface.fill(pg.Color(0, 0, 0, 150))
+            self.dirty_rects.append(self.screen.blit(rect_surface, (1500, 180)))
+            for i, line in enumerate(lines):
+                self.screen.blit(get_font('mono').render(line, True, white), (1505, 185 + i * 20))
+        profiler.end()
+
+        profiler.begin('draw.menus')
         # Paused Pop-Up
         if self.paused and not self.pause_menu:
             pg.draw.rect(self.screen, black, pg.Rect(816, 0, 288, 60))
-            self.screen.blit(large_font.render(f'Simulation Paused', True, white), (826, 10))
-        elif self.speed > self.speed_limit:
-            rect_surface = pg.Surface((556, 60), pg.SRCALPHA)
-            rect_surface.fill(pg.Color(0, 0, 0, 150))
-            self.screen.blit(rect_surface, (682, 0))
-            self.screen.blit(large_font.render(f'Warning: Skipping Vehicle Movement', True, white), (692, 10))
+            self.screen.blit(render_text(get_font('large'), 'Simulation Paused', white), (826, 10))
+        elif self.lagging:
+            self.screen.blit(self.panels['lagging'], (682, 0))
+            self.screen.blit(render_text(get_font('large'), 'Warning: Simulation Falling Behind', white), (692, 10))
 
         # Pause Menu
         if self.pause_menu or self.scheduler.finished:
-            rect_surface = pg.Surface((320, 600), pg.SRCALPHA)
-            rect_surface.fill(pg.Color(0, 0, 0, 150))
-            self.screen.blit(rect_surface, (800, 200))
+            self.screen.blit(self.panels['menu'], (800, 200))
 
             if self.scheduler.finished:
-                self.screen.blit(large_font.render(f'Simulation Finished', True, white),
-                                 (960 - large_font.size('Simulation Finished')[0] / 2, 220))
+                self.screen.blit(render_text(get_font('large'), 'Simulation Finished', white),
+                                 (960 - get_font('large').size('Simulation Finished')[0] / 2, 220))
             else:
-                self.screen.blit(large_font.render(f'Simulation Paused', True, white),
-                                 (960 - large_font.size('Simulation Paused')[0] / 2, 220))
+                self.screen.blit(render_text(get_font('large'), 'Simulation Paused', white),
+                                 (960 - get_font('large').size('Simulation Paused')[0] / 2, 220))
                 self.button_resume.draw(self.screen)
 
             self.button_restart.draw(self.screen)
@@ -458,14 +641,137 @@ class Simulation:
             self.button_sim_type.draw(self.screen, self.new_sim)
 
         else:
-            rect_surface = pg.Surface((320, 60), pg.SRCALPHA)
-            rect_surface.fill(pg.Color(0, 0, 0, 150))
-            self.screen.blit(rect_surface, (800, 1020))
+            self.screen.blit(self.panels['bottom'], (800, 1020))
             self.button_sim_type_2.draw(self.screen, self.new_sim)
-        pg.display.flip()
+        profiler.end()
+
+        with profiler.section('display.update'):
+            self.update_display()
+
+    def path_overlay(self, vehicle):
+        """
+        :return: (surface, top left) with the waypoints and segments of the vehicle's path, drawn again only once
+                 the vehicle has a new path or passed a waypoint
+        """
+        entry = self.path_overlays.get(id(vehicle))
+        if entry is None or entry[0] is not vehicle or entry[1] is not vehicle.path:
+            xs = [coord[0] for coord in vehicle.path]
+            ys = [coord[1] for coord in vehicle.path]
+            left, top = int(min(xs)) - 6, int(min(ys)) - 6
+            overlay = pg.Surface((int(max(xs)) - left + 7, int(max(ys)) - top + 7), pg.SRCALPHA)
+            points = [(x - left, y - top) for x, y in vehicle.path]
+            for i, point in enumerate(points):
+                overlay.blit(self.panels['path_cell'], (point[0] - 5, point[1] - 5))
+                if i < len(points) - 1:
+                    pg.draw.line(overlay, black, point, points[i + 1], width=2)
+            overlay.set_alpha(255, pg.RLEACCEL)  # Mostly transparent, run length encoding skips the empty runs
+            entry = (vehicle, vehicle.path, overlay, (left, top))
+            self.path_overlays[id(vehicle)] = entry
+        return entry[2], entry[3]
+
+    def operations(self, names):
+        """
+        :param names: tuple of operation names
+        :return: tuple of the operations, read by integer handles that are resolved once per loaded scenario
+        """
+        op_list = self.scheduler.op_list
+        entry = self.operation_getters.get(names)
+        if entry is None or entry[0] is not op_list:
+            entry = (op_list, self.scheduler.getter(*names))
+            self.operation_getters[names] = entry
+        return entry[1](op_list)
+
+    def blit(self, image, position, key=None):
+        """
+        Blits onto the screen and records the area for the next display update. Without a key the area is updated
+        every frame, with a key only when the image or its position changed since the last frame.
+        :param key: name of the drawn element, unique within a frame
+        :return: the blitted area
+        """
+        rect = self.screen.blit(image, position)
+        if key is None:
+            self.dirty_rects.append(rect)
+        else:
+            self.drawn[key] = (image, rect)
+        return rect
+
+    def background(self):
+        """
+        :return: surface with the apron and the props drawn below the vehicles, redrawn only when the operations
+                 add or remove one
+        """
+        if self.new_sim:
+            key = (True,)
+        else:
+            (connect_gpu, remove_gpu, place_cones, remove_cones, connect_pca, remove_pca, connect_ldl_front, load_front,
+             connect_ldl_rear, load_rear, refuel_prep, refuel_finalising) = self.operations(PROP_OPERATIONS)
+            key = (False, tuple(self.employees),
+                   connect_gpu.completed and not remove_gpu.completed,
+                   place_cones.completed and not remove_cones.completed,
+                   connect_pca.completed and not remove_pca.completed,
+                   connect_ldl_front.completed and not load_front.completed,
+                   connect_ldl_rear.completed and not load_rear.completed,
+                   refuel_prep.completed and not refuel_finalising.completed)
+        if key == self.background_key:
+            return self.background_surface
+
+        surface = self.background_surface
+        surface.fill('Black')
+        surface.blit(self.images['apron'], self.rects['apron'])
+        # Old Sim: Cones, GPU, PCA
+        if not self.new_sim:
+            _, employees, gpu_cable, cones, pca_tube, ldl_front, ldl_rear, refuel = key
+            if gpu_cable:
+                surface.blit(self.images['GPU_cable'], (889, 943))
+            if cones:
+                surface.blit(self.images['Cone'], (535, 455))
+                surface.blit(self.images['Cone'], (1375, 455))
+                surface.blit(self.images['Cone'], (835, 700))
+                surface.blit(self.images['Cone'], (1075, 700))
+            if pca_tube:
+                surface.blit(self.images['PCA_tube'], (965, 660))
+            if ldl_front:
+                draw_rotated(self.images[employees[0]], (800, 775), 90, surface)
+                draw_rotated(self.images[employees[1]], (850, 870), -135, surface)
+            if ldl_rear:
+                draw_rotated(self.images[employees[2]], (800, 285), 90, surface)
+                draw_rotated(self.images[employees[3]], (850, 375), -135, surface)
+            if refuel:
+                draw_rotated(self.images[employees[4]], (625, 585), 40, surface)
+        # New Sim: Rail chocks
+        else:
+            surface.blit(self.images['Rail_chock'], (865, 481))
+            surface.blit(self.images['Rail_chock'], (1043, 481))
+            surface.blit(self.images['Rail_chock'], (942, 871))
+        self.background_key = key
+        self.full_update = True
+        return surface
+
+    def update_display(self):
+        """
+        Updates the window where the frame differs from the last one, or all of it after the layout changed.
+        """
+        rects = self.dirty_rects + self.last_dirty_rects
+        for key in self.drawn.keys() | self.last_drawn.keys():
+            drawn, last_drawn = self.drawn.get(key), self.last_drawn.get(key)
+            if drawn is None or last_drawn is None or drawn[0] is not last_drawn[0] or drawn[1] != last_drawn[1]:
+                rects.extend(entry[1] for entry in (drawn, last_drawn) if entry is not None)
+
+        # Overlays and menus cover large parts of the window, they are drawn in full
+        state = (self.paused, self.pause_menu, self.scheduler.finished, self.lagging, self.new_sim, self.blit_paths,
+                 self.blit_mesh, self.blit_coord)
+        if self.full_update or state != self.display_state or self.blit_paths or self.blit_mesh or self.blit_coord:
+            pg.display.flip()
+        else:
+            pg.display.update(rects)
+        self.full_update = False
+        self.display_state = state
+        self.last_dirty_rects, self.dirty_rects = self.dirty_rects, []
+        self.last_drawn, self.drawn = self.drawn, {}
 
     def event_handler(self):
         for event in pg.event.get():
+            self.full_update = True  # Buttons and menus react to every event
             if event.type == pg.QUIT:
                 self.running = False
             elif event.type == pg.KEYUP:
@@ -484,8 +790,12 @@ class Simulation:
                     self.blit_paths = not self.blit_paths
                 elif event.unicode == "m":
                     self.blit_mesh = not self.blit_mesh
+                elif event.unicode == "n":  # Next mesh for the access map
+                    self.next_overlay_mesh()
                 elif event.unicode == "c":
                     self.blit_coord = not self.blit_coord
+                elif event.unicode == "o":
+                    self.blit_profile = not self.blit_profile
             elif event.type == pg.MOUSEBUTTONUP or event.type == pg.MOUSEBUTTONDOWN or event.type == pg.MOUSEMOTION:
                 if event.type == pg.MOUSEMOTION:
                     if any([button.is_hovered for button in self.buttons]):
@@ -511,53 +821,78 @@ class Simulation:
                     self.button_sim_type_2.handle_event(event)
 
     def update(self, duration):
+        # Split the frame into equal physics steps of at most max_step, so movement stays accurate at high speeds
         time_step = duration * self.speed
+        sub_steps = max(1, math.ceil(time_step / self.max_step))
+        self.lagging = sub_steps > self.max_sub_steps
+        if self.lagging:  # Drop simulated time rather than accuracy
+            sub_steps = self.max_sub_steps
+            time_step = sub_steps * self.max_step
+        for _ in range(sub_steps):
+            self.step(time_step / sub_steps)
+
+    def step(self, time_step):
+        """
+        Advances the simulation by a fixed amount of simulated time, without drawing anything.
+        :param time_step: simulated seconds to advance
+        """
+        self.update_schedule(time_step)
+        if self.kinematics is not None:
+            with self.profiler.section('KinematicsEngine.step'):
+                self.kinematics.step([self], time_step)
+        else:
+            self.update_vehicles(time_step)
+        self.update_surroundings(time_step)
+
+    def update_schedule(self, time_step):
+        """
+        First part of step, before the vehicles move. A multi-stand Apron calls it per stand, then moves the vehicles
+        of all stands at once.
+        """
         self.timer += time_step
-        self.scheduler.update(self, time_step)
-        for vehicle in self.vehicles:
+        with self.profiler.section('Scheduler.update'):
+            self.scheduler.update(self, time_step)
+
+    def update_surroundings(self, time_step):
+        """
+        Last part of step, after the vehicles moved: path repairs around parked vehicles and the belts.
+        """
+        profiler = self.profiler
+        if self.occupancy is not None:
+            with profiler.section('repair_paths'):
+                self.repair_paths()
+        with profiler.section('Belt.update'):
+            self.update_belts(time_step)
+
+    def update_vehicles(self, time_step):
+        profiler = self.profiler
+        for number, vehicle in enumerate(self.vehicles):
             if not vehicle.departed:
+                if profiler.enabled:  # Vehicles of the same type share a name
+                    profiler.begin(f'Vehicle.update {vehicle.name} {number}')
                 vehicle.update(time_step, self)
+                profiler.end()
+                # Only vehicles with a path can make others wait, parked ones stay out of the grid
+                if vehicle.path:
+                    self.traffic.update(vehicle)
+                elif vehicle in self.traffic:
+                    self.traffic.remove(vehicle)
+
+    def repair_paths(self):
+        """
+        Stamps the parked vehicles onto the occupancy layer, and lets the moving vehicles repair their paths.
+        """
+        cells = self.occupancy.update(self.vehicles)
+        if cells:
+            for vehicle in self.vehicles:
+                if vehicle.path and vehicle.grid_path:
+                    vehicle.repair_path(cells, self)
 
+    def update_belts(self, time_step):
         self.belt_front.update(time_step, self)
         self.belt_rear.update(time_step, self)
-
-        if self.scheduler.ops['Connect_LDL_Front'].completed and self.scheduler.ops['Remove_LDL_Front'].start_time is None:
-            if self.scheduler.ops['Offload_Front'].start_time is not None and not self.scheduler.ops['Offload_Front'].completed:
-                new_front_status = 'Unload'
-            elif self.scheduler.ops['Load_Front'].start_time is not None and self.scheduler.ops['Load_Front'].time_left > 30:
-                new_front_status = 'Load'
-            else:
-                new_front_status = None
-        else:
-            new_front_status = None
-        if self.scheduler.ops['Connect_LDL_Rear'].completed and self.scheduler.ops['Remove_LDL_Rear'].start_time is None:
-            if self.scheduler.ops['Offload_Rear'].start_time is not None and not self.scheduler.ops['Offload_Rear'].completed:
-                new_rear_status = 'Unload'
-            elif self.scheduler.ops['Load_Rear'].start_time is not None and self.scheduler.ops['Load_Rear'].time_left > 30:
-                new_rear_status = 'Load'
-            else:
-                new_rear_status = None
-        else:
-            new_rear_status = None
-
-        if new_front_status != self.belt_front.status:
-            if self.belt_front.bags:
-                if not self.belt_front.status.startswith('Finish'):
-                    self.belt_front.status = 'Finish_' + self.belt_front.status
-            elif self.belt_front.delay_counter > 0:
-                self.belt_front.delay_counter -= time_step
-            else:
-                self.belt_front.status = new_front_status
-                self.belt_front.delay_counter = 150
-        if new_rear_status != self.belt_rear.status:
-            if self.belt_rear.bags:
-                if not self.belt_rear.status.startswith('Finish'):
-                    self.belt_rear.status = 'Finish_' + self.belt_rear.status
-            elif self.belt_rear.delay_counter > 0:
-                self.belt_rear.delay_counter -= time_step
-            else:
-                self.belt_rear.status = new_rear_status
-                self.belt_rear.delay_counter = 150
+        self.belt_front.update_status(self.scheduler, time_step)
+        self.belt_rear.update_status(self.scheduler, time_step)
 
     def run(self):
         print("Running...")
@@ -566,29 +901,65 @@ class Simulation:
         fps_update_time = 0
 
         while self.running:
-            self.draw()
-            self.event_handler()
+            self.profiler.begin_frame()
+            with self.profiler.section('draw'):
+                self.draw()
+            with self.profiler.section('event_handler'):
+                self.event_handler()
 
             current_time = time.perf_counter()
             frame_duration = current_time - self.last_frame
             self.last_frame = current_time
 
             if not self.paused and not self.pause_menu and not self.scheduler.finished:
-                self.update(frame_duration)
+                with self.profiler.section('update'):
+                    self.update(frame_duration)
 
             fps_list.append(1 / frame_duration)
             fps_update_time += frame_duration
             if fps_update_time >= 0.5:
                 self.fps = int(sum(fps_list) / len(fps_list))
-                self.speed_limit = self.fps / 2  # Makes sure there are always two updates per simulated second
                 fps_list = []
                 fps_update_time = 0
+            self.profiler.end_frame()
             if self.restart:
                 print(f'\n Restarting...')
                 self.reset()
+        path_cache.save()
         pg.quit()
 
+    def run_headless(self, time_step=0.1, time_limit=3 * 3600):
+        """
+        Runs the turnaround to completion at a fixed simulated time step, without a window or wall-clock timing.
+        :param time_step: simulated seconds per step
+        :param time_limit: simulated seconds after which the run is aborted
+        :return: simulated time at which the turnaround finished
+        """
+        while not self.scheduler.finished:
+            if self.timer > time_limit:
+                raise RuntimeError(f'Simulation did not finish within {time_limit} simulated seconds')
+            self.profiler.begin_frame()
+            self.step(time_step)
+            self.profiler.end_frame()
+        return self.timer
+
+    def run_events(self, time_limit=3 * 3600):
+        """
+        Runs the operations to completion without the vehicles, jumping from one completion to the next.
+        Vehicles never hold up operations, so this gives the same times as run_headless, up to its time step.
+        :param time_limit: simulated seconds after which the run is aborted
+        :return: simulated time at which the turnaround finished
+        """
+        while not self.scheduler.finished:
+            if self.timer > time_limit:
+                raise RuntimeError(f'Simulation did not finish within {time_limit} simulated seconds')
+            if self.scheduler.advance(self) is None:
+                raise RuntimeError('No operation can start, the dependencies of the remaining ones never complete')
+        return self.timer
+
     def reset(self):
+        # Restarting with the same seed replays the same random draws
+        self.rng = np.random.default_rng(self.seed)
         if self.new_sim:
             self.scheduler.reset('new')
         else:
@@ -602,9 +973,16 @@ class Simulation:
             self.delay_buttons.append(
                 ButtonDelay("+", (225, op_list_start + i * op_list_margin), (20, 20), operation, font_size=20))
         self.create_vehicles()
+        self.traffic.clear()
+        self.path_overlays.clear()
+        if self.kinematics is not None:
+            self.kinematics.attach(self.vehicles)
+        if self.occupancy is not None:
+            self.occupancy.clear()
+        self.employees = [f'Employee_{self.rng.integers(1, 5)}' for _ in range(5)]
 
-        self.belt_front.reset()
-        self.belt_rear.reset()
+        self.belt_front.reset(self.rng)
+        self.belt_rear.reset(self.rng)
 
         self.paused = False
         self.pause_menu = False
@@ -651,6 +1029,14 @@ class Simulation:
     def button_paths_action(self):
         self.blit_paths = not self.blit_paths
 
+    def next_overlay_mesh(self):
+        """
+        Shows the access map of the next mesh the vehicles drive on, e.g. Mesh_Lavatory for the lavatory truck.
+        """
+        mesh_names = sorted({vehicle.mesh_name for vehicle in self.vehicles})
+        index = mesh_names.index(self.overlay_mesh) if self.overlay_mesh in mesh_names else -1
+        self.overlay_mesh = mesh_names[(index + 1) % len(mesh_names)]
+
     def button_mesh_action(self):
         self.blit_mesh = not self.blit_mesh
 
@@ -724,7 +1110,7 @@ class Simulation:
                 Vehicle('Stairs', [self.scheduler.ops["Deboard"], None], [None, self.scheduler.ops["Cabin_Cleaning"], None],
                         (655, 1370), goal_locs=[(1085, 205), (1335, 165)], goal_rotations=[171, 171], reverse=[False, True]))
             self.vehicles.append(
-                Vehicle(f'Employee_{random.randint(1, 4)}', [self.scheduler.ops["Technical_Inspection"]] + [None] * 7,
+                Vehicle(f'Employee_{self.rng.integers(1, 5)}', [self.scheduler.ops["Technical_Inspection"]] + [None] * 7,
                         [None] * 7 + [self.scheduler.ops["Technical_Inspection"]],
                         (1485, 735), goal_locs=[(1085, 715), (1065, 405), (1125, 145), (855, 145), (855, 405), (845, 715), (815, 985), (1485, 735)],
                         max_speed=0.5, goal_rotations=[None] * 8, straighten=0, waiting_times=[230] * 8,
@@ -756,10 +1142,9 @@ class Button:
         self.hover_color = hover_color
         self.callback = callback
         self.rect = pg.Rect(pos, size)
-        self.font = pg.font.Font(None, font_size)
+        self.font_size = font_size
         self.is_hovered = False
-        self.text_pos = (self.rect.x + size[0] / 2 - self.font.size(text)[0] / 2,
-                         self.rect.y + size[1] / 2 - self.font.size(text)[1] / 2)
+        self.text_pos = None  # Laid out on the first draw, headless simulations never load the font
 
     def __repr__(self):
         return f'{self.text} Button'
@@ -770,7 +1155,11 @@ class Button:
         pg.draw.rect(screen, current_color, self.rect)
 
         # Render text
-        text_surface = self.font.render(self.text, True, black)
+        font = get_font(self.font_size)
+        if self.text_pos is None:
+            self.text_pos = (self.rect.x + self.size[0] / 2 - font.size(self.text)[0] / 2,
+                             self.rect.y + self.size[1] / 2 - font.size(self.text)[1] / 2)
+        text_surface = render_text(font, self.text, black)
         screen.blit(text_surface, (self.text_pos[0], self.text_pos[1]))
 
     def handle_event(self, event):
@@ -803,7 +1192,8 @@ class ButtonFlip:
         self.size = size
         self.callback = callback
         self.rect = pg.Rect(pos, size)
-        self.font = pg.font.Font(None, font_size)
+        self.text1, self.text2 = text1, text2
+        self.font_size = font_size
         self.is_hovered = False
 
         self.state = state
@@ -816,14 +1206,17 @@ class ButtonFlip:
         self.flip_rect = pg.Rect(self.rect.x + self.circle_radius, self.flip_y - self.rect.height / 2,
                                  self.rect.width - 2 * self.circle_radius, self.rect.height)
 
-        self.text_surface_1 = self.font.render(text1, True, white)
-        self.text_surface_2 = self.font.render(text2, True, white)
-
-        self.text_pos_1 = (self.rect.x - self.font.size(text1)[0] - 10, self.flip_y - self.font.size(text1)[1] / 2)
-        self.text_pos_2 = (self.rect.x + self.rect.width + 10, self.flip_y - self.font.size(text1)[1] / 2)
+        self.text_surface_1 = self.text_surface_2 = None  # Rendered on the first draw, see Button
+        self.text_pos_1 = self.text_pos_2 = None
 
     def draw(self, screen, state):
         # Render text
+        if self.text_surface_1 is None:
+            font = get_font(self.font_size)
+            self.text_surface_1 = font.render(self.text1, True, white)
+            self.text_surface_2 = font.render(self.text2, True, white)
+            self.text_pos_1 = (self.rect.x - font.size(self.text1)[0] - 10, self.flip_y - font.size(self.text1)[1] / 2)
+            self.text_pos_2 = (self.rect.x + self.rect.width + 10, self.flip_y - font.size(self.text1)[1] / 2)
         screen.blit(self.text_surface_1, (self.text_pos_1[0], self.text_pos_1[1]))
         screen.blit(self.text_surface_2, (self.text_pos_2[0], self.text_pos_2[1]))
 
@@ -856,8 +1249,7 @@ class Vehicle:
         self.name = name
         self.max_speed = max_speed
         self.acceleration = acceleration
-        self.image = pg.image.load(f'assets\\{name}.png').convert_alpha()
-        self.image_rect = self.image.get_rect()
+        self.image = get_image(name)
         self.straighten = straighten
         self.max_rotation = max_rotation
 
@@ -880,7 +1272,7 @@ class Vehicle:
         self.end_ops = end_ops
 
         if service_road_end:
-            self.goal_locs.append((535, 1370))
+            self.goal_locs.append(SERVICE_ROAD_EXIT)
             self.goal_rotations.append(90)
             self.waiting_times.append(0)
             self.reverse_list.append(False)
@@ -903,6 +1295,10 @@ class Vehicle:
 
         # Variable initialisation
         self.path = []
+        self.segments = []  # [(full_reverse, path), ...] driven after the path, at its changes of direction
+        self.planner = None  # DStarLite of the current path, once it had to be repaired twice
+        self.repairs = 0  # Repairs of the current path, see repair_path
+        self.grid_path = set()  # Mesh cells of the current path before smoothing, when planned around parked vehicles
         self.full_reverse = False
         self.arrived = False
         self.departed = False
@@ -918,224 +1314,386 @@ class Vehicle:
         self.end_goals_completed = 0
         self.prev_steering = 0
         self.stop_counter = 0
+        self.stopped_time = 0  # Simulated seconds spent waiting for other vehicles, stopped or not allowed to leave
         if self.name in ['Spot', 'Employee_1', 'Employee_2', 'Employee_3', 'Employee_4']:
             self.walking = True
         else:
             self.walking = False
 
-        # Mesh initialization
+        # Mesh initialization, the array is shared by all vehicles on the same mesh
         if self.walking:
-            mesh_df = pd.read_excel("assets/Meshes/Mesh_Inspection.xlsx", header=None)
-            self.mesh = mesh_df.to_numpy()
+            self.mesh_name = 'Mesh_Inspection'
         elif name in ['PCA_cart', 'GPU_cart']:
-            mesh_df = pd.read_excel("assets/Meshes/Mesh_Free.xlsx", header=None)
-            self.mesh = mesh_df.to_numpy()
+            self.mesh_name = 'Mesh_Free'
         elif name in ['Water', 'Water_auto']:
-            mesh_df = pd.read_excel("assets/Meshes/Mesh_Water.xlsx", header=None)
-            self.mesh = mesh_df.to_numpy()
+            self.mesh_name = 'Mesh_Water'
         elif name in ['Lavatory', 'Lavatory_auto']:
-            mesh_df = pd.read_excel("assets/Meshes/Mesh_Lavatory.xlsx", header=None)
-            self.mesh = mesh_df.to_numpy()
+            self.mesh_name = 'Mesh_Lavatory'
         else:
-            mesh_df = pd.read_excel("assets/Meshes/Mesh_4.xlsx", header=None)
-            self.mesh = mesh_df.to_numpy()
+            self.mesh_name = 'Mesh_4'
+        self.mesh = load_mesh(self.mesh_name)
+        self.service_road = True  # The mesh ends before the service road, see smooth_astar
 
     def draw(self, screen):
-        draw_rotated(self.image, self.location, self.rotation, screen)
+        """
+        :return: list of the areas drawn
+        """
+        rects = [draw_rotated(self.image, self.location, self.rotation, screen)]
 
         for trailer in self.trailers:
-            trailer.draw(screen)
+            rects.append(trailer.draw(screen))
+        return rects
+
+    def place_on_apron(self, mesh, dx):
+        """
+        Moves the vehicle to a stand dx px along a multi-stand apron, and plans on the apron's mesh from then on, see
+        meshes.apron_mesh. Goals on the stand move with it, the service road entrance and exit are shared by all
+        stands, so vehicles still waiting on the service road stay where they are.
+        """
+        on_road = tuple(self.location) == SERVICE_ROAD_ENTRANCE
+        if not on_road:
+            self.location[0] += dx
+        for trailer in self.trailers:
+            if not on_road:
+                trailer.location = (trailer.location[0] + dx, trailer.location[1])
+            if trailer.goal is not None:
+                trailer.goal = (trailer.goal[0] + dx, trailer.goal[1], trailer.goal[2])
+        for number, goal in enumerate(self.goal_locs):
+            if tuple(goal) == SERVICE_ROAD_EXIT:
+                # Reached from the outbound lane below it, without straightening
+                self.goal_rotations[number] = None
+            else:
+                self.goal_locs[number] = (goal[0] + dx, goal[1])
+        self.mesh = mesh
+        self.service_road = False
 
     def update(self, time_step, simulation):
         if self.path:
-            if simulation.speed <= simulation.speed_limit:
-                stop = False
-                # if self.full_reverse:
-                #     heading = self.rotation - 180 if self.rotation > 0 else self.rotation + 180
-                # else:
-                #     heading = self.rotation
-                # simulation.screen.blit(small_font.render(str(round(heading, 2)), True, (0, 255, 0)), (self.location[0], self.location[1]))
-
-                # i = -1
-
-                for truck in simulation.vehicles:
-                    if not truck == self and len(truck.path) >= 1:
-                        # i += 1
-                        truck_n_trailers = [truck] + truck.trailers
-                        for vehicle in truck_n_trailers:
-                            distance = np.sqrt((vehicle.location[0] - self.location[0]) ** 2 + (vehicle.location[1] - self.location[1]) ** 2)
-
-                            angle_difference = heading_angle(self, vehicle)
-                            angle_difference_2 = heading_angle(vehicle, self)
-
-                            if ((-60 < angle_difference < 60 and (-60 < angle_difference_2 < 60) and distance < 200 and not truck.stopped)
-                                    or (-30 < angle_difference < 30 and (-30 < angle_difference_2 < 30) and distance < 400 and not truck.stopped)
-                                    or (-25 < angle_difference < 25 and distance < 300 and not truck.stopped)):
-                                stop = True
-                                break
-                        # simulation.screen.blit(small_font.render(str(round(distance, 2)), True, (0, 100, 255)), (self.location[0], self.location[1] + 40 + (60*i)))
-                        # simulation.screen.blit(small_font.render(str(round(angle_difference, 2)), True, (0, 0, 0)), (self.location[0], self.location[1] + 60 + (60*i)))
-                if stop:
-                    self.stopped = True
-                    self.stop_counter = 3
-                elif self.stop_counter > 0:
-                    self.stop_counter -= time_step
-                else:
-                    self.stopped = False
-
-                dx = self.path[0][0] - self.location[0]
-                dy = self.path[0][1] - self.location[1]
-                angle = np.rad2deg(np.arctan2(dy, dx))
-                travel_distance = time_step * self.speed * 25  # 25 pixels per meter
-
-                # Displacement
-                tx = np.cos(np.deg2rad(self.rotation)) * travel_distance
-                ty = np.sin(np.deg2rad(self.rotation)) * travel_distance
-                self.location[0] += tx
-                self.location[1] += ty
-
-                reverse = True if self.full_reverse else False
-                angle_diff = angle - self.rotation
-                if angle_diff < -180:
-                    angle_diff += 360
-                elif angle_diff > 180:
-                    angle_diff -= 360
-                if abs(angle_diff) > 178:
-                    if self.name.startswith('Employee'):
-                        self.rotation = angle
-                    elif not self.name.startswith('Baggage'):
-                        reverse = True
-                if reverse:
-                    reverse_rotation = self.rotation + 180
-                    if reverse_rotation > 180:
-                        reverse_rotation -= 360
-                    angle_diff = angle - reverse_rotation
-                    if angle_diff < -180:
-                        angle_diff += 360
-                    elif angle_diff > 180:
-                        angle_diff -= 360
-
-                # Steering
-                if self.walking:
-                    steering_factor = 1
-                else:
-                    steering_factor = min(1.0, abs(self.speed / 3))
-                steering = np.clip(10 * angle_diff * steering_factor * time_step, -self.max_rotation * time_step, self.max_rotation * time_step)
-                steering = np.clip(steering, self.prev_steering - 20 * time_step, self.prev_steering + 20 * time_step)
-                self.rotation += steering
-
-                # Accelerating + Braking
-                dist_goal = np.sqrt(
-                    (self.path[-1][0] - self.location[0]) ** 2 + (self.path[-1][1] - self.location[1]) ** 2)
-                brake_speed = ((self.max_speed - 0.1) / 200) * dist_goal + 0.1
-
-                if self.stopped:
-                    if reverse:
-                        self.speed = min(self.speed + self.acceleration * time_step, 0)
-                    else:
-                        self.speed = max(self.speed - self.acceleration * time_step, 0)
-                elif (not reverse and self.speed > brake_speed) or (reverse and self.speed < -brake_speed):
-                    if reverse:
-                        self.speed = max(self.speed, -brake_speed)
-                    else:
-                        self.speed = min(self.speed, brake_speed)
-                else:
-                    if reverse:
-                        if self.speed - self.acceleration * time_step > -self.max_speed / 2:
-                            self.speed -= self.acceleration * time_step
-                        else:
-                            self.speed = -self.max_speed
-                    else:
-                        if self.speed + self.acceleration * time_step < self.max_speed:
-                            self.speed += self.acceleration * time_step
-                        else:
-                            self.speed = self.max_speed
-
-                # Trailers
-                for trailer in self.trailers:
-                    if trailer.connected:
-                        if trailer.number == 0:
-                            prev_trailer = self
-                        else:
-                            prev_trailer = self.trailers[trailer.number - 1]
-                        trailer.update(prev_trailer, time_step, self.speed)
-
-                # Gate crossing
-                crossed_gate = self.has_crossed_gate()
-                if crossed_gate and len(self.path) > 1:
-                    self.path = self.path[1:]
-                    if len(self.path) == 1:
-                        self.create_gate(0)
-                    elif not self.arrived and len(self.path) <= self.straighten + 1:
-                        self.create_gate(min(80, len(self.path) * 7))
-                    elif self.walking:
-                        self.create_gate(20)
-                    else:
-                        self.create_gate()
-                elif crossed_gate:
-                    self.finish_path()
-            else:  # Sim speed > speed limit
-                if self.snap_list is not None and self.goals_completed < len(self.snap_list):
-                    self.snap_list[self.goals_completed] = True
-                self.finish_path()
+            self.check_proximity(time_step, simulation)
+            self.move(time_step)
+            self.update_trailers(time_step)
+            self.advance_path(self.has_crossed_gate())
         else:  # No path
-            if len(self.trailers) > 0:
-                for trailer in self.trailers:
-                    if self.start_ops[0].name.startswith('Offload'):
-                        if self.goals_completed == 1:
-                            trailer.move(simulation)
-                        elif self.goals_completed == 3:
-                            trailer.loaded = True
-                            trailer.move_back(simulation, self)
-                    elif self.start_ops[0].name.startswith('Load'):
-                        if self.goals_completed == 2:
-                            trailer.move(simulation)
-                        elif self.goals_completed == 4:
-                            trailer.loaded = False
-                            trailer.move_back(simulation, self)
-
-            if self.arrived and self.wait_time > 0:
-                self.wait_time -= time_step
-            elif ((self.start_ops[self.goals_completed] is None or self.start_ops[self.goals_completed].is_ready())
-                  and (self.end_ops[self.goals_completed] is None or self.end_ops[self.goals_completed].completed)):
-                # Check for vehicles moving nearby
-                if not any(np.sqrt((self.location[0] - vehicle.location[0]) ** 2 + (self.location[1] - vehicle.location[1]) ** 2) < 400
-                           and len(vehicle.path) >= 1 for vehicle in simulation.vehicles):
-                    self.find_path(simulation)
-
-    def find_path(self, simulation):
-        # Skip movement due to too high sim speed
-        if simulation.speed > simulation.speed_limit:
-            # Snap due to skipping of movement
-            if self.goals_completed < len(self.snap_list):
-                self.snap_list[self.goals_completed] = True
-            self.finish_path()
-
-        # Find path to goal
+            self.idle(time_step, simulation)
+
+    def check_proximity(self, time_step, simulation):
+        """
+        Stops the vehicle while other moving vehicles are in its way, and for 3 seconds after.
+        """
+        stop = False
+        # if self.full_reverse:
+        #     heading = self.rotation - 180 if self.rotation > 0 else self.rotation + 180
+        # else:
+        #     heading = self.rotation
+        # simulation.screen.blit(get_font('small').render(str(round(heading, 2)), True, (0, 255, 0)), (self.location[0], self.location[1]))
+
+        # Only other moving vehicles and their trailers within 400 px can make this one stop
+        for vehicle, truck in simulation.traffic.query(self.location, 400):
+            if truck is not self and len(truck.path) >= 1 and not truck.stopped:
+                distance = np.sqrt((vehicle.location[0] - self.location[0]) ** 2 + (vehicle.location[1] - self.location[1]) ** 2)
+                if distance >= 400:
+                    continue
+
+                angle_difference = heading_angle(self, vehicle)
+                angle_difference_2 = heading_angle(vehicle, self)
+
+                if ((-60 < angle_difference < 60 and (-60 < angle_difference_2 < 60) and distance < 200)
+                        or (-30 < angle_difference < 30 and (-30 < angle_difference_2 < 30) and distance < 400)
+                        or (-25 < angle_difference < 25 and distance < 300)):
+                    stop = True
+                    break
+        if stop:
+            self.stopped = True
+            self.stop_counter = 3
+        elif self.stop_counter > 0:
+            self.stop_counter -= time_step
+        else:
+            self.stopped = False
+        if self.stopped:
+            self.stopped_time += time_step
+
+    def move(self, time_step):
+        """
+        Drives towards the next point of the path: displacement, steering and accelerating or braking.
+        KinematicsEngine.move does the same for many vehicles at once.
+        """
+        dx = self.path[0][0] - self.location[0]
+        dy = self.path[0][1] - self.location[1]
+        angle = np.rad2deg(np.arctan2(dy, dx))
+        travel_distance = time_step * self.speed * 25  # 25 pixels per meter
+
+        # Displacement
+        tx = np.cos(np.deg2rad(self.rotation)) * travel_distance
+        ty = np.sin(np.deg2rad(self.rotation)) * travel_distance
+        self.location[0] += tx
+        self.location[1] += ty
+
+        reverse = True if self.full_reverse else False
+        angle_diff = angle - self.rotation
+        if angle_diff < -180:
+            angle_diff += 360
+        elif angle_diff > 180:
+            angle_diff -= 360
+        if abs(angle_diff) > 178:
+            if self.name.startswith('Employee'):
+                self.rotation = angle
+            elif not self.name.startswith('Baggage'):
+                reverse = True
+        if reverse:
+            reverse_rotation = self.rotation + 180
+            if reverse_rotation > 180:
+                reverse_rotation -= 360
+            angle_diff = angle - reverse_rotation
+            if angle_diff < -180:
+                angle_diff += 360
+            elif angle_diff > 180:
+                angle_diff -= 360
+
+        # Steering
+        if self.walking:
+            steering_factor = 1
         else:
-            self.arrived = False
-            self.full_reverse = self.reverse_list[self.goals_completed]
-            self.path = smooth_astar(self.mesh, (self.location[0], self.location[1]),
-                                     self.goal_locs[self.goals_completed],
-                                     self.goal_rotations[self.goals_completed],
-                                     straighten=self.straighten, full_reverse=self.full_reverse)
-            if self.path is None:
-                raise ValueError(f'Pathfinding Error: Could not find path for truck {self.name}: start={(self.location[0], self.location[1])}, '
-                                 f'goal={self.goal_locs[self.goals_completed]},\n straighten={self.straighten}, full_reverse={self.full_reverse}')
+            steering_factor = min(1.0, abs(self.speed / 3))
+        steering = np.clip(10 * angle_diff * steering_factor * time_step, -self.max_rotation * time_step, self.max_rotation * time_step)
+        steering = np.clip(steering, self.prev_steering - 20 * time_step, self.prev_steering + 20 * time_step)
+        self.rotation += steering
+
+        # Accelerating + Braking
+        dist_goal = np.sqrt(
+            (self.path[-1][0] - self.location[0]) ** 2 + (self.path[-1][1] - self.location[1]) ** 2)
+        brake_speed = ((self.max_speed - 0.1) / 200) * dist_goal + 0.1
+
+        if self.stopped:
+            if reverse:
+                self.speed = min(self.speed + self.acceleration * time_step, 0)
+            else:
+                self.speed = max(self.speed - self.acceleration * time_step, 0)
+        elif (not reverse and self.speed > brake_speed) or (reverse and self.speed < -brake_speed):
+            if reverse:
+                self.speed = max(self.speed, -brake_speed)
+            else:
+                self.speed = min(self.speed, brake_speed)
+        else:
+            if reverse:
+                if self.speed - self.acceleration * time_step > -self.max_speed / 2:
+                    self.speed -= self.acceleration * time_step
+                else:
+                    self.speed = -self.max_speed
+            else:
+                if self.speed + self.acceleration * time_step < self.max_speed:
+                    self.speed += self.acceleration * time_step
+                else:
+                    self.speed = self.max_speed
 
+    def update_trailers(self, time_step):
+        for trailer in self.trailers:
+            if trailer.connected:
+                if trailer.number == 0:
+                    prev_trailer = self
+                else:
+                    prev_trailer = self.trailers[trailer.number - 1]
+                trailer.update(prev_trailer, time_step, self.speed)
+
+    def advance_path(self, crossed_gate):
+        """
+        Moves on to the next point of the path once its gate is crossed, or finishes the path at its last point.
+        :param crossed_gate: result of has_crossed_gate() at the current location
+        """
+        if crossed_gate and len(self.path) > 1:
+            self.path = self.path[1:]
             if len(self.path) == 1:
                 self.create_gate(0)
+            elif not self.arrived and len(self.path) <= self.straighten + 1:
+                self.create_gate(min(80, len(self.path) * 7))
             elif self.walking:
-                self.create_gate(10)
+                self.create_gate(20)
             else:
                 self.create_gate()
+        elif crossed_gate and self.segments:
+            # Change of direction of a lattice path, stop and drive the next part
+            self.speed = 0
+            self.full_reverse, self.path = self.segments.pop(0)
+            self.create_first_gate()
+        elif crossed_gate:
+            self.finish_path()
+
+    def idle(self, time_step, simulation):
+        """
+        Moves the trailers while parked, waits at the goal and plans the next path once its operations allow it.
+        """
+        if len(self.trailers) > 0:
+            for trailer in self.trailers:
+                if self.start_ops[0].name.startswith('Offload'):
+                    if self.goals_completed == 1:
+                        trailer.move(simulation)
+                    elif self.goals_completed == 3:
+                        trailer.loaded = True
+                        trailer.move_back(simulation, self)
+                elif self.start_ops[0].name.startswith('Load'):
+                    if self.goals_completed == 2:
+                        trailer.move(simulation)
+                    elif self.goals_completed == 4:
+                        trailer.loaded = False
+                        trailer.move_back(simulation, self)
+
+        if self.arrived and self.wait_time > 0:
+            self.wait_time -= time_step
+        elif ((self.start_ops[self.goals_completed] is None or self.start_ops[self.goals_completed].is_ready())
+              and (self.end_ops[self.goals_completed] is None or self.end_ops[self.goals_completed].completed)):
+            # Check for vehicles moving nearby
+            if not any(np.sqrt((self.location[0] - vehicle.location[0]) ** 2 + (self.location[1] - vehicle.location[1]) ** 2) < 400
+                       and len(vehicle.path) >= 1 for vehicle, truck in simulation.traffic.query(self.location, 400)
+                       if vehicle is truck):
+                self.find_path(simulation)
+            else:
+                self.stopped_time += time_step
+
+    def find_path(self, simulation):
+        # Find path to goal
+        self.arrived = False
+        self.planner = None
+        self.repairs = 0
+        self.path = self.plan_path(simulation)
+        if self.path is None:
+            raise ValueError(f'Pathfinding Error: Could not find path for truck {self.name}: '
+                             f'start={tuple(self.location)}, goal={self.goal_locs[self.goals_completed]},\n '
+                             f'straighten={self.straighten}, full_reverse={self.full_reverse}')
+        self.create_first_gate()
+
+    def plan_path(self, simulation, incremental=False):
+        """
+        :param incremental: plan with the vehicle's DStarLite search, continuing it while the goal stays the same
+        :return: smoothed path from the current location to the current goal, None if there is none
+        """
+        start = tuple(self.location)
+        goal = self.goal_locs[self.goals_completed]
+        rotation = self.goal_rotations[self.goals_completed]
+        path = None
+        self.full_reverse = self.reverse_list[self.goals_completed]
+        self.segments = []
+        self.grid_path = set()
+        mesh = self.mesh
+        if simulation.occupancy is not None:
+            blocked = simulation.occupancy.blocked(exclude=self)
+            # Smoothing has to see the parked vehicles as well, the mesh is a new array for every plan
+            mesh = np.array(self.mesh)
+            mesh[blocked] = 0
+        profiler = simulation.profiler
+        if simulation.lattice:
+            with profiler.section('lattice.plan'):
+                path = self.plan_lattice(mesh, start, goal, rotation)
+        if path is None and simulation.occupancy is not None:
+            with profiler.section('smooth_astar'):
+                path = smooth_astar(mesh, start, goal, rotation, straighten=self.straighten,
+                                    full_reverse=self.full_reverse, use_cache=False, service_road=self.service_road,
+                                    planner=lambda _, grid_start, grid_goal: self.plan_grid(mesh, grid_start, grid_goal,
+                                                                                             blocked, incremental))
+        if path is None:  # Parked vehicles close off every path, drive through them like without the occupancy
+            self.planner = None
+            self.grid_path = set()
+            with profiler.section('smooth_astar'):
+                path = smooth_astar(self.mesh, start, goal, rotation, straighten=self.straighten,
+                                    full_reverse=self.full_reverse, service_road=self.service_road)
+        return path
+
+    def plan_lattice(self, mesh, start, goal, rotation):
+        """
+        Plans with the motion primitives of the vehicle's class, arriving forward or in reverse as the goal asks. The
+        whole leg is first searched in that one direction, then changing direction, in which case the path is split
+        where it changes direction and the later parts are driven from self.segments, see advance_path. Like
+        smooth_astar, legs from or to the service road drive straight between it and the end of the stand mesh.
+        :return: first part of the path, [(x, y), ...] from the first pose after the start, None if there is none
+        """
+        class_name = lattice.vehicle_class(self)
+        if class_name == 'truck_trailers':
+            # Trailers slip more on lattice paths than on smoothed ones, 326.5 against 201.6 in total on the old
+            # turnaround, so trucks pulling trailers stay on smooth_astar
+            return None
+        heading = self.rotation
+        head, tail = [], []
+        if self.service_road and tuple(start) == SERVICE_ROAD_ENTRANCE:
+            start, heading = SERVICE_ROAD_ENDS[SERVICE_ROAD_ENTRANCE], -90
+            head = [start]
+        if self.service_road and tuple(goal) == SERVICE_ROAD_EXIT:
+            goal, rotation = SERVICE_ROAD_ENDS[SERVICE_ROAD_EXIT], 90
+            tail = [SERVICE_ROAD_EXIT]
+        distances = None
+        if mesh is self.mesh and self.service_road:  # The travel table of the stand mesh holds the heuristic
+            table = load_table(self.mesh_name)
+            distances = table.distances[table.add((int(goal[0]), int(goal[1])))]
+        arrival = -1 if self.full_reverse else 1
+        for direction in [arrival, None]:
+            poses = lattice.plan(mesh, (start[0], start[1], heading), (goal[0], goal[1], rotation), class_name,
+                                 direction=direction, distances=distances, arrival=arrival)
+            if poses is not None:
+                break
+        else:
+            return None
+        self.grid_path = lattice.path_cells(poses)
+
+        points = [(False, point) for point in head]
+        points += [(motion < 0, (x, y)) for x, y, _, motion in poses[1:]]
+        points += [(False, point) for point in tail]
+        segments = []
+        for reverse, point in points:
+            if not segments or segments[-1][0] != reverse:
+                segments.append((reverse, []))
+            segments[-1][1].append(point)
+        self.full_reverse, path = segments[0]
+        self.segments = segments[1:]
+        return path
+
+    def plan_grid(self, mesh, start, goal, blocked, incremental):
+        """
+        Grid planner for smooth_astar around the parked vehicles, see plan_path.
+        """
+        if not incremental or (self.repairs < 2 and self.planner is None):
+            # A first repair replans with A*, a full DStarLite search only pays off once a leg is repaired again
+            self.planner = None
+            mesh[start], mesh[goal] = self.mesh[start], self.mesh[goal]  # Never blocked by the parked vehicles
+            path = astar_flat(mesh, start, goal)
+        else:
+            if self.planner is None or self.planner.goal != goal:
+                self.planner = DStarLite(self.mesh, start, goal, blocked)
+            else:
+                self.planner.update(start, {})
+            path = self.planner.path()
+        self.grid_path = set(path)
+        return path
+
+    def repair_path(self, cells, simulation):
+        """
+        Passes changed occupancy cells on to the planner, and replans the rest of the path once it is blocked.
+        The first repair replans with astar_flat, which is far cheaper than a complete DStarLite search. The second
+        one starts the DStarLite search, later ones only update it.
+        :param cells: cells whose occupancy changed, see OccupancyLayer.update
+        """
+        start = to_grid(self.location)
+        if not (0 <= start[0] < self.mesh.shape[0] and 0 <= start[1] < self.mesh.shape[1]):
+            return
+        changes = simulation.occupancy.blocked_cells(cells, exclude=self)
+        if self.planner is not None:
+            self.planner.update(start, changes)
+        if any(blocked and cell in self.grid_path for cell, blocked in changes.items()):
+            self.repairs += 1
+            path = self.plan_path(simulation, incremental=True)
+            if path is not None:
+                self.path = path
+                self.create_first_gate()
+
+    def create_first_gate(self):
+        if len(self.path) == 1:
+            self.create_gate(0)
+        elif self.walking:
+            self.create_gate(10)
+        else:
+            self.create_gate()
 
     def finish_path(self):
         self.path = []
         self.speed = 0
         if self.snap_list[self.goals_completed]:
-            self.location[0], self.location[1] = self.goal_locs[self.goals_completed][0], \
-                self.goal_locs[self.goals_completed][1]
+            self.location[0], self.location[1] = self.goal_locs[self.goals_completed]
             if self.goal_rotations[self.goals_completed] is not None:
                 self.rotation = self.goal_rotations[self.goals_completed]
 
@@ -1226,8 +1784,8 @@ class Trailer:
         self.rotation = rotation
         self.truck = truck
 
-        self.image_empty = pg.image.load(f'assets\\Baggage_trailer_empty.png').convert_alpha()
-        self.image_full = pg.image.load(f'assets\\Baggage_trailer_full.png').convert_alpha()
+        self.image_empty = get_image('Baggage_trailer_empty')
+        self.image_full = get_image('Baggage_trailer_full')
         self.number = trailer_number
         self.previous_rotation = self.rotation
         self.total_slip = 0.0
@@ -1295,18 +1853,10 @@ class Trailer:
         self.previous_rotation = self.rotation
 
     def draw(self, screen):
-        rect_surface = pg.Surface((64, 37), pg.SRCALPHA)
-        if self.loaded:
-            rect_surface.blit(self.image_full, (0, 0))
-        else:
-            rect_surface.blit(self.image_empty, (0, 0))
-        rotated_surface = pg.transform.rotate(rect_surface, -self.rotation)
-        rotated_rect = rotated_surface.get_rect(center=self.location)
-
-        screen.blit(rotated_surface, rotated_rect.topleft)
+        return draw_rotated(self.image_full if self.loaded else self.image_empty, self.location, self.rotation, screen)
 
         # string = f'Trailer {self.number}: {round(self.total_slip, 2)}'
-        # screen.blit(small_font.render(string, True, white), (1700, 200 + self.number * 20))
+        # screen.blit(get_font('small').render(string, True, white), (1700, 200 + self.number * 20))
 
     def move(self, simulation):
         if self.move_start_time is None:
@@ -1342,8 +1892,9 @@ class Trailer:
 
 
 class Belt:
-    def __init__(self, location):
+    def __init__(self, location, rng):
         self.bags = []
+        self.spare_bags = []  # Popped bags, recycled for the next ones on the belt
         if location == 'Front':
             self.location = location
         elif location == 'Rear':
@@ -1351,7 +1902,8 @@ class Belt:
         else:
             raise ValueError('location must be either Front or Rear')
         self.status = None
-        self.delay_counter = np.random.randint(150, 200)
+        self.delay_counter = rng.integers(150, 200)
+        self.operations = (None, None)  # (op_list, getter) of the operations on this side, see update_status
 
     def update(self, time_step, simulation):
         for bag in self.bags:
@@ -1360,34 +1912,79 @@ class Belt:
         if self.status == 'Load' or self.status == 'Unload':
             if not self.bags or (self.bags[-1].location[0] < 870 and self.status == 'Unload'):
                 if self.location == 'Front':
-                    self.bags.append(Bag((920, 830)))
+                    self.add_bag((920, 830), simulation.rng)
                 else:
-                    self.bags.append(Bag((920, 330)))
+                    self.add_bag((920, 330), simulation.rng)
             elif not self.bags or (self.bags[-1].location[0] > 775 and self.status == 'Load'):
                 if self.location == 'Front':
-                    self.bags.append(Bag((725, 830)))
+                    self.add_bag((725, 830), simulation.rng)
                 else:
-                    self.bags.append(Bag((725, 330)))
+                    self.add_bag((725, 330), simulation.rng)
 
         if self.bags and ((self.bags[0].location[0] < 700 and self.status in ['Unload', 'Finish_Unload'] and simulation.new_sim)
                           or (self.bags[0].location[0] < 725 and self.status in ['Unload', 'Finish_Unload'] and not simulation.new_sim)
                           or (self.bags[0].location[0] > 920 and self.status in ['Load', 'Finish_Load'])):
-            self.bags.pop(0)
+            self.spare_bags.append(self.bags.pop(0))
+
+    def update_status(self, scheduler, time_step):
+        """
+        Starts or stops the belt to follow the offloading and loading operations on its side of the aircraft.
+        A stopping belt first runs empty, and waits delay_counter seconds before it runs the other way.
+        """
+        op_list = scheduler.op_list
+        if self.operations[0] is not op_list:
+            self.operations = (op_list, scheduler.getter(f'Connect_LDL_{self.location}', f'Remove_LDL_{self.location}',
+                                                         f'Offload_{self.location}', f'Load_{self.location}'))
+        connect, remove, offload, load = self.operations[1](op_list)
+        if connect.completed and remove.start_time is None:
+            if offload.start_time is not None and not offload.completed:
+                new_status = 'Unload'
+            elif load.start_time is not None and load.time_left > 30:
+                new_status = 'Load'
+            else:
+                new_status = None
+        else:
+            new_status = None
+
+        if new_status != self.status:
+            if self.bags:
+                if not self.status.startswith('Finish'):
+                    self.status = 'Finish_' + self.status
+            elif self.delay_counter > 0:
+                self.delay_counter -= time_step
+            else:
+                self.status = new_status
+                self.delay_counter = 150
+
+    def add_bag(self, location, rng):
+        if self.spare_bags:
+            bag = self.spare_bags.pop()
+            bag.reset(location, rng)
+        else:
+            bag = Bag(location, rng)
+        self.bags.append(bag)
 
     def draw(self, screen):
-        for bag in self.bags:
-            bag.draw(screen)
+        """
+        :return: list of the areas drawn
+        """
+        return [bag.draw(screen) for bag in self.bags]
 
-    def reset(self):
+    def reset(self, rng):
+        self.spare_bags.extend(self.bags)
         self.bags = []
         self.status = None
+        self.delay_counter = rng.integers(150, 200)
 
 
 class Bag:
-    def __init__(self, location):
+    def __init__(self, location, rng):
+        self.reset(location, rng)
+
+    def reset(self, location, rng):
         self.location = location
-        self.image = pg.image.load(f'assets\\Baggage\\Bag_{np.random.randint(0, 12)}.png').convert_alpha()
-        self.rotation = np.random.randint(-180, 180)
+        self.image = get_image(f'Bag_{rng.integers(0, 12)}')
+        self.rotation = rng.integers(-180, 180)
 
     def update(self, time_step, activity):
         if activity == 'Unload' or activity == 'Finish_Unload':
@@ -1396,21 +1993,107 @@ class Bag:
             self.location = (self.location[0] + 25 * 0.4 * time_step, self.location[1])
 
     def draw(self, screen):
-        rect_surface = pg.Surface(self.image.get_size(), pg.SRCALPHA)
-        rect_surface.blit(self.image, (0, 0))
-        rotated_surface = pg.transform.rotate(rect_surface, -self.rotation)
-        rotated_rect = rotated_surface.get_rect(center=self.location)
-
-        screen.blit(rotated_surface, rotated_rect.topleft)
+        return draw_rotated(self.image, self.location, self.rotation, screen)
+
+
+class RotationCache:
+    """
+    Pre-rotated sprites shared across frames and vehicles, keyed on (image, angle rounded to angle_step degrees).
+    Least recently used surfaces are dropped once the cache holds more than budget bytes.
+    """
+    def __init__(self, budget=64 * 2 ** 20, angle_step=1):
+        self.budget = budget
+        self.angle_step = angle_step
+        self.surfaces = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image, rotation):
+        """
+        :param image: sprite surface
+        :param rotation: clockwise rotation in degrees
+        :return: the rotated sprite
+        """
+        angle = round(rotation / self.angle_step) * self.angle_step % 360
+        key = (id(image), angle)
+        entry = self.surfaces.get(key)
+        if entry is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        surface = pg.transform.rotate(image, -angle)
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        # The image is kept in the entry, so its id cannot be reused by another image while cached
+        self.surfaces[key] = (image, surface, size)
+        self.size += size
+        while self.size > self.budget and len(self.surfaces) > 1:
+            _, (_, _, evicted_size) = self.surfaces.popitem(last=False)
+            self.size -= evicted_size
+        return surface
+
+
+rotation_cache = RotationCache()
+
+
+# Access map overlays per mesh name, see mesh_overlay
+_mesh_overlays = {}
+
+
+def mesh_overlay(mesh_name):
+    """
+    :param mesh_name: mesh file name without extension, e.g. 'Mesh_4'
+    :return: window sized surface with the walls of the mesh in red and the rest in green, built once per mesh
+    """
+    surface = _mesh_overlays.get(mesh_name)
+    if surface is None:
+        top_rows = int(MESH_TOP // CELL_SIZE)  # The mesh starts MESH_TOP px above the screen, see to_grid
+        cells = load_mesh(mesh_name)[top_rows:top_rows + math.ceil(1080 / CELL_SIZE)]  # The rows on the screen
+        colours = np.where((cells == 0)[:, :, None], np.array([255, 100, 100, 100], dtype=np.uint8),
+                           np.array([100, 255, 100, 100], dtype=np.uint8))
+        pixels = np.ascontiguousarray(np.repeat(np.repeat(colours, CELL_SIZE, axis=0), CELL_SIZE, axis=1))
+        surface = pg.image.frombuffer(pixels.tobytes(), (pixels.shape[1], pixels.shape[0]), 'RGBA').convert_alpha()
+        _mesh_overlays[mesh_name] = surface
+    return surface
 
 
 def draw_rotated(image, location, rotation, screen):
-    image_rect = image.get_rect()
-    rect_surface = pg.Surface((image_rect.width, image_rect.height), pg.SRCALPHA)
-    rect_surface.blit(image, (0, 0))
-    rotated_surface = pg.transform.rotate(rect_surface, -rotation)
+    rotated_surface = rotation_cache.get(image, rotation)
     rotated_rect = rotated_surface.get_rect(center=location)
-    screen.blit(rotated_surface, rotated_rect.topleft)
+    return screen.blit(rotated_surface, rotated_rect.topleft)
+
+
+class TextCache:
+    """
+    Rendered texts shared across frames, keyed on (font, text, colour), so a text is only rendered again once its
+    value changes. Least recently used surfaces are dropped once the cache holds more than max_size.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def get(self, font, text, colour):
+        key = (id(font), text, colour)
+        entry = self.surfaces.get(key)
+        if entry is not None:
+            self.surfaces.move_to_end(key)
+            return entry[1]
+
+        surface = font.render(text, True, colour)
+        # The font is kept in the entry, so its id cannot be reused by another font while cached
+        self.surfaces[key] = (font, surface)
+        while len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+text_cache = TextCache()
+
+
+def render_text(font, text, colour):
+    return text_cache.get(font, text, colour)
 
 
 def heading_angle(vehicle_1, vehicle_2):
@@ -1432,17 +2115,80 @@ def heading_angle(vehicle_1, vehicle_2):
     return angle_diff
 
 
+def get_font(name):
+    """
+    :param name: key of fonts, or the size of pygame's default font as used by the buttons
+    :return: the font, shared with every other user of it
+    """
+    font = _fonts.get(name)
+    if font is None:
+        if not pg.font.get_init():
+            pg.font.init()
+        font = pg.font.SysFont(*fonts[name]) if isinstance(name, str) else pg.font.Font(None, name)
+        _fonts[name] = font
+    return font
+
+
+def get_image(name):
+    """
+    :param name: sprite file name without extension, e.g. 'Catering' or 'Bag_3'
+    :return: the sprite, shared with every other user of it, or None without a display
+    """
+    # Headless simulations have no display to convert to, and never draw
+    if pg.display.get_surface() is None:
+        return None
+    if not sprites:
+        load_assets()
+    return sprites[name]
+
+
 def load_assets():
-    images = {}
-    rects = {}
-    for file in os.listdir('assets'):
-        if file.endswith('.png'):
-            image = pg.image.load(f'assets\\{file}').convert_alpha()
-            images[file[:-4]] = image
-            rects[file[:-4]] = image.get_rect()
+    if not sprites:
+        for directory in sprite_dirs:
+            for file in os.listdir(directory):
+                if file.endswith('.png'):
+                    sprites[file[:-4]] = pg.image.load(os.path.join(directory, file)).convert_alpha()
+    images = dict(sprites)
+    rects = {name: image.get_rect() for name, image in images.items()}
     return images, rects
 
 
 if __name__ == "__main__":
-    main_sim = Simulation()
-    main_sim.run()
+    parser = argparse.ArgumentParser(description='ApronSim turnaround simulation')
+    parser.add_argument('--headless', action='store_true', help='run a single turnaround without a window')
+    parser.add_argument('--new', action='store_true', help='simulate the new (autonomous) turnaround')
+    parser.add_argument('--time-step', type=float, default=0.1, help='simulated seconds per headless step')
+    parser.add_argument('--schedule-only', action='store_true',
+                        help='with --headless, skip the vehicles and jump from one operation completion to the next')
+    parser.add_argument('--batched-kinematics', action='store_true',
+                        help='move all vehicles in one vectorised step, faster with many vehicles')
+    parser.add_argument('--dynamic-obstacles', action='store_true',
+                        help='plan around parked vehicles and repair paths when they get blocked')
+    parser.add_argument('--lattice', action='store_true',
+                        help='plan kinematically feasible paths with the motion primitives of the vehicle classes')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the sections of every frame, shown in an overlay toggled with o')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='profile and write the last frames as a Chrome trace (speedscope, Perfetto) to FILE')
+    args = parser.parse_args()
+
+    if args.headless:
+        main_sim = Simulation(headless=True, new_sim=args.new, batched_kinematics=args.batched_kinematics,
+                              dynamic_obstacles=args.dynamic_obstacles, lattice=args.lattice,
+                              profile=args.profile or args.trace is not None)
+        start = time.perf_counter()
+        finish_time = main_sim.run_events() if args.schedule_only else main_sim.run_headless(args.time_step)
+        print(f'Turnaround finished at {finish_time / 60:.2f} min, in {time.perf_counter() - start:.2f}s '
+              f'(path cache: {path_cache.hits} hits, {path_cache.misses} misses)')
+        path_cache.save()
+        for operation in main_sim.scheduler.ops.values():
+            print(f'{operation.name:<22}{operation.start_time:>10.1f}{operation.completion_time:>10.1f}')
+        if main_sim.profiler.enabled:
+            print('\n'.join(main_sim.profiler.overlay_lines()))
+    else:
+        main_sim = Simulation(new_sim=args.new, batched_kinematics=args.batched_kinematics,
+                              dynamic_obstacles=args.dynamic_obstacles, lattice=args.lattice,
+                              profile=args.profile or args.trace is not None)
+        main_sim.run()
+    if args.trace is not None:
+        main_sim.profiler.export_trace(args.trace)
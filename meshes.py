@@ -0,0 +1,115 @@
+import contextlib
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from pathfinding import SERVICE_ROAD_ENTRANCE, SERVICE_ROAD_EXIT, to_grid
+
+MESH_DIR = 'assets/Meshes'
+CACHE_DIR = 'cache/meshes'
+STAND_WIDTH = 192  # Cells of a stand mesh along x, 1920 px
+
+# Meshes loaded in this process, shared (read-only) by every vehicle using them
+_meshes = {}
+
+
+def load_mesh(name: str):
+    """
+    Loads a mesh, parsing its xlsx only when it changed since it was last cached.
+    :param name: mesh file name without extension, e.g. 'Mesh_4'
+    :return: read-only uint8 array, 0 = wall, 1 = free, 2 = marked cell (e.g. 'c', neither free nor a wall)
+    """
+    mesh = _meshes.get(name)
+    if mesh is not None:
+        return mesh
+
+    xlsx_path = os.path.join(MESH_DIR, f'{name}.xlsx')
+    with open(xlsx_path, 'rb') as file:
+        digest = hashlib.sha1(file.read()).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f'{name}_{digest}.npy')
+
+    if not os.path.exists(cache_path):
+        mesh = parse_mesh(xlsx_path)
+        save_cache(cache_path, os.path.join(CACHE_DIR, f'{name}_{"[0-9a-f]" * 16}.npy'),
+                   lambda file: np.save(file, mesh))
+
+    try:
+        # Plain ndarray view on the memory map, indexing a np.memmap directly is slower
+        mesh = np.asarray(np.load(cache_path, mmap_mode='r'))
+    except FileNotFoundError:  # Removed as stale by a process that found a newer xlsx, use a parsed copy instead
+        mesh = parse_mesh(xlsx_path)
+        mesh.setflags(write=False)
+    _meshes[name] = mesh
+    return mesh
+
+
+def apron_mesh(name: str, stands: int):
+    """
+    Tiles a stand mesh side by side onto one common service road, for a multi-stand Apron. Vehicles enter every stand
+    from SERVICE_ROAD_ENTRANCE of the first stand, along the inbound lane at its height, and leave down the exit
+    corridor of their stand and back along the outbound lane below it to SERVICE_ROAD_EXIT of the first stand.
+    :param name: mesh file name without extension, e.g. 'Mesh_4'
+    :param stands: number of stands, each STAND_WIDTH cells wide
+    :return: read-only uint8 array like load_mesh, stand k in columns k * STAND_WIDTH onwards
+    """
+    key = (name, stands)
+    mesh = _meshes.get(key)
+    if mesh is not None:
+        return mesh
+
+    stand = load_mesh(name)
+    road_row, entrance = to_grid(SERVICE_ROAD_ENTRANCE)
+    exit_ = to_grid(SERVICE_ROAD_EXIT)[1]
+    outbound_row = road_row + 3  # Two wall rows between the lanes
+    mesh = np.zeros((outbound_row + 2, STAND_WIDTH * stands), dtype=np.uint8)
+    mesh[:road_row] = np.tile(stand[:road_row], stands)
+    # The edge columns of the stands are free above the service road, wall them off so stands only meet on the road
+    mesh[:road_row, 0::STAND_WIDTH] = 0
+    mesh[:road_row, STAND_WIDTH - 1::STAND_WIDTH] = 0
+    mesh[road_row, entrance:(stands - 1) * STAND_WIDTH + entrance + 1] = 1
+    mesh[outbound_row, exit_:(stands - 1) * STAND_WIDTH + exit_ + 1] = 1
+    mesh[road_row:outbound_row, exit_::STAND_WIDTH] = 1
+    mesh.setflags(write=False)
+    _meshes[key] = mesh
+    return mesh
+
+
+def save_cache(cache_path: str, stale_pattern: str, write):
+    """
+    Writes a cache file and removes the stale ones, safe with many processes filling the same cache at once.
+    :param cache_path: file to write
+    :param stale_pattern: glob of the earlier versions of the file, e.g. keyed on another hash, cache_path is kept
+    :param write: function writing the contents to the binary file object it is given
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    for stale_path in glob.glob(stale_pattern):
+        if os.path.abspath(stale_path) != os.path.abspath(cache_path):
+            with contextlib.suppress(FileNotFoundError):  # Already removed by another process
+                os.remove(stale_path)
+    # Write then rename, so processes starting together never load a half written file
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        write(file)
+    os.replace(temp_path, cache_path)
+
+
+def parse_mesh(xlsx_path: str):
+    import pandas as pd
+
+    values = pd.read_excel(xlsx_path, header=None).to_numpy()
+    mesh = np.full(values.shape, 2, dtype=np.uint8)
+    mesh[values == 0] = 0
+    mesh[values == 1] = 1
+    return mesh
+
+
+def upsample_mesh(mesh: np.ndarray, factor: int):
+    """
+    Splits every mesh cell into factor x factor cells, e.g. factor 2 turns the 10 px mesh into a 5 px one.
+    :param mesh: mesh from load_mesh
+    :param factor: cells per original cell along each axis
+    :return: uint8 array of shape (height * factor, width * factor), pass cell_size = 10 / factor to smooth_astar
+    """
+    return np.repeat(np.repeat(mesh, factor, axis=0), factor, axis=1)
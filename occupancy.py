@@ -0,0 +1,88 @@
+import numpy as np
+
+from pathfinding import disc_offsets, to_grid
+
+
+class OccupancyLayer:
+    """
+    Mesh cells covered by parked vehicles and trailers, stamped on top of the static meshes so planners route around
+    them. Footprints are discs around the item locations, and an item is only re-stamped when it moved to another
+    cell.
+    """
+    def __init__(self, shape=(158, 192), radius=2):
+        """
+        :param shape: mesh shape, all meshes of a stand share it, see meshes.apron_mesh for a multi-stand apron
+        :param radius: footprint radius in mesh cells
+        """
+        self.counts = np.zeros(shape, dtype=np.int16)  # Number of footprints covering each cell
+        self.stamps = {}  # {id(vehicle or trailer): (id(vehicle it belongs to), cell, (ys, xs))}
+        self.offsets = np.array(disc_offsets(radius))
+
+    def clear(self):
+        self.counts[:] = 0
+        self.stamps.clear()
+
+    def footprint(self, cell):
+        cells = self.offsets + cell
+        inside = ((cells[:, 0] >= 0) & (cells[:, 0] < self.counts.shape[0])
+                  & (cells[:, 1] >= 0) & (cells[:, 1] < self.counts.shape[1]))
+        return cells[inside, 0], cells[inside, 1]
+
+    def update(self, vehicles):
+        """
+        Stamps the vehicles parked on the stand and their trailers, plus trailers left behind by moving vehicles.
+        Vehicles still waiting on the service road and walkers are left out.
+        :param vehicles: list of Vehicle
+        :return: set of (y, x) cells whose count changed
+        """
+        items = {}  # {id(item): (id(vehicle), cell)}
+        for vehicle in vehicles:
+            if vehicle.departed or vehicle.walking:
+                continue
+            parked = not vehicle.path and vehicle.goals_completed > 0
+            stamped = [vehicle] + vehicle.trailers if parked else [trailer for trailer in vehicle.trailers
+                                                                  if not trailer.connected]
+            for item in stamped:
+                items[id(item)] = (id(vehicle), to_grid(item.location))
+
+        changed = set()
+        for key, (owner, cell, (ys, xs)) in list(self.stamps.items()):
+            if items.get(key) != (owner, cell):
+                self.counts[ys, xs] -= 1
+                changed.update(zip(ys.tolist(), xs.tolist()))
+                del self.stamps[key]
+        for key, (owner, cell) in items.items():
+            if key not in self.stamps:
+                ys, xs = self.footprint(cell)
+                self.counts[ys, xs] += 1
+                changed.update(zip(ys.tolist(), xs.tolist()))
+                self.stamps[key] = (owner, cell, (ys, xs))
+        return changed
+
+    def own_counts(self, vehicle):
+        counts = {}
+        for owner, _, (ys, xs) in self.stamps.values():
+            if owner == id(vehicle):
+                for cell in zip(ys.tolist(), xs.tolist()):
+                    counts[cell] = counts.get(cell, 0) + 1
+        return counts
+
+    def blocked(self, exclude=None):
+        """
+        :param exclude: vehicle whose own footprints and those of its trailers are left out
+        :return: np.array of booleans, True for covered cells
+        """
+        counts = self.counts.copy()
+        if exclude is not None:
+            for (y, x), count in self.own_counts(exclude).items():
+                counts[y, x] -= count
+        return counts > 0
+
+    def blocked_cells(self, cells, exclude=None):
+        """
+        :param cells: iterable of (y, x)
+        :param exclude: see blocked
+        :return: {(y, x): covered}
+        """
+        own = self.own_counts(exclude) if exclude is not None else {}
+        return {cell: int(self.counts[cell]) - own.get(cell, 0) > 0 for cell in cells}
@@ -1,17 +1,140 @@
-import numpy as np
+import hashlib
 import heapq
+import math
+import os
+import pickle
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # Optional, the flat A* runs as plain Python without it
+    numba = None
+
+
+class PathCache:
+    """
+    Least recently used cache of smooth_astar results, persisted to disk between runs.
+    Keys hold a hash of the mesh and the grid cells of the start and goal, which fully determine the path.
+    """
+    version = 2  # Bump when the paths for the same key change
+
+    def __init__(self, file='cache/paths.pkl', max_size=4096):
+        self.file = file
+        self.max_size = max_size
+        self.paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+        self.changed = False
+
+    def get(self, key):
+        if not self.loaded:
+            self.load()
+        path = self.paths.get(key)
+        if path is None:
+            self.misses += 1
+            return None
+        self.paths.move_to_end(key)
+        self.hits += 1
+        return list(path)
+
+    def put(self, key, path):
+        self.paths[key] = tuple(path)
+        self.paths.move_to_end(key)
+        while len(self.paths) > self.max_size:
+            self.paths.popitem(last=False)
+        self.changed = True
+
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.file, 'rb') as file:
+                version, paths = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return
+        if version == self.version:
+            for key, path in paths.items():
+                self.paths.setdefault(key, path)
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.file) or '.', exist_ok=True)
+        temp_file = f'{self.file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as file:
+            pickle.dump((self.version, dict(self.paths)), file)
+        os.replace(temp_file, self.file)
+        self.changed = False
+
+    def clear(self):
+        self.paths.clear()
+        self.hits = 0
+        self.misses = 0
+        self.changed = True
+
+    @staticmethod
+    def mesh_key(mesh: np.ndarray):
+        """
+        :return: key of the mesh contents, memoised per array for read-only meshes such as those from load_mesh
+        """
+        entry = _mesh_keys.get(id(mesh))
+        if entry is not None and entry[0] is mesh:
+            return entry[1]
+        key = mesh.shape, mesh.dtype.str, hashlib.sha1(np.ascontiguousarray(mesh).tobytes()).hexdigest()
+        if not mesh.flags.writeable:  # Writeable meshes may change between calls, they are hashed every time
+            if len(_mesh_keys) > 64:
+                _mesh_keys.clear()
+            _mesh_keys[id(mesh)] = (mesh, key)
+        return key
+
+
+# {id(mesh): (mesh, key)}, the mesh is kept so its id cannot be reused by another array while cached
+_mesh_keys = {}
+path_cache = PathCache()
+
+
+class SearchStats:
+    """
+    Searches and node expansions of the grid planners since the process started, read by the profiler.
+    """
+    def __init__(self):
+        self.searches = 0
+        self.expansions = 0
+
+
+search_stats = SearchStats()
 
+CELL_SIZE = 10  # Pixels per mesh cell of the meshes in assets/Meshes
+MESH_TOP = 200  # Pixels of the mesh above the screen
+# Where vehicles enter and leave a stand on the service road, below the stand meshes
+SERVICE_ROAD_ENTRANCE = (655, 1370)
+SERVICE_ROAD_EXIT = (535, 1370)
+# {service road end: last point on the stand mesh before it}, vehicles drive straight between the two
+SERVICE_ROAD_ENDS = {SERVICE_ROAD_ENTRANCE: (655, 1020), SERVICE_ROAD_EXIT: (535, 1020)}
 
-def smooth_astar(mesh: np.ndarray, start: tuple, goal: tuple, goal_rotation: int, straighten=15, reverse_out=(0, 0), full_reverse=False):
+
+def smooth_astar(mesh: np.ndarray, start: tuple, goal: tuple, goal_rotation: int, straighten=15, reverse_out=(0, 0), full_reverse=False,
+                 backend='flat', smoothing='vectorized', use_cache=True, planner=None, cell_size=CELL_SIZE,
+                 service_road=True):
     """
     Generates a smooth astar path using the given start and goal coordinates.
     :param mesh: array of 1s and 0s, where 0s are walls
     :param start: (x,y) coordinates of the start point
     :param goal: (x,y) coordinates of the goal point)
     :param goal_rotation: rotation angle of the goal point
-    :param straighten: number of steps straight to goal, to straighten the vehicle to the goal rotation
-    :param reverse_out: add a point straight at the start of the path (distance, rotation)
+    :param straighten: number of 10 px steps straight to goal, to straighten the vehicle to the goal rotation
+    :param reverse_out: add a point straight at the start of the path (distance in 10 px steps, rotation)
     :param full_reverse: path is done in reverse
+    :param backend: A* implementation from ASTAR_BACKENDS, all but 'hierarchical' give identical shortest paths
+    :param smoothing: line of sight smoothing from SMOOTHING, all give identical waypoints
+    :param use_cache: look up and store the result in path_cache
+    :param planner: function (mesh, start, goal) -> grid path used instead of the backend, e.g. to plan with DStarLite
+    :param cell_size: pixels per mesh cell, e.g. 5 for a mesh from meshes.upsample_mesh(mesh, 2)
+    :param service_road: the mesh ends before the service road, paths from SERVICE_ROAD_ENTRANCE and to
+                         SERVICE_ROAD_EXIT drive straight to SERVICE_ROAD_ENDS. False for meshes holding the service
+                         road, see meshes.apron_mesh
     :return: path, [(x,y), ...]
     """
     # Convert to tuple if needed
@@ -19,20 +142,20 @@ def smooth_astar(mesh: np.ndarray, start: tuple, goal: tuple, goal_rotation: int
         start = (start[0], start[1])
 
     # Check for a service road start or goal
-    if start == (655, 1370):
+    if service_road and start == SERVICE_ROAD_ENTRANCE:
         service_start = True
-        start = (655, 1020)
+        start = SERVICE_ROAD_ENDS[SERVICE_ROAD_ENTRANCE]
     else:
         service_start = False
-    if goal == (535, 1370):
+    if service_road and goal == SERVICE_ROAD_EXIT:
         service_end = True
-        goal = (535, 1020)
+        goal = SERVICE_ROAD_ENDS[SERVICE_ROAD_EXIT]
     else:
         service_end = False
 
     # Convert start and goal coordinates to y, x grid
-    m_start = (int(start[1] / 10) + 20, int(start[0] / 10))
-    m_goal = (int(goal[1] / 10) + 20, int(goal[0] / 10))
+    m_start = to_grid(start, cell_size)
+    m_goal = to_grid(goal, cell_size)
 
     # Check start and goal
     if 0 > m_start[0] >= mesh.shape[0] or 0 > m_start[1] >= mesh.shape[1]:
@@ -40,26 +163,39 @@ def smooth_astar(mesh: np.ndarray, start: tuple, goal: tuple, goal_rotation: int
     if 0 > m_goal[0] >= mesh.shape[0] or 0 > m_goal[1] >= mesh.shape[1]:
         raise ValueError(f'Pathfinding Error: inserted goal value invalid. goal = {m_goal}')
 
+    if use_cache:
+        key = (PathCache.mesh_key(mesh), m_start, service_start, m_goal, service_end, goal_rotation, straighten,
+               tuple(reverse_out), full_reverse, cell_size)
+        cached_path = path_cache.get(key)
+        if cached_path is not None:
+            return cached_path
+
+    # Steps are 10 px whatever the cell size, the straightening points stay 10 px apart on finer meshes
+    straighten_cells = straighten * CELL_SIZE / cell_size
+    reverse_out = (reverse_out[0] * CELL_SIZE / cell_size, reverse_out[1])
+
     # Find start point for straightening
     if goal_rotation is None:
         straighten = 0
         dx, dy = 0, 0
     else:
         if full_reverse:
-            dx = -round(-straighten * np.cos(np.deg2rad(goal_rotation)))
-            dy = -round(-straighten * np.sin(np.deg2rad(goal_rotation)))
+            dx = -round(-straighten_cells * np.cos(np.deg2rad(goal_rotation)))
+            dy = -round(-straighten_cells * np.sin(np.deg2rad(goal_rotation)))
         else:
-            dx = round(-straighten * np.cos(np.deg2rad(goal_rotation)))
-            dy = round(-straighten * np.sin(np.deg2rad(goal_rotation)))
+            dx = round(-straighten_cells * np.cos(np.deg2rad(goal_rotation)))
+            dy = round(-straighten_cells * np.sin(np.deg2rad(goal_rotation)))
         if not service_end:
             m_goal = (m_goal[0] + dy, m_goal[1] + dx)
 
-    path = astar(mesh, m_start, m_goal)
+    if planner is None:
+        planner = ASTAR_BACKENDS[backend]
+    path = planner(mesh, m_start, m_goal)
     if len(path) == 1:  # No path found
         return None
 
     # Smooth path backwards
-    smoothed_path = los_smooth_bwrd(path, mesh)
+    smoothed_path = SMOOTHING[smoothing](path, mesh)
 
     # Add point to start if reversing out
     if reverse_out[0] > 0:
@@ -67,7 +203,7 @@ def smooth_astar(mesh: np.ndarray, start: tuple, goal: tuple, goal_rotation: int
 
     # Add service road point to end of path
     if service_end:
-        smoothed_path.append((157, 53))
+        smoothed_path.append(to_grid((SERVICE_ROAD_EXIT[0], SERVICE_ROAD_EXIT[1] + 5), cell_size))
     else:
         # Add straightening points
         for i in np.arange(1, straighten+1):
@@ -75,17 +211,57 @@ def smooth_astar(mesh: np.ndarray, start: tuple, goal: tuple, goal_rotation: int
 
     # Add service road point to start
     if service_start:
-        smoothed_path.insert(0, (157, 65))
+        smoothed_path.insert(0, to_grid((SERVICE_ROAD_ENTRANCE[0], SERVICE_ROAD_ENTRANCE[1] + 5), cell_size))
 
     # Convert to x, y coordinates
+    top_rows = int(MESH_TOP // cell_size)  # Same rows above the screen as to_grid
     final_path = []
     for point in smoothed_path:
-        final_path.append((int(point[1] * 10 + 5), int((point[0] - 20) * 10 + 5)))
+        final_path.append((int(point[1] * cell_size + cell_size / 2),
+                           int((point[0] - top_rows) * cell_size + cell_size / 2)))
 
     # Skip start point
+    if use_cache:
+        path_cache.put(key, final_path[1:])
     return final_path[1:]
 
 
+def to_grid(location, cell_size=CELL_SIZE):
+    """
+    :param location: (x, y) pixel coordinates on the stand
+    :param cell_size: pixels per mesh cell
+    :return: (y, x) mesh cell, the mesh starts MESH_TOP (200 px) above the screen
+    """
+    return int(location[1] / cell_size) + int(MESH_TOP // cell_size), int(location[0] / cell_size)
+
+
+def distance_field(mesh: np.ndarray, sources: list):
+    """
+    Steps from every mesh cell to the nearest source, with the same 4-connected unit steps as astar.
+    Expands one breadth first wavefront over the whole mesh at a time.
+    :param mesh: np.array where 1s are free
+    :param sources: [(y, x), ...] cells at distance 0
+    :return: np.array of int32 steps, -1 where no source can be reached
+    """
+    free = np.asarray(mesh) == 1
+    distances = np.full(free.shape, -1, dtype=np.int32)
+    frontier = np.zeros(free.shape, dtype=bool)
+    for y, x in sources:
+        frontier[y, x] = True
+
+    steps = 0
+    while frontier.any():
+        distances[frontier] = steps
+        grown = np.zeros_like(frontier)
+        grown[1:] |= frontier[:-1]
+        grown[:-1] |= frontier[1:]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & free & (distances < 0)
+        steps += 1
+    return distances
+
+
 def heuristic(a, b):
     return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
@@ -110,11 +286,13 @@ def astar(mesh: np.ndarray, start: tuple, goal: tuple):
     came_from = {start: None}
     cost_so_far = {start: 0}
 
+    search_stats.searches += 1
     while queue:
         _, current = heapq.heappop(queue)
 
         if current == goal:
             break
+        search_stats.expansions += 1
 
         for dx, dy in neighbors:
             next_node = (current[0] + dx, current[1] + dy)
@@ -140,6 +318,379 @@ def astar(mesh: np.ndarray, start: tuple, goal: tuple):
     return path
 
 
+def astar_flat(mesh: np.ndarray, start: tuple, goal: tuple):
+    """
+    Same search and result as astar, but on flat node indices (y * width + x) with preallocated arrays for the
+    costs, parents and closed set instead of tuples and dicts. Compiled with numba when it is installed.
+    :param mesh: np.array with 1s and 0s, where 0s are walls
+    :param start: (y, x)
+    :param goal: (y, x)
+    :return: path, [(y, x), ... (y,x)], Note: [goal] if no path can be found
+    """
+    height, width = mesh.shape
+    size = height * width
+    start_node = start[0] * width + start[1]
+    goal_node = goal[0] * width + goal[1]
+    free = (np.asarray(mesh) == 1).ravel()
+
+    if _astar_flat_jit is not None:
+        parents = np.full(size, -1, dtype=np.int64)
+        expansions = _astar_flat_jit(free, width, start_node, goal_node, np.full(size, size, dtype=np.int64), parents,
+                                     np.zeros(size, dtype=np.bool_))
+        parent = parents.tolist()
+    else:  # Python lists index faster than NumPy arrays outside of compiled code
+        parent = [-1] * size
+        expansions = _astar_flat_core(free.tolist(), width, start_node, goal_node, [size] * size, parent,
+                                      [False] * size)
+    search_stats.searches += 1
+    search_stats.expansions += expansions
+
+    # Reconstruct the path
+    path = []
+    current = goal_node
+    while current != -1:
+        path.append((current // width, current % width))
+        current = parent[current]
+
+    path.reverse()
+    return path
+
+
+def _astar_flat_core(free, width, start, goal, cost, parent, closed):
+    size = len(free)
+    goal_y = goal // width
+    goal_x = goal % width
+
+    cost[start] = 0
+    queue = [(0, start)]
+    expansions = 0
+    while queue:
+        _, current = heapq.heappop(queue)
+
+        if current == goal:
+            break
+        if closed[current]:  # Already expanded with its lowest cost, the heuristic is consistent
+            continue
+        closed[current] = True
+        expansions += 1
+
+        y = current // width
+        x = current - y * width
+        new_cost = cost[current] + 1
+        # right, left, down, up
+        for next_node, inside in ((current + 1, x + 1 < width), (current - 1, x > 0),
+                                  (current + width, current + width < size), (current - width, current >= width)):
+            if inside and free[next_node] and new_cost < cost[next_node]:
+                cost[next_node] = new_cost
+                parent[next_node] = current
+                next_y = next_node // width
+                priority = new_cost + abs(goal_y - next_y) + abs(goal_x - (next_node - next_y * width))
+                heapq.heappush(queue, (priority, next_node))
+    return expansions
+
+
+_astar_flat_jit = numba.njit(cache=True)(_astar_flat_core) if numba is not None else None
+
+
+def hierarchical_astar(mesh: np.ndarray, start: tuple, goal: tuple):
+    """
+    :return: path of hierarchical.hpa_star, near the shortest, on the cached abstract graph of the mesh
+    """
+    from hierarchical import hpa_star
+
+    return hpa_star(mesh, start, goal)
+
+
+ASTAR_BACKENDS = {'python': astar, 'flat': astar_flat, 'hierarchical': hierarchical_astar}
+
+
+class DStarLite:
+    """
+    Incremental planner (D* Lite) on the same 4-connected grid as astar, for a goal that stays fixed while the start
+    moves and cells get blocked or freed. After a change only the affected part of the search is repaired, instead
+    of searching from scratch. Cells are flat indices internally, y * width + x, like astar_flat.
+    """
+    def __init__(self, mesh: np.ndarray, start: tuple, goal: tuple, blocked: np.ndarray = None):
+        """
+        :param mesh: np.array with 1s and 0s, where 0s are walls
+        :param start: (y, x)
+        :param goal: (y, x)
+        :param blocked: np.array of booleans, cells blocked on top of the walls, e.g. by parked vehicles
+        """
+        self.height, self.width = mesh.shape
+        self.walls = (np.asarray(mesh) != 1).ravel()
+        self.blocked = np.zeros(self.walls.shape, dtype=bool) if blocked is None \
+            else np.array(blocked, dtype=bool).ravel()
+        self.free = (~(self.walls | self.blocked)).tolist()
+        self.neighbors = grid_neighbors(mesh.shape)
+        self.start = start
+        self.goal = goal
+        self.start_index = self.index(start)
+        self.goal_index = self.index(goal)
+        self.free[self.start_index] = self.free[self.goal_index] = True  # Never block the planner's own start or goal
+        self.km = 0
+        self.g = [math.inf] * len(self.free)
+        self.rhs = [math.inf] * len(self.free)
+        self.rhs[self.goal_index] = 0
+        self.queue = []
+        self.keys = {}  # {cell: its current key in the queue}, older queue entries are skipped
+        self.push(self.goal_index)
+        self.expansions = 0
+        self.compute()
+
+    def index(self, cell):
+        return cell[0] * self.width + cell[1]
+
+    def key(self, cell):
+        best = min(self.g[cell], self.rhs[cell])
+        y, x = divmod(cell, self.width)
+        return best + abs(self.start[0] - y) + abs(self.start[1] - x) + self.km, best
+
+    def push(self, cell):
+        key = self.key(cell)
+        self.keys[cell] = key
+        heapq.heappush(self.queue, (key, cell))
+
+    def update_vertex(self, cell):
+        g, free = self.g, self.free
+        if cell != self.goal_index:
+            rhs = math.inf
+            if free[cell]:
+                for neighbor in self.neighbors[cell]:
+                    if free[neighbor] and g[neighbor] + 1 < rhs:
+                        rhs = g[neighbor] + 1
+            self.rhs[cell] = rhs
+        if g[cell] != self.rhs[cell]:
+            self.push(cell)
+        else:
+            self.keys.pop(cell, None)
+
+    def compute(self):
+        search_stats.searches += 1
+        g, rhs, keys, queue = self.g, self.rhs, self.keys, self.queue
+        start = self.start_index
+        while queue:
+            old_key, cell = queue[0]
+            if keys.get(cell) != old_key:  # Outdated entry
+                heapq.heappop(queue)
+                continue
+            if old_key >= self.key(start) and rhs[start] == g[start]:
+                break
+            heapq.heappop(queue)
+            self.expansions += 1
+            search_stats.expansions += 1
+            new_key = self.key(cell)
+            if old_key < new_key:
+                self.push(cell)
+            elif g[cell] > rhs[cell]:
+                g[cell] = rhs[cell]
+                del keys[cell]
+                for neighbor in self.neighbors[cell]:
+                    self.update_vertex(neighbor)
+            else:
+                g[cell] = math.inf
+                del keys[cell]
+                self.update_vertex(cell)
+                for neighbor in self.neighbors[cell]:
+                    self.update_vertex(neighbor)
+
+    def update(self, start: tuple, changes: dict):
+        """
+        Moves the start and repairs the search after cells changed.
+        :param start: (y, x) current cell
+        :param changes: {(y, x): blocked}, cells blocked or freed on top of the walls
+        """
+        cells = [self.index(cell) for cell in changes]
+        for cell, blocked in zip(cells, changes.values()):
+            self.blocked[cell] = blocked
+        if start != self.start:
+            self.km += heuristic(self.start, start)
+            cells += [self.start_index, self.index(start)]
+            self.start = start
+            self.start_index = self.index(start)
+        for cell in cells:
+            free = cell == self.start_index or cell == self.goal_index or not (self.walls[cell] or self.blocked[cell])
+            if free != self.free[cell]:
+                self.free[cell] = free
+                self.update_vertex(cell)
+                for neighbor in self.neighbors[cell]:
+                    self.update_vertex(neighbor)
+        self.compute()
+
+    def path(self):
+        """
+        :return: path, [(y, x), ... (y,x)] from the start to the goal, [goal] if no path can be found
+        """
+        g, free = self.g, self.free
+        if g[self.start_index] == math.inf:
+            return [self.goal]
+        cells = [self.start_index]
+        cell = self.start_index
+        while cell != self.goal_index:
+            cell = min((neighbor for neighbor in self.neighbors[cell] if free[neighbor]), key=g.__getitem__)
+            cells.append(cell)
+        return [divmod(cell, self.width) for cell in cells]
+
+
+_grid_neighbors = {}
+
+
+def grid_neighbors(shape):
+    """
+    :param shape: mesh shape
+    :return: list with the flat indices of the 4 neighbours of every flat cell index, in astar's order
+    """
+    neighbors = _grid_neighbors.get(shape)
+    if neighbors is None:
+        height, width = shape
+        neighbors = []
+        for y in range(height):
+            for x in range(width):
+                neighbors.append([(y + dy) * width + x + dx for dy, dx in ((0, 1), (0, -1), (1, 0), (-1, 0))
+                                  if 0 <= y + dy < height and 0 <= x + dx < width])
+        _grid_neighbors[shape] = neighbors
+    return neighbors
+
+
+def disc_offsets(radius):
+    """
+    :param radius: radius in mesh cells
+    :return: [(dy, dx), ...] of the cells within radius of a cell, the cell itself first
+    """
+    return sorted(((dy, dx) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)
+                   if dy ** 2 + dx ** 2 <= radius ** 2), key=lambda offset: offset[0] ** 2 + offset[1] ** 2)
+
+
+class ReservationTable:
+    """
+    Mesh cells reserved by the timed paths of vehicles, as time intervals per cell, see space_time_astar.
+    """
+    def __init__(self):
+        self.cells = defaultdict(list)  # {(y, x): [(start, end, agent), ...]}
+
+    def reserve_path(self, path, start_time, step, agent, radius=0, hold=math.inf):
+        """
+        :param path: timed path, [(y, x), ...] one cell per step
+        :param start_time: time at which the agent is at the first cell
+        :param step: seconds per path cell
+        :param agent: owner of the reservations, its own reservations never block it
+        :param radius: cells around the path that are reserved as well, in mesh cells
+        :param hold: time until which the last cell stays reserved, e.g. while the vehicle is parked there
+        """
+        offsets = disc_offsets(radius)
+        intervals = {}  # {(y, x): [start, end]}, consecutive steps over a cell are merged into one reservation
+        for k, (y, x) in enumerate(path):
+            start = start_time + k * step
+            end = max(hold, start + step) if k == len(path) - 1 else start + step
+            for dy, dx in offsets:
+                cell = (y + dy, x + dx)
+                interval = intervals.get(cell)
+                if interval is not None and interval[1] >= start:
+                    interval[1] = max(interval[1], end)
+                else:
+                    if interval is not None:
+                        self.cells[cell].append((interval[0], interval[1], agent))
+                    intervals[cell] = [start, end]
+        for cell, (start, end) in intervals.items():
+            self.cells[cell].append((start, end, agent))
+
+    def release(self, agent, time):
+        """
+        Ends the open reservations of an agent, e.g. when it leaves the goal it was parked at.
+        :param time: time at which its reservations without end time end
+        """
+        for cell, reservations in self.cells.items():
+            for i, (start, end, owner) in enumerate(reservations):
+                if owner == agent and end == math.inf:
+                    reservations[i] = (start, max(start, time), owner)
+
+    def is_free(self, cell, start, end, agent=None):
+        """
+        :return: True if no other agent reserved the cell in [start, end)
+        """
+        for reserved_start, reserved_end, owner in self.cells.get(cell, ()):
+            if reserved_start < end and reserved_end > start and owner != agent:
+                return False
+        return True
+
+    def has_gap(self, cell, start, end, duration, agent=None):
+        """
+        :return: True if no other agent reserved the cell for duration seconds, starting between start and end
+        """
+        time = start
+        for reserved_start, reserved_end, owner in sorted(self.cells.get(cell, ())):
+            if owner == agent or reserved_end <= time:
+                continue
+            if reserved_start >= time + duration:
+                return True
+            time = reserved_end
+            if time > end:
+                return False
+        return True
+
+    def conflicts(self, path, start_time, step, agent=None):
+        """
+        :return: number of cells of a timed path that are reserved by other agents while the agent is there
+        """
+        return sum(not self.is_free(cell, start_time + k * step, start_time + (k + 1) * step, agent)
+                   for k, cell in enumerate(path))
+
+
+def space_time_astar(mesh: np.ndarray, start: tuple, goal: tuple, start_time: float, step: float,
+                     reservations: ReservationTable, agent=None, distances: np.ndarray = None, hold=0.0,
+                     max_wait=600.0):
+    """
+    A* over cells and time, with the 4-neighbour steps of astar plus waiting in place, each taking one step of time.
+    Cells reserved by other agents are avoided while they are reserved, the start cell is always allowed.
+    :param mesh: np.array with 1s and 0s, where 0s are walls
+    :param start: (y, x)
+    :param goal: (y, x)
+    :param start_time: time of the first path cell
+    :param step: seconds per path cell, e.g. the time the vehicle needs for one cell
+    :param reservations: ReservationTable with the paths of the other agents
+    :param agent: the planning agent, see ReservationTable
+    :param distances: distance_field towards the goal, the exact heuristic, computed if not given
+    :param hold: seconds the goal has to stay free after arriving
+    :param max_wait: most seconds of waiting on top of the shortest path before the search gives up
+    :return: timed path, [(y, x), ...] one cell per step from start to goal, None if there is none within max_wait
+    """
+    if distances is None:
+        distances = distance_field(mesh, [goal])
+    if distances[start] < 0:
+        return None
+    height, width = mesh.shape
+    max_steps = int(distances[start]) + int(max_wait / step)
+    if not reservations.has_gap(goal, start_time + distances[start] * step, start_time + max_steps * step,
+                                max(hold, step), agent):
+        return None  # The goal stays reserved, e.g. by a parked vehicle
+    parents = {(start, 0): None}
+    queue = [(int(distances[start]), 0, start)]
+    while queue:
+        _, negative_k, cell = heapq.heappop(queue)
+        k = -negative_k  # Deeper states first among equal estimates
+        time = start_time + k * step
+        if cell == goal and reservations.is_free(goal, time, time + max(hold, step), agent):
+            path = []
+            state = (cell, k)
+            while state is not None:
+                path.append(state[0])
+                state = parents[state]
+            return path[::-1]
+        if k == max_steps:
+            continue
+        for dy, dx in ((0, 0), (0, 1), (0, -1), (1, 0), (-1, 0)):
+            neighbor = (cell[0] + dy, cell[1] + dx)
+            if (not (0 <= neighbor[0] < height and 0 <= neighbor[1] < width) or distances[neighbor] < 0
+                    or (neighbor, k + 1) in parents):
+                continue
+            # Moving over takes the whole step, the cell has to be free from leaving the current one
+            if neighbor != start and not reservations.is_free(neighbor, time, time + 2 * step, agent):
+                continue
+            parents[(neighbor, k + 1)] = (cell, k)
+            heapq.heappush(queue, (k + 1 + int(distances[neighbor]), -(k + 1), neighbor))
+    return None
+
+
 def los_smooth_bwrd(path, mesh):
     smooth_path = [path[0]]  # Add start
     current_node = 0
@@ -153,6 +704,127 @@ def los_smooth_bwrd(path, mesh):
     return smooth_path
 
 
+def los_smooth_vectorized(path, mesh):
+    """
+    Same waypoints as los_smooth_bwrd, but the lines from the current waypoint to all remaining path nodes are
+    checked at once with NumPy. Lines whose bounding box holds no walls are accepted from an integral image of the
+    walls; only the nodes beyond the furthest of those are rasterised, see lines_blocked.
+    :param path: [(y, x), ...]
+    :param mesh: np.array where 0s are walls
+    :return: smoothed path, [(y, x), ...]
+    """
+    walls, wall_sums = wall_tables(mesh)
+    nodes = np.array(path, dtype=np.int64)
+    width = mesh.shape[1]
+
+    smooth_path = [path[0]]  # Add start
+    current_node = 0
+    while current_node != len(path) - 1:
+        start = nodes[current_node]
+        ends = nodes[current_node + 1:]
+
+        # Bresenham cells move monotonically from start to end, so they stay within the bounding box of the two
+        top = np.minimum(start[0], ends[:, 0])
+        bottom = np.maximum(start[0], ends[:, 0]) + 1
+        left = np.minimum(start[1], ends[:, 1])
+        right = np.maximum(start[1], ends[:, 1]) + 1
+        box_walls = wall_sums[bottom, right] - wall_sums[top, right] - wall_sums[bottom, left] + wall_sums[top, left]
+        clear = np.flatnonzero(box_walls == 0)
+        furthest = int(clear[-1]) if len(clear) > 0 else 0  # The next node is always visible
+
+        # Only nodes beyond the furthest clear one can still be further visible nodes
+        if furthest < len(ends) - 1:
+            visible = np.flatnonzero(~lines_blocked(start, ends[furthest + 1:], walls, width))
+            if len(visible) > 0:
+                furthest += 1 + int(visible[-1])
+
+        current_node += 1 + furthest
+        smooth_path.append(path[current_node])
+    return smooth_path
+
+
+def lines_blocked(start, ends, walls, width, window=8):
+    """
+    Vectorised has_obstacle from one start to many ends, rasterising exactly the same cells. Cells are checked
+    outwards from the start in growing windows, dropping lines as soon as they hit a wall.
+    :param start: (y, x)
+    :param ends: np.array of (y, x) rows
+    :param walls: flattened boolean mesh, True for walls
+    :param width: mesh width
+    :param window: number of cells per line checked in the first pass
+    :return: np.array of booleans, True if the line to that end crosses a wall
+    """
+    y1 = np.full(len(ends), start[0])
+    x1 = np.full(len(ends), start[1])
+    y2 = ends[:, 0]
+    x2 = ends[:, 1]
+
+    # Same swaps as has_obstacle: major axis first, traversed in increasing order
+    steep = np.abs(x2 - x1) > np.abs(y2 - y1)
+    major1, minor1 = np.where(steep, x1, y1), np.where(steep, y1, x1)
+    major2, minor2 = np.where(steep, x2, y2), np.where(steep, y2, x2)
+    flip = major1 > major2
+    major1, major2 = np.where(flip, major2, major1), np.where(flip, major1, major2)
+    minor1, minor2 = np.where(flip, minor2, minor1), np.where(flip, minor1, minor2)
+
+    d_major = major2 - major1
+    d_minor = np.abs(minor2 - minor1)
+    minor_step = np.where(minor1 < minor2, 1, -1)
+
+    blocked = np.zeros(len(ends), dtype=bool)
+    remaining = np.arange(len(ends))
+    distance = 0  # Cells from the start already checked
+    while len(remaining) > 0:
+        lengths = np.minimum(d_major[remaining] + 1 - distance, window)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        line = np.repeat(remaining, lengths)
+        steps = distance + np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+        k = np.where(flip[line], d_major[line] - steps, steps)
+
+        # The error term of has_obstacle starts at d_major / 2 and loses d_minor per cell, so by cell k the minor
+        # coordinate has moved -floor((d_major - 2 k d_minor) / (2 d_major)) times
+        minor_moves = -((d_major[line] - 2 * k * d_minor[line]) // np.maximum(2 * d_major[line], 1))
+        major = major1[line] + k
+        minor = minor1[line] + minor_step[line] * minor_moves
+        rows = np.where(steep[line], minor, major)
+        cols = np.where(steep[line], major, minor)
+        hit = np.logical_or.reduceat(walls[rows * width + cols], offsets)
+
+        blocked[remaining[hit]] = True
+        distance += window
+        remaining = remaining[~hit & (d_major[remaining] >= distance)]
+        window *= 2
+    return blocked
+
+
+# Wall lookups per read-only mesh for los_smooth_vectorized, the mesh is kept to make sure its id is not reused
+_wall_tables = {}
+
+
+def wall_tables(mesh):
+    """
+    :param mesh: np.array where 0s are walls
+    :return: flattened boolean walls, and the integral image of the walls with a leading row and column of zeros,
+             memoised per array for read-only meshes such as those from load_mesh, like PathCache.mesh_key
+    """
+    entry = _wall_tables.get(id(mesh))
+    if entry is None or entry[0] is not mesh:
+        walls = np.asarray(mesh) == 0
+        wall_sums = np.zeros((walls.shape[0] + 1, walls.shape[1] + 1), dtype=np.int64)
+        wall_sums[1:, 1:] = walls.cumsum(axis=0).cumsum(axis=1)
+        entry = (mesh, walls.ravel(), wall_sums)
+        # Writeable meshes, e.g. stamped with the parked vehicles, may change between calls
+        if not isinstance(mesh, np.ndarray) or mesh.flags.writeable:
+            return entry[1], entry[2]
+        if len(_wall_tables) > 64:
+            _wall_tables.clear()
+        _wall_tables[id(mesh)] = entry
+    return entry[1], entry[2]
+
+
+SMOOTHING = {'backward': los_smooth_bwrd, 'vectorized': los_smooth_vectorized}
+
+
 def los_smooth_fwrd(path, mesh):
     smooth_path = [path[0]]  # Add start
 
@@ -0,0 +1,185 @@
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed size buffer keeping the last capacity values, preallocated so appending never allocates.
+    """
+    def __init__(self, capacity, dtype=np.float64):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.index = 0  # Where the next value goes
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % len(self.data)
+        if self.count < len(self.data):
+            self.count += 1
+
+    def values(self):
+        """
+        :return: np.array of the buffered values, oldest first
+        """
+        if self.count < len(self.data):
+            return self.data[:self.count]
+        return np.concatenate((self.data[self.index:], self.data[:self.index]))
+
+
+class _Section:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.begin(self.name)
+
+    def __exit__(self, *exc_info):
+        self.profiler.end()
+
+
+_null_section = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Timings of named, nested sections of the simulation loop. Every finished section is kept as an event for the
+    trace export, and the section times are summed per frame for the overlay, both in ring buffers. Counters are
+    sampled once per frame, e.g. the node expansions of the path searches. A disabled profiler records nothing and
+    its sections cost a single call.
+    """
+    def __init__(self, enabled=False, events=2 ** 18, frames=600):
+        """
+        :param enabled: record anything at all
+        :param events: section events kept for the trace export
+        :param frames: frames kept for the per frame statistics
+        """
+        self.enabled = enabled
+        self.frames = frames
+        self.origin = time.perf_counter()
+        self.names = []  # Section names, events refer to them by index
+        self.name_indices = {}
+        self.sections = {}  # {name: reusable _Section}
+        self.stack = []  # [(name index, start time), ...] of the open sections
+        self.event_names = RingBuffer(events, np.int32)
+        self.event_starts = RingBuffer(events)
+        self.event_durations = RingBuffer(events)
+        self.frame_totals = {}  # {name: seconds in the current frame}
+        self.history = {}  # {name: RingBuffer of seconds per frame}
+        self.counters = {}  # {name: (function returning the total, total at the last frame)}
+        self.counter_history = {}  # {name: RingBuffer of increments per frame}
+        self.counter_events = []  # [(time, {name: increment}), ...] for the trace, at most frames long
+
+    def section(self, name):
+        """
+        :return: context manager timing the section name, e.g. with profiler.section('draw'): ...
+        """
+        if not self.enabled:
+            return _null_section
+        section = self.sections.get(name)
+        if section is None:
+            section = _Section(self, name)
+            self.sections[name] = section
+        return section
+
+    def begin(self, name):
+        if not self.enabled:
+            return
+        index = self.name_indices.get(name)
+        if index is None:
+            index = len(self.names)
+            self.names.append(name)
+            self.name_indices[name] = index
+        self.stack.append((index, time.perf_counter()))
+
+    def end(self):
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        index, start = self.stack.pop()
+        self.event_names.append(index)
+        self.event_starts.append(start - self.origin)
+        self.event_durations.append(end - start)
+        name = self.names[index]
+        self.frame_totals[name] = self.frame_totals.get(name, 0.0) + end - start
+
+    def add_counter(self, name, total):
+        """
+        :param name: counter name
+        :param total: function returning the running total, its increase is recorded every frame
+        """
+        self.counters[name] = (total, total())
+
+    def begin_frame(self):
+        self.begin('frame')
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.end()
+        for name in self.history.keys() | self.frame_totals.keys():
+            if name not in self.history:
+                self.history[name] = RingBuffer(self.frames)
+            self.history[name].append(self.frame_totals.get(name, 0.0))
+        self.frame_totals.clear()
+
+        increments = {}
+        for name, (total, last) in self.counters.items():
+            value = total()
+            increments[name] = value - last
+            self.counters[name] = (total, value)
+            if name not in self.counter_history:
+                self.counter_history[name] = RingBuffer(self.frames)
+            self.counter_history[name].append(value - last)
+        self.counter_events.append((time.perf_counter() - self.origin, increments))
+        if len(self.counter_events) > 2 * self.frames:
+            del self.counter_events[:self.frames]
+
+    def statistics(self):
+        """
+        :return: {name: (mean, max)} seconds per frame of the sections, over the buffered frames
+        """
+        return {name: (float(values.mean()), float(values.max()))
+                for name, values in ((name, buffer.values()) for name, buffer in self.history.items())
+                if len(values)}
+
+    def overlay_lines(self, count=12):
+        """
+        :param count: sections listed, the slowest by their worst frame
+        :return: lines of text summarising the buffered frames
+        """
+        statistics = self.statistics()
+        if 'frame' not in statistics:
+            return ['Profiler: no frames yet']
+        mean, worst = statistics.pop('frame')
+        lines = [f'{"frame":<32}{mean * 1000:>7.2f}{worst * 1000:>8.2f} ms']
+        for name, (mean, worst) in sorted(statistics.items(), key=lambda item: -item[1][1])[:count]:
+            lines.append(f'{name[:32]:<32}{mean * 1000:>7.2f}{worst * 1000:>8.2f}')
+        for name, buffer in self.counter_history.items():
+            values = buffer.values()
+            lines.append(f'{name[:32]:<32}{values.mean():>7.0f}{values.max():>8.0f} /frame')
+        return lines
+
+    def export_trace(self, file):
+        """
+        Writes the buffered events in the Chrome trace event format, which chrome://tracing, Perfetto and
+        speedscope open directly.
+        :param file: path of the JSON file
+        """
+        events = [{'name': self.names[index], 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': 0, 'tid': 0}
+                  for index, start, duration in zip(self.event_names.values().tolist(),
+                                                    self.event_starts.values().tolist(),
+                                                    self.event_durations.values().tolist())]
+        first = events[0]['ts'] if events else 0.0
+        events += [{'name': name, 'ph': 'C', 'ts': timestamp * 1e6, 'pid': 0, 'args': {'value': value}}
+                   for timestamp, increments in self.counter_events if timestamp * 1e6 >= first
+                   for name, value in increments.items()]
+        os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+        with open(file, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
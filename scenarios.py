@@ -0,0 +1,151 @@
+import hashlib
+import json
+import math
+import os
+
+from meshes import save_cache
+
+SCENARIO_FILES = {'old': 'data_manual.xlsx', 'new': 'data_auto.xlsx'}
+CACHE_DIR = 'cache/scenarios'
+DEPENDENCY_COLUMNS = 6  # Columns after the name and duration holding the names of the dependencies
+VERSION = 1  # Bump when the compiled format changes
+
+# Scenarios loaded in this process, shared (read-only) by every Scheduler using them
+_scenarios = {}
+
+
+def load_scenario(sim_type: str):
+    """
+    Loads the operations of a turnaround type, parsing its xlsx only when it changed since it was last compiled.
+    :param sim_type: 'old' or 'new'
+    :return: {'names': [...], 'durations': [minutes, ...], 'delays': [minutes, ...],
+              'dependencies': [[index, ...], ...], 'locations': [((x, y), ...), ...], 'graph': DependencyGraph},
+             one entry per operation in file order, dependencies always come first
+    """
+    xlsx_path = SCENARIO_FILES.get(sim_type.lower())
+    if xlsx_path is None:
+        raise ValueError('Type must be either "old" or "new"')
+    scenario = _scenarios.get(xlsx_path)
+    if scenario is not None:
+        return scenario
+
+    with open(xlsx_path, 'rb') as file:
+        digest = hashlib.sha1(file.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(xlsx_path))[0]
+    cache_path = os.path.join(CACHE_DIR, f'{name}_{digest}.json')
+
+    try:
+        with open(cache_path) as file:
+            scenario = json.load(file)
+        if scenario.get('version') != VERSION:
+            scenario = None
+    except (OSError, ValueError):
+        scenario = None
+
+    if scenario is None:
+        scenario = parse_scenario(xlsx_path)
+        save_cache(cache_path, os.path.join(CACHE_DIR, f'{name}_{"[0-9a-f]" * 16}.json'),
+                   lambda file: file.write(json.dumps(scenario).encode()))
+
+    scenario['locations'] = [tuple(tuple(location) for location in locations) for locations in scenario['locations']]
+    scenario['graph'] = DependencyGraph(scenario['names'], scenario['dependencies'])
+    _scenarios[xlsx_path] = scenario
+    return scenario
+
+
+class DependencyGraph:
+    """
+    Operation names and dependencies of a scenario, built once per process and shared read-only by every Scheduler
+    of it. The dependencies of operation i are dependency_indices[dependency_offsets[i]:dependency_offsets[i + 1]]
+    (compressed sparse rows), likewise for the dependents.
+    """
+    __slots__ = ('indices', 'dependency_counts', 'dependency_offsets', 'dependency_indices', 'dependent_offsets',
+                 'dependent_indices')
+
+    def __init__(self, names, dependencies):
+        """
+        :param names: operation names, in order
+        :param dependencies: per operation, [index, ...] of the operations it depends on
+        """
+        self.indices = {name: index for index, name in enumerate(names)}
+        dependents = [[] for _ in dependencies]
+        for index, indices in enumerate(dependencies):
+            for dependency in indices:
+                dependents[dependency].append(index)
+        self.dependency_counts = tuple(len(indices) for indices in dependencies)
+        self.dependency_offsets, self.dependency_indices = compress(dependencies)
+        self.dependent_offsets, self.dependent_indices = compress(dependents)
+
+    def dependencies(self, index):
+        offsets = self.dependency_offsets
+        return self.dependency_indices[offsets[index]:offsets[index + 1]]
+
+    def dependents(self, index):
+        offsets = self.dependent_offsets
+        return self.dependent_indices[offsets[index]:offsets[index + 1]]
+
+
+def compress(rows):
+    """
+    :return: (offsets, indices) tuples of the rows in compressed sparse row form
+    """
+    offsets, indices = [0], []
+    for row in rows:
+        indices.extend(row)
+        offsets.append(len(indices))
+    return tuple(offsets), tuple(indices)
+
+
+def parse_scenario(xlsx_path: str):
+    """
+    Reads and validates a scenario xlsx, one operation per row: name, duration in minutes, DEPENDENCY_COLUMNS names of
+    dependencies, two (x, y) locations and the delay in minutes. Empty cells are missing dependencies or locations.
+    :return: scenario as returned by load_scenario
+    """
+    import pandas as pd
+
+    rows = pd.read_excel(xlsx_path).to_numpy(dtype=object)
+    location_column = DEPENDENCY_COLUMNS + 2
+    delay_column = location_column + 4
+    if rows.shape[1] <= delay_column:
+        raise ValueError(f'{xlsx_path}: expected at least {delay_column + 1} columns, found {rows.shape[1]}')
+
+    def present(value):
+        return not (value is None or isinstance(value, float) and math.isnan(value))
+
+    indices = {}
+    scenario = {'version': VERSION, 'names': [], 'durations': [], 'delays': [], 'dependencies': [], 'locations': []}
+    for row_number, row in enumerate(rows, start=2):
+        name = row[0]
+        if not present(name) or not isinstance(name, str):
+            raise ValueError(f'{xlsx_path} row {row_number}: missing operation name')
+        if name in indices:
+            raise ValueError(f'{xlsx_path} row {row_number}: duplicate operation {name}')
+        try:
+            duration = float(row[1])
+            delay = round(float(row[delay_column]))
+        except (TypeError, ValueError):
+            raise ValueError(f'{xlsx_path} row {row_number}: duration and delay of {name} must be numbers') from None
+        if math.isnan(duration):
+            raise ValueError(f'{xlsx_path} row {row_number}: missing duration of {name}')
+
+        dependencies = []
+        for dependency in row[2:location_column]:
+            if present(dependency):
+                if dependency not in indices:
+                    raise ValueError(f'{xlsx_path} row {row_number}: {name} depends on {dependency}, '
+                                     f'which is not listed before it')
+                dependencies.append(indices[dependency])
+
+        locations = []
+        for column in range(location_column, delay_column, 2):
+            if present(row[column]) and present(row[column + 1]):
+                locations.append([float(row[column]), float(row[column + 1])])
+
+        indices[name] = len(scenario['names'])
+        scenario['names'].append(name)
+        scenario['durations'].append(duration)
+        scenario['delays'].append(delay)
+        scenario['dependencies'].append(dependencies)
+        scenario['locations'].append(locations)
+    return scenario
@@ -0,0 +1,71 @@
+import math
+from collections import defaultdict
+
+
+class SpatialGrid:
+    """
+    Uniform grid over vehicles and their trailers, so proximity checks only visit nearby cells instead of every
+    vehicle. Vehicles are re-binned after they move, so queries always see their current locations.
+    """
+    def __init__(self, cell_size=400):
+        """
+        :param cell_size: cell width in pixels, queries are cheapest when it matches the query radius
+        """
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)  # {(column, row): [(vehicle or trailer, vehicle), ...]}
+        self.item_cells = {}  # {id(vehicle or trailer): (column, row)}
+
+    def __contains__(self, vehicle):
+        return id(vehicle) in self.item_cells
+
+    def cell(self, location):
+        return math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size)
+
+    def clear(self):
+        self.cells.clear()
+        self.item_cells.clear()
+
+    def update(self, vehicle):
+        """
+        Adds a vehicle and its trailers, or moves them to the cells of their current locations.
+        """
+        for item in [vehicle] + vehicle.trailers:
+            cell = self.cell(item.location)
+            old_cell = self.item_cells.get(id(item))
+            if cell != old_cell:
+                if old_cell is not None:
+                    self.discard(item, old_cell)
+                self.cells[cell].append((item, vehicle))
+                self.item_cells[id(item)] = cell
+
+    def remove(self, vehicle):
+        """
+        Removes a vehicle and its trailers, if they are in the grid.
+        """
+        for item in [vehicle] + vehicle.trailers:
+            cell = self.item_cells.pop(id(item), None)
+            if cell is not None:
+                self.discard(item, cell)
+
+    def discard(self, item, cell):
+        entries = self.cells[cell]
+        entries.pop(next(i for i, entry in enumerate(entries) if entry[0] is item))
+        if not entries:
+            del self.cells[cell]
+
+    def query(self, location, radius):
+        """
+        :param location: (x, y)
+        :param radius: search radius in pixels
+        :return: [(vehicle or trailer, vehicle it belongs to), ...] for all items in cells within radius of location,
+                 callers still have to check the exact distance
+        """
+        column_min, row_min = self.cell((location[0] - radius, location[1] - radius))
+        column_max, row_max = self.cell((location[0] + radius, location[1] + radius))
+        found = []
+        for column in range(column_min, column_max + 1):
+            for row in range(row_min, row_max + 1):
+                entries = self.cells.get((column, row))
+                if entries:
+                    found.extend(entries)
+        return found
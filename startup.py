@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Code timed in a fresh interpreter per run, so nothing is already imported or loaded. Prints the seconds from before
+# the import to after it, to after the setup and to after the first step or frame.
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+{setup}
+ready = time.perf_counter()
+{first}
+done = time.perf_counter()
+print(json.dumps([imported - start, ready - start, done - start]))
+'''
+MODES = {
+    'scheduler': ("scheduler = main.Scheduler('New')", "scheduler.timeline()"),
+    'headless': ("simulation = main.Simulation(headless=True, new_sim=True)", "simulation.step(0.1)"),
+    'frame': ("simulation = main.Simulation(new_sim=True)", "simulation.draw()"),
+}
+
+
+def measure(mode: str, env=None):
+    """
+    :param mode: key of MODES, what is timed after importing main
+    :param env: environment of the interpreter, e.g. with SDL_VIDEODRIVER=dummy
+    :return: seconds from before importing main to (imported, set up, first step or frame done)
+    """
+    setup, first = MODES[mode]
+    output = subprocess.run([sys.executable, '-c', CHILD.format(setup=setup, first=first)], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time from importing main to the first scheduler timeline, headless '
+                                                 'step and drawn frame, each in a fresh interpreter')
+    parser.add_argument('--mode', action='append', choices=list(MODES),
+                        help='what to time after the import (repeatable), default all of them')
+    parser.add_argument('--runs', type=int, default=5, help='interpreters started per mode, the median is reported')
+    parser.add_argument('--dummy-display', action='store_true',
+                        help='draw the frames without a window (SDL_VIDEODRIVER=dummy)')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')
+    if args.dummy_display:
+        env['SDL_VIDEODRIVER'] = 'dummy'
+    # The caches are filled by a first run, the timed runs measure a warm start
+    start = time.perf_counter()
+    for mode in args.mode or list(MODES):
+        measure(mode, env)
+    print(f'Caches warmed in {time.perf_counter() - start:.2f}s\n')
+
+    # Milliseconds since the import started, e.g. the last column of frame is import to first frame
+    print(f'{"Mode":<10}{"Imported [ms]":>15}{"Set up [ms]":>13}{"First [ms]":>12}')
+    for mode in args.mode or list(MODES):
+        times = np.median([measure(mode, env) for _ in range(args.runs)], axis=0) * 1000
+        print(f'{mode:<10}{times[0]:>15.1f}{times[1]:>13.1f}{times[2]:>12.1f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from meshes import load_mesh
+from pathfinding import SERVICE_ROAD_ENDS, SERVICE_ROAD_ENTRANCE, distance_field, to_grid
+
+CACHE_DIR = 'cache/travel'
+SERVICE_ROAD_GRID = SERVICE_ROAD_ENDS[SERVICE_ROAD_ENTRANCE]  # Last point on the stand mesh before the service road
+NEIGHBORS = [(0, 1), (0, -1), (1, 0), (-1, 0)]  # Same steps as astar, (dy, dx)
+
+# Travel tables loaded in this process
+_tables = {}
+
+
+def load_table(mesh_name: str):
+    """
+    :param mesh_name: mesh file name without extension, e.g. 'Mesh_4'
+    :return: the TravelTable of the mesh, loaded from the cache when it was precomputed for the current mesh
+    """
+    table = _tables.get(mesh_name)
+    if table is None:
+        table = TravelTable(mesh_name)
+        table.load()
+        _tables[mesh_name] = table
+    return table
+
+
+def next_hops(distances: np.ndarray):
+    """
+    :param distances: distance field, see distance_field
+    :return: np.array of int8, for every reachable cell the index in NEIGHBORS of a step that brings it one closer to
+             the source, -1 at the source and unreachable cells
+    """
+    hops = np.full(distances.shape, -1, dtype=np.int8)
+    height, width = distances.shape
+    for direction, (dy, dx) in reversed(list(enumerate(NEIGHBORS))):
+        # Distance of the neighbour in this direction, -2 (never d - 1) outside the mesh
+        neighbor = np.full(distances.shape, -2, dtype=distances.dtype)
+        neighbor[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)] = \
+            distances[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+        hops[(distances > 0) & (neighbor == distances - 1)] = direction
+    return hops
+
+
+class TravelTable:
+    """
+    Distance and next hop fields towards the service points of one mesh. Travel distances to a service point are a
+    single lookup, and paths to it follow the next hops without any search.
+    """
+    def __init__(self, mesh_name: str):
+        self.mesh_name = mesh_name
+        self.mesh = load_mesh(mesh_name)
+        self.points = {}  # {(x, y) service point: index into the fields}
+        self.distances = []  # int32 distance fields, see distance_field
+        self.hops = []  # int8 next hop fields, see next_hops
+        self.changed = False
+
+    @property
+    def file(self):
+        digest = hashlib.sha1(np.ascontiguousarray(self.mesh).tobytes()).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, f'{self.mesh_name}_{digest}.npz')
+
+    def add(self, point):
+        """
+        Computes the fields of a service point, if it has none yet.
+        :param point: (x, y) pixel coordinates on the stand
+        :return: index of the point's fields
+        """
+        index = self.points.get(point)
+        if index is None:
+            distances = distance_field(self.mesh, [to_grid(point)])
+            index = len(self.distances)
+            self.points[point] = index
+            self.distances.append(distances)
+            self.hops.append(next_hops(distances))
+            self.changed = True
+        return index
+
+    def steps(self, start, goal):
+        """
+        :param start: (x, y) pixel coordinates
+        :param goal: (x, y) service point, its fields are computed first if it is not in the table
+        :return: mesh steps of the shortest path, -1 if the goal cannot be reached
+        """
+        return int(self.distances[self.add(goal)][to_grid(start)])
+
+    def path(self, start, goal):
+        """
+        :param start: (x, y) pixel coordinates
+        :param goal: (x, y) service point
+        :return: path, [(y, x), ...] from start to goal like astar, [goal cell] if the goal cannot be reached
+        """
+        index = self.add(goal)
+        distances, hops = self.distances[index], self.hops[index]
+        y, x = to_grid(start)
+        if distances[y, x] < 0:
+            return [to_grid(goal)]
+        path = [(y, x)]
+        for _ in range(distances[y, x]):
+            dy, dx = NEIGHBORS[hops[y, x]]
+            y, x = y + dy, x + dx
+            path.append((y, x))
+        return path
+
+    def load(self):
+        try:
+            with np.load(self.file) as data:
+                points, distances, hops = data['points'], data['distances'], data['hops']
+        except (OSError, KeyError, ValueError):
+            return
+        self.points = {(int(x), int(y)): index for index, (x, y) in enumerate(points)}
+        self.distances = list(distances.astype(np.int32))
+        self.hops = list(hops)
+        self.changed = False
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        points = np.array(list(self.points), dtype=np.int32).reshape(-1, 2)
+        # Distances fit in int16 on stand sized meshes, the file is compressed on top
+        temp_file = f'{self.file}.{os.getpid()}.tmp.npz'
+        np.savez_compressed(temp_file, points=points, distances=np.array(self.distances, dtype=np.int16),
+                            hops=np.array(self.hops, dtype=np.int8))
+        os.replace(temp_file, self.file)
+        self.changed = False
+
+
+def service_points():
+    """
+    :return: {mesh name: set of (x, y)}, every start and goal location of the vehicles of both turnaround types,
+             with the service road replaced by SERVICE_ROAD_GRID
+    """
+    from main import Simulation
+
+    points = {}
+    for new_sim in [False, True]:
+        for vehicle in Simulation(headless=True, new_sim=new_sim).vehicles:
+            for location in [tuple(vehicle.location)] + list(vehicle.goal_locs):
+                if location in SERVICE_ROAD_ENDS:
+                    location = SERVICE_ROAD_GRID
+                points.setdefault(vehicle.mesh_name, set()).add((int(location[0]), int(location[1])))
+    return points
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the travel tables between the apron service points')
+    parser.parse_args()
+
+    for mesh_name, points in sorted(service_points().items()):
+        start = time.perf_counter()
+        table = load_table(mesh_name)
+        for point in sorted(points):
+            table.add(point)
+        table.save()
+        print(f'{mesh_name}: {len(table.points)} service points in {time.perf_counter() - start:.2f}s, '
+              f'{os.path.getsize(table.file) / 1024:.0f} kB in {table.file}')
+
+
+if __name__ == "__main__":
+    main()